@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Document Artifacts
+Several outputs of one document (PDF, page images, text) from a single engine load
+"""
+
+import os
+import re
+import subprocess
+
+import governor
+from lo_pool import ConversionError, ConversionTimeout, ResourceLimitExceeded
+from text_extract import open_document
+
+OUTPUT_PATTERN = re.compile(r'^(?:pdf|text|(png|webp):page([1-9]\d{0,3}))$')
+
+
+class Output:
+    """One requested artifact: `pdf`, `text` or `<png|webp>:page<n>`"""
+
+    def __init__(self, name):
+        match = OUTPUT_PATTERN.match(name)
+        if not match:
+            raise ValueError(f'Unknown output {name!r}; expected pdf, text, png:page<n> or webp:page<n>')
+        self.name = name
+        self.kind = 'image' if match.group(1) else name
+        self.format = match.group(1)
+        self.page = int(match.group(2)) if match.group(2) else None
+
+
+def parse_outputs(spec, image_formats, max_outputs):
+    """Parse `pdf,png:page1,text` into Outputs, keeping the order and dropping repeats
+
+    Raises ValueError with a message for the client.
+    """
+    outputs = []
+    for name in (part.strip().lower() for part in spec.split(',')):
+        if not name or any(output.name == name for output in outputs):
+            continue
+        output = Output(name)
+        if output.kind == 'image' and output.format not in image_formats:
+            raise ValueError(f'Image format must be one of {image_formats}')
+        outputs.append(output)
+    if not outputs:
+        raise ValueError('No outputs requested')
+    if len(outputs) > max_outputs:
+        raise ValueError(f'At most {max_outputs} outputs per request')
+    return outputs
+
+
+def pdf_text(pdf_path, out_dir, timeout=30, limits=None):
+    """Text of every page of pdf_path, as written by pdftotext; return the .txt path"""
+    text_path = os.path.join(out_dir, 'text.txt')
+    try:
+        result, killed = governor.run(['pdftotext', '-enc', 'UTF-8', pdf_path, text_path], timeout, limits)
+    except subprocess.TimeoutExpired:
+        raise ConversionTimeout('Text extraction timeout')
+    if killed:
+        raise ResourceLimitExceeded(killed, result.stderr)
+    if result.returncode != 0 or not os.path.exists(text_path):
+        raise ConversionError('Text extraction failed', result.stderr)
+    return text_path
+
+
+def document_text(path, max_chars=None):
+    """Paragraph text of an HWP/HWPX file read straight from the document, one per line
+
+    Stops once max_chars is reached. Raises text_extract.UnsupportedDocument.
+    """
+    parts = []
+    length = 0
+    document = open_document(path)
+    try:
+        for _, text in document.paragraphs():
+            parts.append(text)
+            length += len(text) + 1
+            if max_chars and length >= max_chars:
+                break
+    finally:
+        document.close()
+    text = '\n'.join(parts)
+    return text[:max_chars] if max_chars else text
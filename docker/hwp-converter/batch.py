@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Batch Conversion Helpers
+Read zip archives of documents and stream zip archives of results
+"""
+
+import os
+import zipfile
+
+
+class ZipStream:
+    """Write-only sink for zipfile that hands out what was written so far
+
+    zipfile falls back to data descriptors on unseekable output, so each
+    member can be yielded to the client as soon as it is written.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_archive(path, max_files, max_bytes):
+    """Yield (name, uncompressed size, stream) for each file in a zip archive
+
+    Raises ValueError if the archive holds more than max_files files or
+    more than max_bytes uncompressed; member reads are capped at their
+    declared size, so the check holds for hostile archives too.
+    """
+    with zipfile.ZipFile(path) as archive:
+        members = [info for info in archive.infolist() if not info.is_dir()]
+        if len(members) > max_files:
+            raise ValueError(f'Archive has more than {max_files} files')
+        if sum(info.file_size for info in members) > max_bytes:
+            raise ValueError(f'Archive expands to more than {max_bytes} bytes')
+
+        for info in members:
+            with archive.open(info) as stream:
+                yield os.path.basename(info.filename), info.file_size, stream
+
+
+def unique_name(name, used):
+    """Return name, or name with a counter, so no two zip members collide"""
+    stem, ext = os.path.splitext(name)
+    candidate = name
+    counter = 1
+    while candidate in used:
+        candidate = f'{stem} ({counter}){ext}'
+        counter += 1
+    used.add(candidate)
+    return candidate
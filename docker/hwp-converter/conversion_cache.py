@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Conversion Cache
+Content-addressed on-disk store of converted outputs with LRU eviction
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def save_stream(stream, path):
+    """Copy a readable stream to path and return the SHA-256 of its bytes"""
+    digest = hashlib.sha256()
+    with open(path, 'wb') as out:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(content_hash, target, version, options=''):
+    """Key for one output of one input under one converter version"""
+    return hashlib.sha256(f'{content_hash}:{target}:{version}:{options}'.encode()).hexdigest()
+
+
+class ConversionCache:
+    """Byte-capped LRU cache of files under root, safe to share between threads
+
+    Entries are sharded as root/<k[:2]>/<key><suffix>. Access order is kept in
+    memory and mirrored into file mtimes, so it survives restarts.
+    """
+
+    def __init__(self, root, max_bytes, suffix='.pdf'):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> size, oldest first
+        self._total = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key + self.suffix)
+
+    def _load(self):
+        found = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if not name.endswith(self.suffix):
+                    # Leftover temp file from an interrupted write
+                    os.unlink(path)
+                    continue
+                stat = os.stat(path)
+                found.append((stat.st_mtime, name[:-len(self.suffix)], stat.st_size))
+
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total += size
+        self._evict()
+        logger.info('Conversion cache: %d entries, %d bytes', len(self._entries), self._total)
+
+    def get(self, key):
+        """Return the cached file path for key, or None"""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            path = self._path(key)
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                self._total -= self._entries.pop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return path
+
+    def put(self, key, src_path):
+        """Copy src_path into the cache atomically and return the cached path"""
+        size = os.path.getsize(src_path)
+        if size > self.max_bytes:
+            return src_path
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as out, open(src_path, 'rb') as src:
+                shutil.copyfileobj(src, out, CHUNK_SIZE)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        with self._lock:
+            if key in self._entries:
+                self._total -= self._entries.pop(key)
+            self._entries[key] = size
+            self._total += size
+            self._evict()
+        return path
+
+    def _evict(self):
+        while self._total > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total -= size
+            try:
+                os.unlink(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Conversion Engines
+Per-format fallback chains over soffice, hwp5odt and the HWPX Java converter
+"""
+
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+import governor
+import profiling
+from lo_pool import ConversionError, ConversionTimeout, ResourceLimitExceeded
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHAINS = 'hwp=soffice,hwp5odt;hwpx=java,soffice;*=soffice'
+
+
+class Engine:
+    """One way of turning a document into a PDF"""
+
+    name = None
+    formats = None  # None = every format
+    page_ranges = True  # honours PageRange in filter_data
+
+    def available(self):
+        return True
+
+    def supports(self, fmt, filter_data):
+        if self.formats is not None and fmt not in self.formats:
+            return False
+        return self.page_ranges or not filter_data.get('PageRange')
+
+    def convert(self, input_path, out_dir, timeout, filter_data, prepare=None):
+        """Return the path of the PDF written under out_dir
+
+        prepare is a LibreOfficePool.convert hook; engines that never load
+        the document in LibreOffice ignore it.
+        """
+        raise NotImplementedError
+
+
+class SofficeEngine(Engine):
+    """LibreOffice + H2Orestart, on a warm worker when the pool is enabled
+
+    With a splitter, large inputs it applies to are exported in chunks on
+    several workers; if that fails for any reason but a timeout, the
+    document is converted whole.
+    """
+
+    name = 'soffice'
+
+    def __init__(self, pool, splitter=None):
+        self.pool = pool
+        self.splitter = splitter
+
+    @property
+    def page_ranges(self):
+        return self.pool.page_ranges
+
+    def convert(self, input_path, out_dir, timeout, filter_data, prepare=None):
+        if self.splitter is not None and self.splitter.applies(input_path, filter_data, prepare):
+            started = time.monotonic()
+            try:
+                return self.splitter.convert(input_path, out_dir, timeout, filter_data)
+            except ConversionTimeout:
+                raise
+            except ConversionError as e:
+                logger.warning('Split conversion of %s failed, converting it whole: %s %s',
+                               os.path.basename(input_path), e, e.details)
+                timeout = max(timeout - (time.monotonic() - started), 1)
+        return self.pool.convert(input_path, out_dir, timeout, filter_data, prepare)
+
+
+class Hwp5OdtEngine(Engine):
+    """pyhwp's hwp5odt to ODT, then LibreOffice to PDF"""
+
+    name = 'hwp5odt'
+    formats = {'hwp'}
+
+    def __init__(self, pool, limits=None):
+        self.pool = pool
+        self.limits = limits
+
+    @property
+    def page_ranges(self):
+        return self.pool.page_ranges
+
+    def available(self):
+        return shutil.which('hwp5odt') is not None
+
+    def convert(self, input_path, out_dir, timeout, filter_data, prepare=None):
+        odt_dir = os.path.join(out_dir, 'hwp5odt')
+        os.makedirs(odt_dir, exist_ok=True)
+        odt_path = os.path.join(odt_dir, os.path.splitext(os.path.basename(input_path))[0] + '.odt')
+
+        started = time.monotonic()
+        try:
+            with profiling.phase('hwp5odt'):
+                result, killed = governor.run(['hwp5odt', input_path, '--output', odt_path], timeout, self.limits)
+        except subprocess.TimeoutExpired:
+            raise ConversionTimeout('Conversion timeout')
+        if killed:
+            raise ResourceLimitExceeded(killed, result.stderr)
+        if result.returncode != 0 or not os.path.exists(odt_path):
+            raise ConversionError('hwp5odt failed', result.stderr)
+
+        remaining = max(timeout - (time.monotonic() - started), 1)
+        return self.pool.convert(odt_path, out_dir, remaining, filter_data)
+
+
+class JavaHwpxEngine(Engine):
+    """tools/hwpx-converter jar, one JVM per file; memory is capped with -Xmx rather than RLIMIT_AS"""
+
+    name = 'java'
+    formats = {'hwpx'}
+    page_ranges = False
+
+    def __init__(self, jar_path, limits=None, max_heap_mb=0):
+        self.jar_path = jar_path
+        self.limits = limits
+        self.max_heap_mb = max_heap_mb
+
+    def available(self):
+        return os.path.exists(self.jar_path) and shutil.which('java') is not None
+
+    def convert(self, input_path, out_dir, timeout, filter_data, prepare=None):
+        pdf_path = os.path.join(out_dir, os.path.splitext(os.path.basename(input_path))[0] + '.pdf')
+        heap = [f'-Xmx{self.max_heap_mb}m'] if self.max_heap_mb else []
+        try:
+            with profiling.phase('java'):
+                result, killed = governor.run(
+                    ['java', *heap, '-jar', self.jar_path, input_path, pdf_path],
+                    timeout,
+                    self.limits,
+                    address_space=False,
+                    env=dict(os.environ, HOME=out_dir)
+                )
+        except subprocess.TimeoutExpired:
+            raise ConversionTimeout('Conversion timeout')
+        if killed:
+            raise ResourceLimitExceeded(killed, result.stderr)
+        if result.returncode != 0:
+            raise ConversionError('HWPX conversion failed', result.stderr)
+        return pdf_path
+
+
+def parse_chains(spec):
+    """'hwp=soffice,hwp5odt;*=soffice' -> {'hwp': ['soffice', 'hwp5odt'], '*': ['soffice']}"""
+    chains = {}
+    for part in spec.split(';'):
+        if not part.strip():
+            continue
+        formats, _, names = part.partition('=')
+        engines = [name.strip() for name in names.split(',') if name.strip()]
+        if not engines:
+            raise ValueError(f'Empty engine chain in {part!r}')
+        for fmt in formats.split(','):
+            chains[fmt.strip().lower()] = engines
+    return chains
+
+
+class _EngineStats:
+    def __init__(self):
+        self.attempts = 0
+        self.successes = 0
+        self.latency = None  # EWMA of successful conversions, seconds
+
+    def record(self, ok, seconds, alpha):
+        self.attempts += 1
+        if ok:
+            self.successes += 1
+            self.latency = seconds if self.latency is None else (1 - alpha) * self.latency + alpha * seconds
+
+    @property
+    def success_rate(self):
+        return self.successes / self.attempts if self.attempts else None
+
+    def to_dict(self):
+        return {
+            'attempts': self.attempts,
+            'successes': self.successes,
+            'success_rate': round(self.success_rate, 3) if self.attempts else None,
+            'latency': round(self.latency, 3) if self.latency is not None else None,
+        }
+
+
+def _attempt(attempt, engine):
+    """attempt(engine), with a missing binary, full disk or stray subprocess error as ConversionError"""
+    try:
+        return attempt(engine)
+    except subprocess.TimeoutExpired as e:
+        raise ConversionTimeout('Conversion timeout', str(e)) from e
+    except (OSError, subprocess.SubprocessError) as e:
+        raise ConversionError('Conversion failed', f'{engine.name}: {e}') from e
+
+
+class EngineRouter:
+    """Pick engines per format from ordered chains, learning which one to try first
+
+    Every format starts on its configured chain order. Once an engine has
+    min_samples attempts for a format, engines whose success rate is at least
+    min_success_rate are tried first, fastest first; the rest follow in chain
+    order. Every explore_every-th request puts the least-tried engine first so
+    engines behind a reliable leader keep getting measured.
+    """
+
+    def __init__(self, engines, chains, min_samples=5, min_success_rate=0.9, explore_every=20, alpha=0.2,
+                 on_fallback=None):
+        self.engines = {engine.name: engine for engine in engines}
+        self.chains = chains
+        self.min_samples = min_samples
+        self.min_success_rate = min_success_rate
+        self.explore_every = explore_every
+        self.alpha = alpha
+        self.on_fallback = on_fallback  # called with (format, failed engine name)
+        self.fallbacks = 0
+        self._stats = {}  # (format, engine) -> _EngineStats
+        self._requests = {}  # format -> count
+        self._lock = threading.Lock()
+
+        for names in chains.values():
+            unknown = [name for name in names if name not in self.engines]
+            if unknown:
+                raise ValueError(f'Unknown conversion engines: {unknown}')
+        for engine in engines:
+            if not engine.available():
+                logger.warning('Conversion engine %s is not available and will be skipped', engine.name)
+
+    def chain(self, fmt, filter_data=None):
+        """Engines for fmt in configured order, minus unavailable or unsuitable ones"""
+        names = self.chains.get(fmt, self.chains.get('*', []))
+        return [self.engines[name] for name in names
+                if self.engines[name].available() and self.engines[name].supports(fmt, filter_data or {})]
+
+    def order(self, fmt, filter_data=None, count=True):
+        """Engines to try for fmt, best first; count=False leaves exploration alone"""
+        chain = self.chain(fmt, filter_data)
+        with self._lock:
+            stats = [self._stats.get((fmt, engine.name)) for engine in chain]
+            requests = self._requests.get(fmt, 0)
+            if count:
+                requests = self._requests[fmt] = requests + 1
+
+        if count and len(chain) > 1 and self.explore_every and requests % self.explore_every == 0:
+            least_tried = min(range(len(chain)), key=lambda i: stats[i].attempts if stats[i] else 0)
+            return [chain[least_tried]] + chain[:least_tried] + chain[least_tried + 1:]
+
+        def measured_fast(i):
+            s = stats[i]
+            return (s is not None and s.attempts >= self.min_samples
+                    and s.success_rate >= self.min_success_rate and s.latency is not None)
+
+        preferred = sorted((i for i in range(len(chain)) if measured_fast(i)), key=lambda i: stats[i].latency)
+        rest = [i for i in range(len(chain)) if i not in preferred]
+        return [chain[i] for i in preferred + rest]
+
+    def preferred(self, fmt):
+        """Name of the engine most likely to run fmt, for labelling"""
+        engines = self.order(fmt, count=False)
+        return engines[0].name if engines else 'none'
+
+    def record(self, fmt, engine, ok, seconds):
+        with self._lock:
+            stats = self._stats.setdefault((fmt, engine), _EngineStats())
+            stats.record(ok, seconds, self.alpha)
+
+    def convert(self, fmt, attempt, filter_data=None):
+        """Call attempt(engine) down the chain until one returns a PDF path
+
+        Any ConversionError (timeouts included), OSError or subprocess error
+        moves on to the next engine; the last error is raised, as a
+        ConversionError, when every engine fails. Returns (pdf_path,
+        engine_name).
+        """
+        engines = self.order(fmt, filter_data)
+        if not engines:
+            if filter_data and filter_data.get('PageRange') and self.chain(fmt):
+                raise ConversionError(f'No conversion engine for .{fmt} supports page ranges here',
+                                      'One-shot soffice needs LibreOffice 7.4+; enable the worker pool')
+            raise ConversionError(f'No conversion engine available for .{fmt}')
+
+        last_error = None
+        for i, engine in enumerate(engines):
+            started = time.monotonic()
+            try:
+                pdf_path = _attempt(attempt, engine)
+            except ConversionError as e:
+                self.record(fmt, engine.name, False, time.monotonic() - started)
+                last_error = e
+                if i + 1 < len(engines):
+                    logger.warning('Engine %s failed on .%s, falling back to %s: %s',
+                                   engine.name, fmt, engines[i + 1].name, e)
+                    with self._lock:
+                        self.fallbacks += 1
+                    if self.on_fallback:
+                        self.on_fallback(fmt, engine.name)
+                continue
+            self.record(fmt, engine.name, True, time.monotonic() - started)
+            return pdf_path, engine.name
+
+        raise last_error
+
+    def stats(self):
+        with self._lock:
+            per_format = {}
+            for (fmt, name), stats in sorted(self._stats.items()):
+                per_format.setdefault(fmt, {})[name] = stats.to_dict()
+            return {
+                'chains': self.chains,
+                'available': sorted(name for name, engine in self.engines.items() if engine.available()),
+                'fallbacks': self.fallbacks,
+                'formats': per_format,
+            }
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Resource Governance
+rlimits, CPU budgets and a no-progress/RSS watchdog for converter processes, run on one asyncio loop
+"""
+
+import asyncio
+import logging
+import os
+import resource
+import signal
+import subprocess
+import threading
+import time
+
+import profiling
+
+logger = logging.getLogger(__name__)
+
+CLK_TCK = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+# Kill reasons, as reported in metrics
+STALLED = 'stalled'
+MEMORY = 'memory'
+CPU_LIMIT = 'cpu_limit'
+
+
+class JobLimits:
+    """Limits for one conversion; 0 disables a limit
+
+    max_address_space caps virtual memory with RLIMIT_AS and max_cpu_seconds
+    CPU time with RLIMIT_CPU (SIGXCPU). The watchdog kills a process tree
+    whose CPU time has not moved for stall_seconds, or whose resident memory
+    passes max_rss.
+    """
+
+    def __init__(self, max_address_space=0, max_cpu_seconds=0, stall_seconds=0, max_rss=0):
+        self.max_address_space = max_address_space
+        self.max_cpu_seconds = max_cpu_seconds
+        self.stall_seconds = stall_seconds
+        self.max_rss = max_rss
+
+    def preexec(self, address_space=True):
+        """preexec_fn applying the rlimits in a child before exec
+
+        JVMs reserve their heap up front, so callers pass address_space=False
+        and cap the heap with -Xmx instead.
+        """
+        max_address_space = self.max_address_space if address_space else 0
+        max_cpu_seconds = self.max_cpu_seconds
+
+        def apply():
+            if max_address_space:
+                resource.setrlimit(resource.RLIMIT_AS, (max_address_space, max_address_space))
+            if max_cpu_seconds:
+                # SIGXCPU at the soft limit, SIGKILL at the hard one if that is ignored
+                resource.setrlimit(resource.RLIMIT_CPU, (max_cpu_seconds, max_cpu_seconds + 5))
+        return apply
+
+
+def _children():
+    """Map of pid -> child pids for every process on the system"""
+    children = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(name))
+    return children
+
+
+def process_tree(pid):
+    """pid and all of its descendants (soffice runs soffice.bin under a launcher)"""
+    children = _children()
+    tree = []
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, ()))
+    return tree
+
+
+def _usage(pid):
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    # utime, stime are fields 14 and 15 of stat, rss is 24; the split drops the first two
+    return (int(fields[11]) + int(fields[12])) / CLK_TCK, int(fields[21]) * PAGE_SIZE
+
+
+def tree_usage(pid):
+    """(CPU seconds, resident bytes) summed over the process tree of pid"""
+    cpu = rss = 0
+    for member in process_tree(pid):
+        try:
+            member_cpu, member_rss = _usage(member)
+        except (OSError, IndexError, ValueError):
+            continue
+        cpu += member_cpu
+        rss += member_rss
+    return cpu, rss
+
+
+def kill_tree(pid):
+    for member in reversed(process_tree(pid)):
+        try:
+            os.kill(member, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+def set_cpu_budget(pid, seconds):
+    """Let every process in the tree use `seconds` more CPU time before SIGXCPU"""
+    for member in process_tree(pid):
+        try:
+            used, _ = _usage(member)
+            _, hard = resource.prlimit(member, resource.RLIMIT_CPU)
+            soft = int(used + seconds) + 1
+            if hard != resource.RLIM_INFINITY:
+                soft = min(soft, hard)
+            resource.prlimit(member, resource.RLIMIT_CPU, (soft, hard))
+        except (OSError, IndexError, ValueError):
+            continue
+
+
+def clear_cpu_budget(pid):
+    for member in process_tree(pid):
+        try:
+            _, hard = resource.prlimit(member, resource.RLIMIT_CPU)
+            resource.prlimit(member, resource.RLIMIT_CPU, (hard, hard))
+        except OSError:
+            continue
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def supervisor_loop():
+    """Event loop, on its own thread, that owns every converter process and watchdog
+
+    Waiting on processes, draining their pipes and polling their usage all
+    happen here, so a running conversion costs no threads of its own; the
+    caller's thread only blocks on the result.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='process-supervisor', daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+class Watchdog:
+    """Kill a process tree that stops using CPU or grows past max_rss
+
+    `reason` is set to STALLED or MEMORY when the watchdog fired.
+    """
+
+    def __init__(self, pid, stall_seconds=0, max_rss=0, interval=1.0):
+        self.pid = pid
+        self.stall_seconds = stall_seconds
+        self.max_rss = max_rss
+        self.interval = interval
+        self.reason = None
+        self.peak_rss = 0
+        self._stopped = False
+        self._future = None
+
+    def start(self):
+        if self.stall_seconds or self.max_rss:
+            self._future = asyncio.run_coroutine_threadsafe(self.watch(), supervisor_loop())
+        return self
+
+    def stop(self):
+        self._stopped = True
+        if self._future is not None:
+            self._future.cancel()
+
+    async def watch(self):
+        last_cpu, _ = tree_usage(self.pid)
+        last_progress = time.monotonic()
+        while not self._stopped:
+            await asyncio.sleep(self.interval)
+            cpu, rss = tree_usage(self.pid)
+            self.peak_rss = max(self.peak_rss, rss)
+            now = time.monotonic()
+            if cpu > last_cpu:
+                last_cpu, last_progress = cpu, now
+
+            if self.max_rss and rss > self.max_rss:
+                self._fire(MEMORY, f'resident memory {rss >> 20} MB')
+                return
+            if self.stall_seconds and now - last_progress > self.stall_seconds:
+                self._fire(STALLED, f'no CPU progress for {self.stall_seconds}s')
+                return
+
+    def _fire(self, reason, detail):
+        if self._stopped:
+            return
+        self.reason = reason
+        logger.warning('Killing process tree %d: %s', self.pid, detail)
+        kill_tree(self.pid)
+
+
+async def _drain(stream, name, pid, on_output):
+    """Read a pipe line by line as the process writes it; return everything read"""
+    chunks = []
+    while True:
+        line = await stream.readline()
+        if not line:
+            return b''.join(chunks).decode('utf-8', errors='replace')
+        chunks.append(line)
+        text = line.decode('utf-8', errors='replace').rstrip()
+        if on_output is not None:
+            on_output(name, text)
+        else:
+            logger.debug('[%d %s] %s', pid, name, text)
+
+
+async def run_async(args, timeout, limits=None, address_space=True, on_output=None, **kwargs):
+    """Coroutine behind run(); must be awaited on supervisor_loop()"""
+    limits = limits or JobLimits()
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        preexec_fn=limits.preexec(address_space),
+        start_new_session=True,
+        **kwargs
+    )
+    watchdog = Watchdog(process.pid, limits.stall_seconds, limits.max_rss)
+    watching = asyncio.ensure_future(watchdog.watch()) if limits.stall_seconds or limits.max_rss else None
+    output = asyncio.gather(
+        _drain(process.stdout, 'stdout', process.pid, on_output),
+        _drain(process.stderr, 'stderr', process.pid, on_output),
+        process.wait(),
+    )
+    try:
+        stdout, stderr, returncode = await asyncio.wait_for(asyncio.shield(output), timeout)
+    except asyncio.TimeoutError:
+        kill_tree(process.pid)
+        await output
+        raise subprocess.TimeoutExpired(args, timeout)
+    finally:
+        watchdog.stop()
+        if watching is not None:
+            watching.cancel()
+
+    reason = watchdog.reason
+    if reason is None and returncode in (-signal.SIGXCPU, 128 + signal.SIGXCPU):
+        reason = CPU_LIMIT
+    return subprocess.CompletedProcess(args, returncode, stdout, stderr), reason
+
+
+def run(args, timeout, limits=None, address_space=True, on_output=None, **kwargs):
+    """subprocess.run(capture_output=True, text=True) under limits
+
+    Returns (CompletedProcess, kill_reason). kill_reason is STALLED, MEMORY
+    or CPU_LIMIT when the process was stopped for it, else None. Raises
+    subprocess.TimeoutExpired after killing the whole tree on timeout.
+    Output lines go to on_output(stream, line) as they arrive (debug log
+    by default) and are also returned in full.
+    """
+    started = time.monotonic()
+    future = asyncio.run_coroutine_threadsafe(
+        run_async(args, timeout, limits, address_space, on_output, **kwargs), supervisor_loop())
+    try:
+        result, reason = future.result()
+    except subprocess.TimeoutExpired:
+        profiling.record_process(args, 'timeout', time.monotonic() - started, '')
+        raise
+    profiling.record_process(args, result.returncode, time.monotonic() - started, result.stderr)
+    return result, reason
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Conversion Job Queue
+Bounded, cost-ordered work queue with a fixed number of worker threads and expiring job records
+"""
+
+import logging
+import math
+import threading
+import time
+import uuid
+
+from scheduler import BATCH, INTERACTIVE, CostModel, Scheduler
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class QueueFull(Exception):
+    """No room in the queue; retry_after is a hint in whole seconds"""
+
+    def __init__(self, retry_after):
+        super().__init__('Conversion queue is full')
+        self.retry_after = retry_after
+
+
+class Job:
+    def __init__(self, fn, download_name, cleanup=None, lane=BATCH, fmt=None, size=0):
+        self.id = uuid.uuid4().hex
+        self.fn = fn
+        self.download_name = download_name
+        self.cleanup = cleanup
+        self.lane = lane
+        self.format = fmt
+        self.size = size
+        self.estimate = None
+        self.costed = True  # its duration trains the cost model
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.cache_hit = False
+        self.cancelled = False  # skip it if still queued
+        self.discarded = False
+        self.key = None
+        self.followers = []  # identical jobs waiting for this one's outcome; None once it has one
+        self.leader = None
+        self.share = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.status = FAILED if error is not None else DONE
+        self.finished_at = time.time()
+        self._done.set()
+
+    def to_dict(self):
+        data = {
+            'id': self.id,
+            'status': self.status,
+            'lane': self.lane,
+            'estimated_seconds': None if self.estimate is None else round(self.estimate, 3),
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+        if self.error is not None:
+            data['error'] = str(self.error)
+        return data
+
+
+class JobQueue:
+    """Run submitted jobs on `workers` threads with at most `max_queued` waiting
+
+    Waiting jobs are started shortest-expected-first (see scheduler.Scheduler),
+    with the interactive lane ahead of batch work; expected times come from
+    the format and size of past jobs.
+
+    A job submitted with the key of one still queued or running follows it
+    instead: it takes no queue slot or worker and finishes with the
+    leader's outcome. The leader is only cancelled once it and all of its
+    followers have been discarded.
+    """
+
+    def __init__(self, workers, max_queued, ttl=3600, batch_penalty=60.0, aging=1.0):
+        self.workers = workers
+        self.ttl = ttl
+        self.costs = CostModel()
+        self._queue = Scheduler(max_queued, batch_penalty, aging)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._in_flight = {}  # key -> queued or running job
+        self._avg_duration = 5.0  # seconds, refined as jobs finish
+        self.rejected = 0
+        self.coalesced = 0
+
+    def start(self):
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True).start()
+        threading.Thread(target=self._expire_loop, name='job-janitor', daemon=True).start()
+
+    def submit(self, fn, download_name, cleanup=None, lane=BATCH, fmt=None, size=0, key=None, share=None,
+               costed=True):
+        """Queue fn for a worker; raise QueueFull if the queue is at capacity
+
+        fmt and size (input bytes) drive the job's expected cost; jobs
+        without them are estimated as an average job. costed=False keeps the
+        job's duration out of the estimates, for work that is not typical of
+        its format and size (only a few pages of it). If a job with the same
+        key is queued or running, the new one follows it and
+        share(leader_result) becomes its result (the leader's by default).
+        """
+        job = Job(fn, download_name, cleanup, lane, fmt, size)
+        job.key = key
+        job.share = share
+        job.costed = costed
+        job.estimate = self.costs.estimate(fmt, size) if fmt else self._avg_duration
+        with self._lock:
+            leader = self._in_flight.get(key) if key is not None else None
+            if leader is not None and not leader.cancelled:
+                self._follow(leader, job)
+                return job
+            if not self._queue.put_nowait(job, lane, job.estimate):
+                self.rejected += 1
+                raise QueueFull(self.retry_after())
+            self._jobs[job.id] = job
+            if key is not None:
+                self._in_flight[key] = job
+        return job
+
+    def _follow(self, leader, job):
+        job.leader = leader
+        job.status = leader.status
+        job.started_at = leader.started_at
+        leader.followers.append(job)
+        self._jobs[job.id] = job
+        self.coalesced += 1
+        # Someone is waiting on it now: move it to the interactive lane
+        if job.lane == INTERACTIVE and leader.lane == BATCH and self._queue.move(leader, INTERACTIVE):
+            leader.lane = INTERACTIVE
+
+    def add_finished(self, result, download_name, cleanup=None, cache_hit=False):
+        """Record a job that needed no work (e.g. a cache hit)"""
+        job = Job(None, download_name, cleanup)
+        job.cache_hit = cache_hit
+        job.finish(result)
+        with self._lock:
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def discard(self, job):
+        """Forget a job and release its files; queued jobs nobody else follows are skipped"""
+        with self._lock:
+            self._jobs.pop(job.id, None)
+            job.discarded = True
+            finished = job.status in (DONE, FAILED)
+            leader = job.leader or job
+            if not finished and leader.discarded and all(f.discarded for f in leader.followers or ()):
+                leader.cancelled = True
+                if self._in_flight.get(leader.key) is leader:
+                    del self._in_flight[leader.key]
+        if finished:
+            self._cleanup(job)
+
+    def retry_after(self):
+        return max(1, math.ceil(self._queue.pending_seconds() / max(self.workers, 1)))
+
+    def _cleanup(self, job):
+        if job.cleanup is not None:
+            try:
+                job.cleanup()
+            except Exception as e:
+                logger.warning('Cleanup of job %s failed: %s', job.id, e)
+
+    def _start(self, job):
+        """Mark job and its followers running"""
+        with self._lock:
+            job.started_at = time.time()
+            for member in [job] + job.followers:
+                member.status = RUNNING
+                member.started_at = job.started_at
+
+    def _settle(self, job, result=None, error=None):
+        """Finish job and its followers; release the ones already discarded"""
+        with self._lock:
+            if self._in_flight.get(job.key) is job:
+                del self._in_flight[job.key]
+            followers, job.followers = job.followers, None
+        for follower in followers:
+            own_result, own_error = result, error
+            if error is None and follower.share is not None and not follower.discarded:
+                try:
+                    own_result = follower.share(result)
+                except Exception as e:
+                    own_result, own_error = None, e
+            self._finish(follower, own_result, own_error)
+        self._finish(job, result, error)
+
+    def _finish(self, job, result, error):
+        with self._lock:
+            job.finish(result, error)
+            discarded = job.discarded
+        if discarded:
+            self._cleanup(job)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            self._start(job)
+            if job.cancelled:
+                self._settle(job, error=RuntimeError('Job cancelled'))
+                continue
+
+            try:
+                result, error = job.fn(), None
+            except Exception as e:
+                result, error = None, e
+            duration = time.time() - job.started_at
+            self._settle(job, result, error)
+
+            self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+            # Followers never get here, so waiting on another job is never recorded as a cost
+            if job.format and job.costed and job.status == DONE:
+                self.costs.record(job.format, job.size, duration)
+
+    def _expire_loop(self):
+        while True:
+            time.sleep(60)
+            cutoff = time.time() - self.ttl
+            with self._lock:
+                expired = [job for job in self._jobs.values()
+                           if job.finished_at is not None and job.finished_at < cutoff]
+                for job in expired:
+                    del self._jobs[job.id]
+            for job in expired:
+                self._cleanup(job)
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {
+            'workers': self.workers,
+            'queued': self._queue.qsize(),
+            'max_queued': self._queue.maxsize,
+            'running': sum(1 for job in jobs if job.status == RUNNING),
+            'rejected': self.rejected,
+            'coalesced': self.coalesced,
+            'avg_duration': round(self._avg_duration, 3),
+            **self._queue.stats(),
+            'costs': self.costs.stats(),
+        }
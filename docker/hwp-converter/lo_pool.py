@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+"""
+LibreOffice Worker Pool
+Long-lived headless soffice processes driven over UNO, one user profile per worker
+"""
+
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import subprocess
+import threading
+import time
+
+import governor
+import profiling
+from governor import CPU_LIMIT, JobLimits, Watchdog
+
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+except ImportError:  # python3-uno missing (local dev) -> one-shot soffice only
+    uno = None
+
+logger = logging.getLogger(__name__)
+
+START_TIMEOUT = 30  # seconds to wait for a worker's UNO listener
+
+# First LibreOffice whose --convert-to takes JSON filter options; older ones (7.3 on Ubuntu 22.04)
+# silently drop them, PageRange included
+JSON_FILTER_OPTIONS_VERSION = (7, 4)
+
+# One-shot soffice has no loaded document to inspect, so go by extension
+ONESHOT_PDF_FILTERS = {
+    'xls': 'calc_pdf_Export', 'xlsx': 'calc_pdf_Export', 'ods': 'calc_pdf_Export', 'csv': 'calc_pdf_Export',
+    'ppt': 'impress_pdf_Export', 'pptx': 'impress_pdf_Export', 'odp': 'impress_pdf_Export',
+}
+
+# Checked in order: a web document is also a text document, and so on
+PDF_FILTERS = [
+    ('com.sun.star.sheet.SpreadsheetDocument', 'calc_pdf_Export'),
+    ('com.sun.star.presentation.PresentationDocument', 'impress_pdf_Export'),
+    ('com.sun.star.drawing.DrawingDocument', 'draw_pdf_Export'),
+    ('com.sun.star.text.WebDocument', 'writer_web_pdf_Export'),
+    ('com.sun.star.text.GenericTextDocument', 'writer_pdf_Export'),
+]
+
+
+class ConversionError(Exception):
+    """Conversion failed; `details` carries converter output for the client"""
+
+    def __init__(self, message, details=''):
+        super().__init__(message)
+        self.details = details
+
+
+class ConversionTimeout(ConversionError):
+    """Conversion exceeded its time budget"""
+
+
+class MissingOutput(ConversionError):
+    """Converter reported success but wrote no output file"""
+
+
+class ResourceLimitExceeded(ConversionError):
+    """Converter was killed for its memory or CPU use, or for making no progress"""
+
+    def __init__(self, reason, details=''):
+        super().__init__(f'Conversion stopped: {reason}', details)
+        self.reason = reason
+
+
+def _prop(name, value):
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+def _filter_data(values):
+    props = tuple(_prop(name, value) for name, value in values.items())
+    return uno.Any('[]com.sun.star.beans.PropertyValue', props)
+
+
+def _file_url(path):
+    return uno.systemPathToFileUrl(os.path.abspath(path))
+
+
+def pdf_filter_for(doc):
+    """Pick the PDF export filter matching the loaded document's module"""
+    for service, filter_name in PDF_FILTERS:
+        if doc.supportsService(service):
+            return filter_name
+    raise ConversionError('Unsupported document type')
+
+
+_version = None
+_version_lock = threading.Lock()
+
+
+def soffice_version():
+    """Installed LibreOffice as (major, minor), or None if `soffice --version` doesn't say; asked once"""
+    global _version
+    with _version_lock:
+        if _version is None:
+            try:
+                output = subprocess.run(['soffice', '--version'], capture_output=True, text=True,
+                                        timeout=START_TIMEOUT).stdout
+            except (OSError, subprocess.SubprocessError) as e:
+                output = ''
+                logger.warning('Could not ask soffice for its version: %s', e)
+            match = re.search(r'(\d+)\.(\d+)\.\d+', output)
+            _version = (int(match.group(1)), int(match.group(2))) if match else ()
+        return _version or None
+
+
+def oneshot_filter_data():
+    """Whether one-shot soffice honours PDF filter data such as PageRange"""
+    version = soffice_version()
+    return version is not None and version >= JSON_FILTER_OPTIONS_VERSION
+
+
+def seed_profile(profile_dir, template):
+    """Start a user profile as a copy of template instead of building it from scratch"""
+    if template and os.path.isdir(template) and not os.path.exists(profile_dir):
+        shutil.copytree(template, profile_dir, symlinks=True)
+
+
+def convert_with_soffice(input_path, out_dir, timeout, filter_data=None, profile_dir=None, profile_template=None,
+                         limits=None, address_space=False):
+    """One-shot `soffice --convert-to pdf` with a private profile (in out_dir by default)
+
+    filter_data is passed as JSON filter options, which needs LibreOffice 7.4+;
+    older versions raise ConversionError rather than ignore it.
+    soffice hosts H2Orestart's JVM, which reserves its heap up front, so
+    RLIMIT_AS only applies with address_space=True; limits.max_rss still
+    holds through the watchdog.
+    """
+    profile_dir = profile_dir or os.path.join(out_dir, 'lo_profile')
+    seed_profile(profile_dir, profile_template)
+    os.makedirs(profile_dir, exist_ok=True)
+
+    target = 'pdf'
+    if filter_data:
+        if not oneshot_filter_data():
+            raise ConversionError('Page ranges need LibreOffice 7.4+ or the worker pool (LO_POOL_SIZE > 0)',
+                                  f'soffice version: {soffice_version()}')
+        ext = os.path.splitext(input_path)[1].lstrip('.').lower()
+        options = {name: {'type': 'string', 'value': str(value)} for name, value in filter_data.items()}
+        target = f"pdf:{ONESHOT_PDF_FILTERS.get(ext, 'writer_pdf_Export')}:{json.dumps(options)}"
+
+    try:
+        result, killed = governor.run(
+            ['soffice', '--headless', '--norestore', '--nofirststartwizard',
+             f'-env:UserInstallation=file://{profile_dir}',
+             '--convert-to', target, input_path, '--outdir', out_dir],
+            timeout,
+            limits,
+            address_space
+        )
+    except subprocess.TimeoutExpired:
+        raise ConversionTimeout('Conversion timeout')
+
+    if killed:
+        raise ResourceLimitExceeded(killed, result.stderr)
+    if result.returncode != 0:
+        raise ConversionError('Conversion failed', result.stderr)
+
+    return os.path.join(out_dir, os.path.splitext(os.path.basename(input_path))[0] + '.pdf')
+
+
+class LibreOfficeWorker:
+    """One headless soffice process listening on a local UNO socket"""
+
+    def __init__(self, index, profile_root, port, profile_template=None, limits=None, address_space=False):
+        self.index = index
+        self.port = port
+        self.profile_dir = os.path.join(profile_root, f'worker-{index}')
+        self.profile_template = profile_template
+        self.limits = limits or JobLimits()
+        self.address_space = address_space
+        self.process = None
+        self.desktop = None
+        self.jobs = 0
+        self.jobs_since_start = 0
+        self.restarts = 0
+        self.last_error = None
+
+    def start(self):
+        seed_profile(self.profile_dir, self.profile_template)
+        os.makedirs(self.profile_dir, exist_ok=True)
+        self.process = subprocess.Popen(
+            ['soffice', '--headless', '--invisible', '--nologo', '--nodefault',
+             '--norestore', '--nofirststartwizard', '--nolockcheck',
+             f'-env:UserInstallation=file://{self.profile_dir}',
+             f'--accept=socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext'],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            # Only the address-space cap (if enabled) applies for the worker's lifetime; CPU is budgeted
+            # per job and resident memory is watched per job
+            preexec_fn=JobLimits(self.limits.max_address_space).preexec(self.address_space),
+            start_new_session=True
+        )
+        self.jobs_since_start = 0
+        self.desktop = self._connect()
+        logger.info('LibreOffice worker %d ready (pid %d, port %d)', self.index, self.process.pid, self.port)
+
+    def _connect(self):
+        local_ctx = uno.getComponentContext()
+        resolver = local_ctx.ServiceManager.createInstanceWithContext(
+            'com.sun.star.bridge.UnoUrlResolver', local_ctx)
+        url = f'uno:socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext'
+
+        deadline = time.monotonic() + START_TIMEOUT
+        while True:
+            if self.process.poll() is not None:
+                raise ConversionError(f'soffice exited during startup ({self.process.returncode})')
+            try:
+                ctx = resolver.resolve(url)
+                return ctx.ServiceManager.createInstanceWithContext('com.sun.star.frame.Desktop', ctx)
+            except Exception:
+                if time.monotonic() > deadline:
+                    raise ConversionError('soffice UNO listener did not come up')
+                time.sleep(0.25)
+
+    def stop(self):
+        if self.desktop is not None:
+            try:
+                self.desktop.terminate()
+            except Exception:
+                pass
+            self.desktop = None
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+
+    def restart(self, wipe_profile=False):
+        self.stop()
+        if wipe_profile:
+            shutil.rmtree(self.profile_dir, ignore_errors=True)
+        self.restarts += 1
+        self.start()
+
+    def kill(self):
+        if self.process is not None and self.process.poll() is None:
+            governor.kill_tree(self.process.pid)
+
+    def rss(self):
+        return governor.tree_usage(self.process.pid)[1] if self.is_alive() else 0
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None and self.desktop is not None
+
+    def is_healthy(self):
+        """Process is running and answers a cheap UNO call"""
+        if not self.is_alive():
+            return False
+        try:
+            self.desktop.getFrames().getCount()
+            return True
+        except Exception as e:
+            self.last_error = str(e)
+            return False
+
+    def convert(self, input_path, output_path, timeout, filter_data=None, prepare=None):
+        """Load input_path and export it as PDF to output_path
+
+        filter_data holds PDF export settings such as PageRange. prepare(doc),
+        if given, may change the loaded document and returns filter data to
+        add; the input file itself is never written back.
+        """
+        timed_out = threading.Event()
+
+        def on_timeout():
+            timed_out.set()
+            self.kill()
+
+        watchdog = threading.Timer(timeout, on_timeout)
+        watchdog.daemon = True
+        watchdog.start()
+        pid = self.process.pid
+        if self.limits.max_cpu_seconds:
+            governor.set_cpu_budget(pid, self.limits.max_cpu_seconds)
+        progress = Watchdog(pid, self.limits.stall_seconds, self.limits.max_rss).start()
+        started = time.monotonic()
+        doc = None
+        try:
+            with profiling.phase('load'):
+                doc = self.desktop.loadComponentFromURL(
+                    _file_url(input_path), '_blank', 0,
+                    (_prop('Hidden', True), _prop('ReadOnly', prepare is None)))
+            if doc is None:
+                raise ConversionError('Conversion failed', 'Document could not be loaded')
+
+            if prepare is not None:
+                with profiling.phase('prepare'):
+                    filter_data = dict(filter_data or {}, **prepare(doc))
+            store_args = [_prop('FilterName', pdf_filter_for(doc))]
+            if filter_data:
+                store_args.append(_prop('FilterData', _filter_data(filter_data)))
+            with profiling.phase('export'):
+                doc.storeToURL(_file_url(output_path), tuple(store_args))
+            self.jobs += 1
+            self.jobs_since_start += 1
+        except ConversionError:
+            raise
+        except Exception as e:
+            if timed_out.is_set():
+                raise ConversionTimeout('Conversion timeout')
+            if progress.reason:
+                raise ResourceLimitExceeded(progress.reason, str(e))
+            if (self.limits.max_cpu_seconds and self.process.poll() is not None
+                    and time.monotonic() - started >= self.limits.max_cpu_seconds):
+                # Died after running at least as long as its CPU budget: SIGXCPU
+                raise ResourceLimitExceeded(CPU_LIMIT, str(e))
+            raise ConversionError('Conversion failed', str(e))
+        finally:
+            watchdog.cancel()
+            progress.stop()
+            if self.limits.max_cpu_seconds and self.process.poll() is None:
+                governor.clear_cpu_budget(pid)
+            if doc is not None and not timed_out.is_set():
+                try:
+                    doc.close(True)
+                except Exception:
+                    pass
+
+    def status(self):
+        return {
+            'index': self.index,
+            'pid': self.process.pid if self.process else None,
+            'alive': self.is_alive(),
+            'jobs': self.jobs,
+            'restarts': self.restarts,
+            'last_error': self.last_error,
+        }
+
+
+class LibreOfficePool:
+    """Fixed-size pool of LibreOffice workers with health checks and restarts
+
+    With size 0, or without python3-uno, every conversion falls back to a
+    one-shot soffice process. Profiles, including ones wiped after a crash,
+    start as copies of profile_template when it exists.
+
+    Workers are recycled after max_jobs conversions or once their resident
+    memory passes recycle_rss; on_recycle(reason) is called for every
+    restart, including crash recovery ('unhealthy').
+
+    limits.max_address_space is only applied to soffice with address_space=True
+    (see convert_with_soffice).
+    """
+
+    def __init__(self, size, profile_root, base_port=2002, health_interval=30, profile_template=None,
+                 limits=None, max_jobs=0, recycle_rss=0, on_recycle=None, address_space=False):
+        self.size = size if uno is not None else 0
+        self.profile_root = profile_root
+        self.profile_template = profile_template
+        self.health_interval = health_interval
+        self.limits = limits
+        self.max_jobs = max_jobs
+        self.recycle_rss = recycle_rss
+        self.on_recycle = on_recycle
+        self.address_space = address_space
+        self.recycles = 0
+        self.workers = [LibreOfficeWorker(i, profile_root, base_port + i, profile_template, limits, address_space)
+                        for i in range(self.size)]
+        self._idle = queue.Queue()
+        self._stopped = threading.Event()
+
+    @property
+    def enabled(self):
+        return self.size > 0
+
+    @property
+    def page_ranges(self):
+        """Whether convert() honours PageRange: always on workers, on one-shot soffice from 7.4"""
+        return self.enabled or oneshot_filter_data()
+
+    def start(self):
+        for worker in self.workers:
+            try:
+                worker.start()
+            except Exception as e:
+                # Keep the worker in rotation; it is restarted on first use
+                worker.last_error = str(e)
+                logger.error('LibreOffice worker %d failed to start: %s', worker.index, e)
+            self._idle.put(worker)
+
+        if self.enabled:
+            threading.Thread(target=self._health_loop, name='lo-pool-health', daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+        for worker in self.workers:
+            worker.stop()
+
+    def _revive(self, worker, reason='unhealthy'):
+        self.recycles += 1
+        if self.on_recycle:
+            self.on_recycle(reason)
+        try:
+            worker.restart()
+        except ConversionError:
+            # A crash can leave the profile half-written; start from scratch
+            worker.restart(wipe_profile=True)
+
+    def convert(self, input_path, out_dir, timeout, filter_data=None, prepare=None):
+        """Convert input_path to PDF inside out_dir and return the PDF path
+
+        prepare is passed to LibreOfficeWorker.convert; it needs a loaded
+        document, so it fails the conversion when the pool is disabled.
+        """
+        if not self.enabled:
+            if prepare is not None:
+                raise ConversionError('These options need the LibreOffice worker pool (LO_POOL_SIZE > 0)')
+            # Process startup, load and export in one soffice run, so one phase
+            with profiling.phase('soffice'):
+                return convert_with_soffice(input_path, out_dir, timeout, filter_data,
+                                            profile_template=self.profile_template, limits=self.limits,
+                                            address_space=self.address_space)
+
+        pdf_path = os.path.join(out_dir, os.path.splitext(os.path.basename(input_path))[0] + '.pdf')
+        try:
+            with profiling.phase('acquire'):
+                worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise ConversionTimeout('No LibreOffice worker available')
+
+        recycle = None
+        try:
+            if not worker.is_alive():
+                with profiling.phase('start'):
+                    self._revive(worker)
+            worker.convert(input_path, pdf_path, timeout, filter_data, prepare)
+            recycle = self._recycle_reason(worker)
+        except ConversionError as e:
+            worker.last_error = str(e)
+            if not worker.is_healthy():
+                logger.warning('LibreOffice worker %d unhealthy after job, restarting', worker.index)
+                try:
+                    self._revive(worker)
+                except ConversionError as restart_error:
+                    logger.error('LibreOffice worker %d restart failed: %s', worker.index, restart_error)
+            raise
+        finally:
+            if recycle:
+                # Restart off the request path; the worker rejoins the idle queue when it is back
+                threading.Thread(target=self._recycle, args=(worker, recycle), daemon=True).start()
+            else:
+                self._idle.put(worker)
+
+        return pdf_path
+
+    def _recycle_reason(self, worker):
+        if self.max_jobs and worker.jobs_since_start >= self.max_jobs:
+            return 'jobs'
+        if self.recycle_rss and worker.rss() > self.recycle_rss:
+            return 'rss'
+        return None
+
+    def _recycle(self, worker, reason):
+        logger.info('Recycling LibreOffice worker %d (%s)', worker.index, reason)
+        try:
+            self._revive(worker, reason)
+        except ConversionError as e:
+            logger.error('LibreOffice worker %d recycle failed: %s', worker.index, e)
+        finally:
+            self._idle.put(worker)
+
+    def warm_up(self, input_path, out_dir, timeout):
+        """Convert input_path on every worker so each has its filters and fonts loaded"""
+        if not self.enabled:
+            convert_with_soffice(input_path, out_dir, timeout, profile_template=self.profile_template,
+                                 limits=self.limits, address_space=self.address_space)
+            return
+
+        stem = os.path.splitext(os.path.basename(input_path))[0]
+        taken = []
+        try:
+            for _ in self.workers:
+                taken.append(self._idle.get(timeout=timeout))
+            for worker in taken:
+                if not worker.is_alive():
+                    self._revive(worker)
+                worker.convert(input_path, os.path.join(out_dir, f'{stem}-{worker.index}.pdf'), timeout)
+        except queue.Empty:
+            raise ConversionTimeout('No LibreOffice worker available')
+        finally:
+            for worker in taken:
+                self._idle.put(worker)
+
+    def _health_loop(self):
+        while not self._stopped.wait(self.health_interval):
+            # Only idle workers are checked; busy ones are guarded by their job timeout
+            for _ in range(self._idle.qsize()):
+                try:
+                    worker = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    if not worker.is_healthy():
+                        logger.warning('LibreOffice worker %d failed health check, restarting', worker.index)
+                        self._revive(worker)
+                except ConversionError as e:
+                    logger.error('LibreOffice worker %d restart failed: %s', worker.index, e)
+                finally:
+                    self._idle.put(worker)
+
+    def status(self):
+        return {
+            'mode': 'pool' if self.enabled else 'oneshot',
+            'size': self.size,
+            'recycles': self.recycles,
+            'idle': self._idle.qsize(),
+            'workers': [worker.status() for worker in self.workers],
+        }
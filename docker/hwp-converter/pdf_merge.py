@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+PDF Merge
+Concatenate partial PDFs in order with qpdf, carrying every part's bookmarks over
+"""
+
+import json
+import os
+import re
+import subprocess
+
+import governor
+from lo_pool import ConversionError, ConversionTimeout, ResourceLimitExceeded
+
+REF_PATTERN = re.compile(r'(\d+) (\d+) R')
+
+
+def _qpdf(args, timeout, limits):
+    try:
+        result, killed = governor.run(['qpdf', *args], timeout, limits)
+    except subprocess.TimeoutExpired:
+        raise ConversionTimeout('PDF merge timeout')
+    if killed:
+        raise ResourceLimitExceeded(killed, result.stderr)
+    # Exit code 3 means qpdf fixed something and warned about it; the output is fine
+    if result.returncode not in (0, 3):
+        raise ConversionError('PDF merge failed', result.stderr)
+    return result.stdout
+
+
+def _describe(path, timeout, limits):
+    """qpdf's JSON view of path's pages and bookmarks"""
+    output = _qpdf(['--json', '--json-key=pages', '--json-key=outlines', path], timeout, limits)
+    try:
+        return json.loads(output)
+    except ValueError as e:
+        raise ConversionError('PDF merge failed', f'Unreadable qpdf JSON for {path}: {e}')
+
+
+def _shift(outlines, offset):
+    """Bookmarks of one part with their target pages moved to where the part lands"""
+    return [{
+        'title': item.get('title') or '',
+        'page': item['destpageposfrom1'] + offset if item.get('destpageposfrom1') else None,
+        'open': item.get('open', True),
+        'kids': _shift(item.get('kids') or [], offset),
+    } for item in outlines]
+
+
+def merge_pdfs(paths, dst, timeout=60, limits=None):
+    """Write the pages of paths, in order, to dst and return its page count
+
+    qpdf keeps no bookmarks when it takes pages from several files, so
+    they are read from each part first and appended to dst afterwards as
+    an incremental update.
+    """
+    outlines = []
+    pages = 0
+    for path in paths:
+        part = _describe(path, timeout, limits)
+        outlines.extend(_shift(part.get('outlines') or [], pages))
+        pages += len(part['pages'])
+
+    # Classic xref tables, so the bookmark update can extend them
+    _qpdf(['--empty', '--object-streams=disable', '--pages', *paths, '--', dst], timeout, limits)
+    if outlines:
+        page_refs = [page['object'] for page in _describe(dst, timeout, limits)['pages']]
+        if len(page_refs) != pages:
+            raise ConversionError('PDF merge failed', f'Expected {pages} pages, got {len(page_refs)}')
+        trailer = _qpdf(['--show-object=trailer', dst], timeout, limits).strip()
+        root = REF_PATTERN.search(trailer[trailer.index('/Root'):])
+        catalog = _qpdf([f'--show-object={root.group(1)},{root.group(2)}', dst], timeout, limits).strip()
+        _append_outlines(dst, outlines, page_refs, trailer, (int(root.group(1)), int(root.group(2))), catalog)
+    return pages
+
+
+def _pdf_text(text):
+    return '<FEFF' + text.encode('utf-16-be').hex().upper() + '>'
+
+
+def _append_outlines(path, outlines, page_refs, trailer, root, catalog):
+    """Add an outline tree to the PDF at path with an incremental update"""
+    size = int(re.search(r'/Size (\d+)', trailer).group(1))
+    objects = {}
+
+    def build(items, parent):
+        """Number items and their kids; return (first, last, visible descendants)"""
+        numbers = [size + len(objects) + i for i in range(len(items))]
+        for number in numbers:
+            objects[number] = None  # reserved
+        visible = len(items)
+        for i, (item, number) in enumerate(zip(items, numbers)):
+            entries = [f"/Title {_pdf_text(item['title'])}", f'/Parent {parent} 0 R']
+            if i > 0:
+                entries.append(f'/Prev {numbers[i - 1]} 0 R')
+            if i + 1 < len(items):
+                entries.append(f'/Next {numbers[i + 1]} 0 R')
+            if item['kids']:
+                first, last, count = build(item['kids'], number)
+                # A negative count means the entry starts closed
+                entries.append(f"/First {first} 0 R /Last {last} 0 R /Count {count if item['open'] else -count}")
+                if item['open']:
+                    visible += count
+            if item['page'] and item['page'] <= len(page_refs):
+                entries.append(f"/Dest [{page_refs[item['page'] - 1]} /Fit]")
+            objects[number] = '<< ' + ' '.join(entries) + ' >>'
+        return numbers[0], numbers[-1], visible
+
+    outline_root = size
+    objects[outline_root] = None
+    first, last, count = build(outlines, outline_root)
+    objects[outline_root] = f'<< /Type /Outlines /First {first} 0 R /Last {last} 0 R /Count {count} >>'
+
+    catalog = re.sub(r'/(Outlines|PageMode) (\d+ \d+ R|/\w+)', '', catalog)
+    catalog = catalog[:catalog.rindex('>>')] + f' /Outlines {outline_root} 0 R /PageMode /UseOutlines >>'
+
+    with open(path, 'rb') as f:
+        f.seek(max(os.path.getsize(path) - 1024, 0))
+        prev = int(re.findall(rb'startxref\s+(\d+)', f.read())[-1])
+
+    with open(path, 'ab') as f:
+        f.write(b'\n')
+        offsets = {}
+        for number, body in [(root[0], catalog)] + sorted(objects.items()):
+            offsets[number] = f.tell()
+            generation = root[1] if number == root[0] else 0
+            f.write(f'{number} {generation} obj\n{body}\nendobj\n'.encode('latin-1'))
+
+        xref = f.tell()
+        f.write(f'xref\n{root[0]} 1\n{offsets[root[0]]:010d} {root[1]:05d} n \n'.encode())
+        f.write(f'{size} {len(objects)}\n'.encode())
+        for number in sorted(objects):
+            f.write(f'{offsets[number]:010d} 00000 n \n'.encode())
+        new_trailer = re.sub(r'\s*/(Size|Prev) \d+', '', trailer)
+        new_trailer = new_trailer[:new_trailer.rindex('>>')] + f' /Size {size + len(objects)} /Prev {prev} >>'
+        f.write(f'trailer\n{new_trailer}\nstartxref\n{xref}\n%%EOF\n'.encode('latin-1'))
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+PDF Optimization
+Linearize, subset fonts and downsample images of converted PDFs with qpdf and Ghostscript
+"""
+
+import os
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+
+import governor
+from lo_pool import ConversionError, ConversionTimeout, ResourceLimitExceeded
+
+LEVELS = ('none', 'web', 'small')
+
+
+def _run(args, timeout, what, limits):
+    try:
+        result, killed = governor.run(args, timeout, limits)
+    except subprocess.TimeoutExpired:
+        raise ConversionTimeout(f'{what} timeout')
+    except FileNotFoundError:
+        raise ConversionError(f'{what} failed', f'{args[0]} is not installed')
+    if killed:
+        raise ResourceLimitExceeded(killed, result.stderr)
+    return result
+
+
+def linearize(src, dst, timeout, limits=None):
+    """Rewrite src for fast first-page display, packing objects into object streams"""
+    result = _run(['qpdf', '--linearize', '--object-streams=generate', '--compress-streams=y', src, dst],
+                  timeout, 'Linearization', limits)
+    # Exit code 3 means qpdf fixed something and warned about it; the output is fine
+    if result.returncode not in (0, 3) or not os.path.exists(dst):
+        raise ConversionError('Linearization failed', result.stderr)
+    return dst
+
+
+def compact(src, dst, dpi, timeout, limits=None):
+    """Re-distill src with fonts subset, duplicate images merged and images downsampled to dpi"""
+    result = _run([
+        'gs', '-q', '-dNOPAUSE', '-dBATCH', '-dSAFER',
+        '-sDEVICE=pdfwrite', '-dCompatibilityLevel=1.5',
+        '-dSubsetFonts=true', '-dCompressFonts=true', '-dDetectDuplicateImages=true',
+        '-dDownsampleColorImages=true', '-dColorImageDownsampleType=/Bicubic', f'-dColorImageResolution={dpi}',
+        '-dDownsampleGrayImages=true', '-dGrayImageDownsampleType=/Bicubic', f'-dGrayImageResolution={dpi}',
+        '-dDownsampleMonoImages=true', f'-dMonoImageResolution={dpi * 2}',
+        f'-sOutputFile={dst}', src,
+    ], timeout, 'Image downsampling', limits)
+    if result.returncode != 0 or not os.path.exists(dst):
+        raise ConversionError('Image downsampling failed', result.stderr)
+    return dst
+
+
+def optimize_pdf(pdf_path, out_dir, level, dpi=150, timeout=60, limits=None):
+    """Post-process pdf_path at `level`; return (path, report)
+
+    `web` only linearizes. `small` first re-distills with Ghostscript and
+    keeps that copy only if it is smaller, then linearizes.
+    """
+    started = time.monotonic()
+    input_bytes = os.path.getsize(pdf_path)
+    path = pdf_path
+
+    if level == 'small':
+        compacted = compact(path, os.path.join(out_dir, 'compacted.pdf'), dpi, timeout, limits)
+        if os.path.getsize(compacted) < input_bytes:
+            path = compacted
+
+    path = linearize(path, os.path.join(out_dir, 'optimized.pdf'), timeout, limits)
+
+    return path, {
+        'level': level,
+        'input_bytes': input_bytes,
+        'output_bytes': os.path.getsize(path),
+        'seconds': time.monotonic() - started,
+    }
+
+
+class ReportLog:
+    """Recent reports about outputs (optimization, spreadsheet truncation) by path, for headers on later cache hits"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._reports = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, path, report):
+        with self._lock:
+            self._reports[path] = report
+            self._reports.move_to_end(path)
+            while len(self._reports) > self.max_entries:
+                self._reports.popitem(last=False)
+
+    def get(self, path):
+        with self._lock:
+            return self._reports.get(path)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Request Profiling
+Per-phase request timings for Server-Timing and JSON logs, with captures of slow requests
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger(__name__)
+
+STDERR_TAIL = 4000  # characters of child stderr kept per process
+
+
+class Timeline:
+    """Phases of one request, in the order they finished
+
+    Threads working for the request (the route's own and a queue worker)
+    bind the timeline with bind(), so code deep in a conversion can record
+    phases and child processes without being handed the timeline.
+    """
+
+    def __init__(self, method, path):
+        self.id = uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.started = time.monotonic()
+        self.started_at = time.time()
+        self.phases = []
+        self.fields = {}
+        self.processes = []
+        self.samples = Counter()
+        self.threads = set()
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.phases.append((name, seconds))
+
+    @contextmanager
+    def phase(self, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, time.monotonic() - started)
+
+    def note(self, **fields):
+        with self._lock:
+            self.fields.update(fields)
+
+    def process(self, args, returncode, seconds, stderr):
+        with self._lock:
+            self.processes.append({
+                'args': [str(arg) for arg in args],
+                'returncode': returncode,
+                'seconds': round(seconds, 4),
+                'stderr': (stderr or '')[-STDERR_TAIL:],
+            })
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def server_timing(self):
+        """Server-Timing header value: one metric per phase plus the total so far, in ms"""
+        with self._lock:
+            phases = list(self.phases)
+        metrics = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in phases]
+        metrics.append(f'total;dur={self.elapsed() * 1000:.1f}')
+        return ', '.join(metrics)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'request_id': self.id,
+                'method': self.method,
+                'path': self.path,
+                'started_at': self.started_at,
+                'total_ms': round(self.elapsed() * 1000, 1),
+                'phases': [{'name': name, 'ms': round(seconds * 1000, 1)} for name, seconds in self.phases],
+                **self.fields,
+            }
+
+
+_local = threading.local()
+
+
+def current():
+    return getattr(_local, 'timeline', None)
+
+
+@contextmanager
+def bind(timeline):
+    """Make timeline current on this thread for the duration of the block"""
+    previous = current()
+    _local.timeline = timeline
+    if timeline is not None:
+        timeline.threads.add(threading.get_ident())
+    try:
+        yield timeline
+    finally:
+        if timeline is not None:
+            timeline.threads.discard(threading.get_ident())
+        _local.timeline = previous
+
+
+def phase(name):
+    """Time a block as a phase of the current request; a no-op outside one"""
+    timeline = current()
+    return timeline.phase(name) if timeline is not None else nullcontext()
+
+
+def add_phase(name, seconds):
+    timeline = current()
+    if timeline is not None:
+        timeline.add(name, seconds)
+
+
+def note(**fields):
+    timeline = current()
+    if timeline is not None:
+        timeline.note(**fields)
+
+
+def record_process(args, returncode, seconds, stderr):
+    timeline = current()
+    if timeline is not None:
+        timeline.process(args, returncode, seconds, stderr)
+
+
+class Profiler:
+    """Stack samples of requests running past sample_after, saved when they pass threshold
+
+    One thread samples the stacks of every thread bound to such a request
+    each `interval`, so fast requests are never sampled. Captures are JSON
+    files in debug_dir; only the newest max_captures are kept. A threshold
+    of 0 turns capturing off.
+    """
+
+    def __init__(self, debug_dir, threshold, max_captures=50, interval=0.05, sample_after=None):
+        self.debug_dir = debug_dir
+        self.threshold = threshold
+        self.max_captures = max_captures
+        self.interval = interval
+        self.sample_after = threshold / 2 if sample_after is None else sample_after
+        self.captures = 0
+        self._active = set()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.threshold > 0
+
+    def start(self):
+        if self.enabled:
+            os.makedirs(self.debug_dir, exist_ok=True)
+            threading.Thread(target=self._sample_loop, name='profiler', daemon=True).start()
+
+    def begin(self, timeline):
+        if self.enabled:
+            with self._lock:
+                self._active.add(timeline)
+
+    def end(self, timeline):
+        """Stop sampling timeline and keep a capture if it was slow; return the capture path"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._active.discard(timeline)
+        if timeline.elapsed() < self.threshold:
+            return None
+        try:
+            return self._save(timeline)
+        except OSError as e:
+            logger.warning('Could not save profile of request %s: %s', timeline.id, e)
+            return None
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                due = [timeline for timeline in self._active if timeline.elapsed() >= self.sample_after]
+            if not due:
+                continue
+            frames = sys._current_frames()
+            for timeline in due:
+                for ident in list(timeline.threads):
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stack = ';'.join(f'{os.path.basename(f.filename)}:{f.name}:{f.lineno}'
+                                         for f in traceback.extract_stack(frame))
+                        timeline.samples[stack] += 1
+
+    def _save(self, timeline):
+        capture = timeline.to_dict()
+        capture['sample_interval_ms'] = self.interval * 1000
+        capture['stacks'] = [{'stack': stack, 'samples': count}
+                             for stack, count in timeline.samples.most_common(100)]
+        capture['processes'] = list(timeline.processes)
+
+        name = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(timeline.started_at))}-{timeline.id}.json"
+        path = os.path.join(self.debug_dir, name)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(capture, f, ensure_ascii=False, indent=1)
+        os.replace(path + '.tmp', path)
+        self.captures += 1
+        self._rotate()
+        return path
+
+    def _rotate(self):
+        names = sorted(name for name in os.listdir(self.debug_dir) if name.endswith('.json'))
+        for name in names[:-self.max_captures]:
+            try:
+                os.remove(os.path.join(self.debug_dir, name))
+            except OSError:
+                pass
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Conversion Scheduler
+Shortest-expected-job-first ordering with aging and an interactive lane, from observed conversion times
+"""
+
+import heapq
+import itertools
+import math
+import threading
+import time
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+LANES = (INTERACTIVE, BATCH)
+
+# Relative cost of a format before any history exists (1 = a plain text document)
+FORMAT_WEIGHTS = {
+    'ppt': 3.0, 'pptx': 3.0, 'odp': 3.0,
+    'xls': 2.0, 'xlsx': 2.0, 'ods': 2.0,
+    'hwp': 1.5, 'hwpx': 1.5,
+}
+
+
+def size_class(size):
+    """Bucket sizes by powers of four from 64 KB, so jobs are compared with similar ones"""
+    return max(0, math.ceil(math.log(max(size, 1) / 65536, 4)))
+
+
+class _Ewma:
+    def __init__(self):
+        self.count = 0
+        self.value = 0.0
+
+    def add(self, sample, alpha):
+        self.value = sample if self.count == 0 else (1 - alpha) * self.value + alpha * sample
+        self.count += 1
+
+
+class CostModel:
+    """Expected conversion seconds for a (format, size), learned from finished jobs
+
+    A (format, size class) seen before is estimated from its own history;
+    otherwise the format's seconds per MB is scaled to the input, and with
+    no history at all a prior from FORMAT_WEIGHTS is used.
+    """
+
+    def __init__(self, base_seconds=2.0, seconds_per_mb=1.0, alpha=0.2):
+        self.base_seconds = base_seconds
+        self.seconds_per_mb = seconds_per_mb
+        self.alpha = alpha
+        self._classes = {}
+        self._rates = {}
+        self._lock = threading.Lock()
+
+    def estimate(self, fmt, size):
+        with self._lock:
+            history = self._classes.get((fmt, size_class(size)))
+            if history is not None:
+                return history.value
+            rate = self._rates.get(fmt)
+            if rate is not None:
+                return self.base_seconds + rate.value * size / 2**20
+        return FORMAT_WEIGHTS.get(fmt, 1.0) * (self.base_seconds + self.seconds_per_mb * size / 2**20)
+
+    def record(self, fmt, size, seconds):
+        with self._lock:
+            self._classes.setdefault((fmt, size_class(size)), _Ewma()).add(seconds, self.alpha)
+            per_mb = max(seconds - self.base_seconds, 0) / max(size / 2**20, 1 / 64)
+            self._rates.setdefault(fmt, _Ewma()).add(per_mb, self.alpha)
+
+    def stats(self):
+        with self._lock:
+            return {
+                fmt: {'samples': rate.count, 'seconds_per_mb': round(rate.value, 3)}
+                for fmt, rate in sorted(self._rates.items())
+            }
+
+
+class Scheduler:
+    """Bounded queue handing out the job with the lowest priority score first
+
+    score = estimate + lane penalty - aging * seconds waited. Every queued
+    job ages at the same rate, so ordering by estimate + penalty + aging *
+    enqueue time gives the same order and lets the heap keys stay fixed.
+    With aging=1 a job is overtaken by at most `estimate + penalty` seconds
+    of newer, cheaper work, so large and batch jobs cannot starve.
+    """
+
+    def __init__(self, max_queued, batch_penalty=60.0, aging=1.0):
+        self.maxsize = max_queued
+        self.batch_penalty = batch_penalty
+        self.aging = aging
+        self._heap = []
+        self._seq = itertools.count()
+        self._queued = {lane: 0 for lane in LANES}
+        self._pending_seconds = 0.0
+        self._cond = threading.Condition()
+
+    def _score(self, lane, estimate, enqueued_at):
+        penalty = self.batch_penalty if lane == BATCH else 0.0
+        return estimate + penalty + self.aging * enqueued_at
+
+    def put_nowait(self, item, lane, estimate):
+        """Queue item; return False if the queue is full"""
+        with self._cond:
+            if len(self._heap) >= self.maxsize:
+                return False
+            enqueued_at = time.monotonic()
+            score = self._score(lane, estimate, enqueued_at)
+            heapq.heappush(self._heap, (score, next(self._seq), lane, estimate, enqueued_at, item))
+            self._queued[lane] += 1
+            self._pending_seconds += estimate
+            self._cond.notify()
+            return True
+
+    def get(self):
+        """Block until a job is queued and return the best one"""
+        with self._cond:
+            while not self._heap:
+                self._cond.wait()
+            _, _, lane, estimate, _, item = heapq.heappop(self._heap)
+            self._queued[lane] -= 1
+            self._pending_seconds = max(self._pending_seconds - estimate, 0.0)
+            return item
+
+    def move(self, item, lane):
+        """Re-score a queued item for another lane, keeping the time it has waited
+
+        Returns False if item is not queued (any more).
+        """
+        with self._cond:
+            for i, (_, seq, old_lane, estimate, enqueued_at, queued) in enumerate(self._heap):
+                if queued is item:
+                    break
+            else:
+                return False
+            self._heap[i] = (self._score(lane, estimate, enqueued_at), seq, lane, estimate, enqueued_at, item)
+            heapq.heapify(self._heap)
+            self._queued[old_lane] -= 1
+            self._queued[lane] += 1
+            return True
+
+    def qsize(self):
+        with self._cond:
+            return len(self._heap)
+
+    def pending_seconds(self):
+        """Sum of the estimates of everything queued"""
+        with self._cond:
+            return self._pending_seconds
+
+    def stats(self):
+        with self._cond:
+            return {'lanes': dict(self._queued), 'pending_seconds': round(self._pending_seconds, 3)}
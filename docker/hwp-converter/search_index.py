@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Full-Text Search Index
+SQLite FTS5 index of extracted document text, keyed by content hash
+"""
+
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SNIPPET_TOKENS = 16
+
+
+def fts5_available():
+    try:
+        sqlite3.connect(':memory:').execute('CREATE VIRTUAL TABLE t USING fts5(body)')
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+
+def match_query(q):
+    """Turn free text into an FTS5 query: every word must match, as a prefix
+
+    Words are quoted so FTS5 operators in user input are taken literally;
+    prefix matching lets 한글 find 한글의 without a Korean tokenizer.
+    """
+    terms = [term.replace('"', '""') for term in q.split()]
+    return ' '.join(f'"{term}"*' for term in terms if term)
+
+
+class SearchIndex:
+    """Text of indexed documents, one row per content hash, oldest dropped past max_bytes
+
+    An empty path or an SQLite build without FTS5 leaves the index disabled;
+    every method is then a no-op.
+    """
+
+    def __init__(self, path, max_bytes, tokenizer='unicode61'):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self._total = 0
+
+        if not path:
+            return
+        if not fts5_available():
+            logger.warning('SQLite has no FTS5; search index disabled')
+            return
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS documents ('
+            ' id INTEGER PRIMARY KEY, hash TEXT UNIQUE NOT NULL, name TEXT, format TEXT,'
+            ' bytes INTEGER NOT NULL, indexed_at REAL NOT NULL)')
+        self._db.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS document_text USING fts5(body, tokenize='{tokenizer}')")
+        self._total = self._db.execute('SELECT COALESCE(SUM(bytes), 0) FROM documents').fetchone()[0]
+        logger.info('Search index: %s, %d bytes of text', path, self._total)
+
+    @property
+    def enabled(self):
+        return self._db is not None
+
+    def contains(self, content_hash):
+        if not self.enabled:
+            return False
+        with self._lock:
+            return self._db.execute('SELECT 1 FROM documents WHERE hash = ?', (content_hash,)).fetchone() is not None
+
+    def add(self, content_hash, name, fmt, text):
+        """Index text under content_hash; a hash already indexed is left alone"""
+        if not self.enabled:
+            return False
+        size = len(text.encode('utf-8'))
+        if size > self.max_bytes:
+            return False
+
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = self._db.execute(
+                    'INSERT OR IGNORE INTO documents (hash, name, format, bytes, indexed_at) VALUES (?, ?, ?, ?, ?)',
+                    (content_hash, name, fmt, size, time.time()))
+                if cursor.rowcount:
+                    self._db.execute('INSERT INTO document_text (rowid, body) VALUES (?, ?)', (cursor.lastrowid, text))
+                    self._total += size
+                    self._evict()
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+        return bool(cursor.rowcount)
+
+    def _evict(self):
+        while self._total > self.max_bytes:
+            row = self._db.execute('SELECT id, bytes FROM documents ORDER BY indexed_at LIMIT 1').fetchone()
+            if row is None:
+                break
+            self._db.execute('DELETE FROM document_text WHERE rowid = ?', (row[0],))
+            self._db.execute('DELETE FROM documents WHERE id = ?', (row[0],))
+            self._total -= row[1]
+            self.evicted += 1
+
+    def search(self, q, limit=20, mark=('<mark>', '</mark>')):
+        """Best matches first: [{sha256, name, format, score, snippet}]"""
+        query = match_query(q)
+        if not self.enabled or not query:
+            return []
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT d.hash, d.name, d.format, bm25(document_text) AS rank,'
+                ' snippet(document_text, 0, ?, ?, ?, ?)'
+                ' FROM document_text JOIN documents d ON d.id = document_text.rowid'
+                ' WHERE document_text MATCH ? ORDER BY rank LIMIT ?',
+                (mark[0], mark[1], '…', SNIPPET_TOKENS, query, limit)).fetchall()
+        return [
+            # bm25() is lower-is-better; flip it so larger scores rank higher
+            {'sha256': h, 'name': name, 'format': fmt, 'score': round(-rank, 4), 'snippet': snippet}
+            for h, name, fmt, rank, snippet in rows
+        ]
+
+    def stats(self):
+        if not self.enabled:
+            return {'enabled': False}
+        with self._lock:
+            documents = self._db.execute('SELECT COUNT(*) FROM documents').fetchone()[0]
+            return {
+                'enabled': True,
+                'documents': documents,
+                'bytes': self._total,
+                'max_bytes': self.max_bytes,
+                'evicted': self.evicted,
+            }
+
+
+class IndexQueue:
+    """Runs indexing work one item at a time on a background thread, off the request path
+
+    submit() drops the work and returns False when max_pending items are
+    waiting already; the documents are indexed on a later request.
+    """
+
+    def __init__(self, max_pending=256):
+        self.dropped = 0
+        self.failed = 0
+        self._queue = queue.Queue(max_pending)
+
+    def start(self):
+        threading.Thread(target=self._run, name='search-indexer', daemon=True).start()
+
+    def submit(self, fn):
+        try:
+            self._queue.put_nowait(fn)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def _run(self):
+        while True:
+            fn = self._queue.get()
+            try:
+                fn()
+            except Exception as e:
+                self.failed += 1
+                logger.warning('Indexing failed: %s', e)
+
+    def stats(self):
+        return {'pending': self._queue.qsize(), 'dropped': self.dropped, 'failed': self.failed}
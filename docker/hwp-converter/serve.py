@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Production Server
+Serves the converter's Flask app on uvicorn, with request and response bodies streamed
+"""
+
+import logging
+import os
+
+import uvicorn
+from a2wsgi import WSGIMiddleware
+
+import server
+
+# Listener: SERVER_UDS (a unix socket path) takes precedence over SERVER_HOST:PORT
+SERVER_HOST = os.environ.get('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.environ.get('PORT', '3000'))
+SERVER_UDS = os.environ.get('SERVER_UDS') or None
+SERVER_BACKLOG = int(os.environ.get('SERVER_BACKLOG', '2048'))
+
+# Connections are held by the event loop and cost almost nothing while idle or waiting;
+# SERVER_THREADS route handlers run at once (conversions themselves are capped by QUEUE_WORKERS)
+SERVER_THREADS = int(os.environ.get('SERVER_THREADS', '32'))
+SERVER_MAX_CONNECTIONS = int(os.environ.get('SERVER_MAX_CONNECTIONS', '0')) or None  # 503 beyond this, 0 = no cap
+SERVER_KEEP_ALIVE = int(os.environ.get('SERVER_KEEP_ALIVE', '75'))  # seconds an idle connection stays open
+SERVER_GRACEFUL_SHUTDOWN = int(os.environ.get('SERVER_GRACEFUL_SHUTDOWN', '30'))
+SERVER_ACCESS_LOG = os.environ.get('SERVER_ACCESS_LOG', '0') == '1'
+
+
+def _terminated_input(wsgi_app):
+    """Mark the input stream as ending on its own, so Werkzeug reads chunked uploads
+
+    a2wsgi's wsgi.input returns b'' once the request body is complete, but
+    without this flag Werkzeug treats a body with no Content-Length as empty.
+    """
+    def app(environ, start_response):
+        environ['wsgi.input_terminated'] = True
+        return wsgi_app(environ, start_response)
+    return app
+
+
+def serve(wsgi_app):
+    """Run wsgi_app until interrupted
+
+    Always one process: jobs, the worker pool and caches live in memory, so
+    a /jobs/<id> poll has to reach the process that queued it. Scale with
+    SERVER_THREADS and QUEUE_WORKERS instead.
+    """
+    uvicorn.run(
+        # Bodies are streamed both ways: handlers read the request as it arrives,
+        # and each response chunk is sent as soon as the app yields it
+        WSGIMiddleware(_terminated_input(wsgi_app), workers=SERVER_THREADS),
+        host=SERVER_HOST,
+        port=SERVER_PORT,
+        uds=SERVER_UDS,
+        backlog=SERVER_BACKLOG,
+        limit_concurrency=SERVER_MAX_CONNECTIONS,
+        timeout_keep_alive=SERVER_KEEP_ALIVE,
+        timeout_graceful_shutdown=SERVER_GRACEFUL_SHUTDOWN,
+        access_log=SERVER_ACCESS_LOG,
+        interface='asgi3',
+        lifespan='off',
+    )
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    server.start_background()
+    serve(server.app)
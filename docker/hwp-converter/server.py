@@ -4,92 +4,1468 @@ HWP to PDF Conversion API Server
 Simple Flask server for document conversion using LibreOffice + H2Orestart
 """
 
+import base64
+import functools
+import json
+import logging
 import os
-import subprocess
-import tempfile
-import uuid
-from flask import Flask, request, send_file, jsonify
+import re
+import shutil
+import time
+import zipfile
+from collections import deque
+from flask import Flask, Response, request, send_file, jsonify, make_response, url_for
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import ClosingIterator
+
+from artifacts import document_text, parse_outputs, pdf_text
+from batch import ZipStream, iter_archive, unique_name
+from conversion_cache import ConversionCache, cache_key, save_stream
+from engines import DEFAULT_CHAINS, EngineRouter, Hwp5OdtEngine, JavaHwpxEngine, SofficeEngine, parse_chains
+from governor import JobLimits
+from jobs import DONE, FAILED, JobQueue, QueueFull
+from lo_pool import ConversionError, ConversionTimeout, LibreOfficePool, MissingOutput, ResourceLimitExceeded
+from metrics import BYTES_BUCKETS, CONTENT_TYPE, Registry
+from pdf_optimize import LEVELS as OPTIMIZE_LEVELS, ReportLog, optimize_pdf
+import profiling
+from profiling import Profiler, Timeline
+from scheduler import BATCH, INTERACTIVE
+from search_index import IndexQueue, SearchIndex
+from split_convert import SplitConverter
+from spreadsheets import (OPTION_NAMES as SHEET_OPTION_NAMES, SHEET_FORMATS, InvalidSheetOptions, SheetExport,
+                          parse_sheet_options)
+from spool import JobSpool, SpoolFull
+from text_extract import UnsupportedDocument, open_document
+from thumbnails import MIME_TYPES, render_thumbnail, supported_formats
+from uploads import ChunkedUploads, UploadError
+from warmup import WarmUp, build_snapshot, write_samples
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max
 
-ALLOWED_EXTENSIONS = {'hwp', 'hwpx', 'doc', 'docx', 'rtf', 'odt', 'txt', 'html'}
-WORK_DIR = '/data/work'
+ALLOWED_EXTENSIONS = {
+    'hwp', 'hwpx', 'doc', 'docx', 'rtf', 'odt', 'txt', 'html',
+    'xls', 'xlsx', 'ods', 'csv', 'ppt', 'pptx', 'odp',
+}
+WORK_DIR = os.environ.get('WORK_DIR', '/data/work')
+CONVERT_TIMEOUT = 120
+
+# LibreOffice worker pool (LO_POOL_SIZE=0 falls back to one soffice per request)
+LO_POOL_SIZE = int(os.environ.get('LO_POOL_SIZE', '2'))
+LO_PROFILE_DIR = os.environ.get('LO_PROFILE_DIR', '/data/lo-profiles')
+LO_BASE_PORT = int(os.environ.get('LO_BASE_PORT', '2002'))
+LO_HEALTH_INTERVAL = int(os.environ.get('LO_HEALTH_INTERVAL', '30'))
+LO_MAX_JOBS = int(os.environ.get('LO_MAX_JOBS', '200'))  # conversions before a worker is restarted, 0 = never
+LO_RECYCLE_RSS = int(os.environ.get('LO_RECYCLE_RSS_MB', '1024')) * 1024 * 1024  # idle worker size that restarts it
+
+# Per-conversion limits on every converter process (0 disables one); a job that hits one is killed.
+# soffice hosts H2Orestart's JVM, which breaks under RLIMIT_AS, so it only gets the address-space
+# cap with SOFFICE_ADDRESS_SPACE_LIMIT=1 and is otherwise held to JOB_MAX_RSS_MB by the watchdog
+JOB_LIMITS = JobLimits(
+    max_address_space=int(os.environ.get('JOB_MAX_ADDRESS_SPACE_MB', '6144')) * 1024 * 1024,
+    max_cpu_seconds=int(os.environ.get('JOB_MAX_CPU_SECONDS', '90')),
+    stall_seconds=int(os.environ.get('JOB_STALL_SECONDS', '30')),  # no CPU progress for this long
+    max_rss=int(os.environ.get('JOB_MAX_RSS_MB', '2048')) * 1024 * 1024,
+)
+SOFFICE_ADDRESS_SPACE_LIMIT = os.environ.get('SOFFICE_ADDRESS_SPACE_LIMIT', '0') == '1'
+JAVA_MAX_HEAP_MB = int(os.environ.get('JAVA_MAX_HEAP_MB', '1024'))  # -Xmx for the HWPX jar (JVMs ignore RLIMIT_AS)
+
+# Presentations and workbooks of at least SPLIT_MIN_MB are exported as page ranges on up to
+# SPLIT_MAX_CHUNKS pool workers at once and merged (0 = never); below that, one worker is faster
+SPLIT_MIN_BYTES = int(os.environ.get('SPLIT_MIN_MB', '20')) * 1024 * 1024
+SPLIT_MAX_CHUNKS = int(os.environ.get('SPLIT_MAX_CHUNKS', '4'))
+
+# Startup: worker profiles start from this snapshot (built on first start if missing),
+# then every warm-up sample is converted before /ready reports ready
+LO_PROFILE_SNAPSHOT = os.environ.get('LO_PROFILE_SNAPSHOT', '/data/lo-profile-snapshot')
+WARMUP = os.environ.get('WARMUP', '1') == '1'
+
+# Converted PDFs keyed by input hash, target format and converter version
+CACHE_DIR = os.environ.get('CACHE_DIR', '/data/cache')
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_MB', '2048')) * 1024 * 1024
+CONVERTER_VERSION = os.environ.get('CONVERTER_VERSION', 'libreoffice-h2orestart-0.7.9')
+
+# Page-1 thumbnails for document lists, cached apart from PDFs
+THUMBNAIL_CACHE_DIR = os.environ.get('THUMBNAIL_CACHE_DIR', '/data/thumbnails')
+THUMBNAIL_CACHE_MAX_BYTES = int(os.environ.get('THUMBNAIL_CACHE_MAX_MB', '256')) * 1024 * 1024
+THUMBNAIL_DEFAULT_WIDTH = 256
+THUMBNAIL_MAX_WIDTH = 1024
+THUMBNAIL_BATCH_MAX = 20
+
+# Extracted text for outputs=...,text on /convert, cached apart from PDFs and images
+TEXT_CACHE_DIR = os.environ.get('TEXT_CACHE_DIR', '/data/text')
+TEXT_CACHE_MAX_BYTES = int(os.environ.get('TEXT_CACHE_MAX_MB', '256')) * 1024 * 1024
+OUTPUTS_MAX = 10
+
+# Bounded conversion queue shared by /convert and /jobs
+QUEUE_WORKERS = int(os.environ.get('QUEUE_WORKERS', str(max(LO_POOL_SIZE, 1))))
+QUEUE_MAX = int(os.environ.get('QUEUE_MAX', '32'))
+JOB_TTL = int(os.environ.get('JOB_TTL', '3600'))  # seconds a finished job is kept
+SYNC_TIMEOUT = int(os.environ.get('SYNC_TIMEOUT', '180'))  # queue wait + conversion for /convert
+# Queued jobs start shortest-expected-first; batch work counts as this many seconds longer than
+# interactive /convert and /preview, and every second waited takes QUEUE_AGING seconds off
+QUEUE_BATCH_PENALTY = float(os.environ.get('QUEUE_BATCH_PENALTY', '60'))
+QUEUE_AGING = float(os.environ.get('QUEUE_AGING', '1'))
+
+# Batch conversions: inputs per request, unpacked archive size, jobs in flight
+BATCH_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', '200'))
+BATCH_MAX_BYTES = int(os.environ.get('BATCH_MAX_MB', '500')) * 1024 * 1024
+BATCH_PARALLELISM = int(os.environ.get('BATCH_PARALLELISM', str(QUEUE_WORKERS)))
+
+# Engine fallback chains per format, e.g. hwp=soffice,hwp5odt;hwpx=java,soffice;*=soffice
+ENGINE_CHAINS = parse_chains(os.environ.get('ENGINE_CHAINS', DEFAULT_CHAINS))
+ENGINE_MIN_SAMPLES = int(os.environ.get('ENGINE_MIN_SAMPLES', '5'))  # attempts before latency reorders a chain
+ENGINE_EXPLORE_EVERY = int(os.environ.get('ENGINE_EXPLORE_EVERY', '20'))  # 0 = never re-measure slower engines
+HWPX_JAR = os.environ.get('HWPX_JAR', '/app/hwpx-converter-1.0.0.jar')
+
+# Resumable uploads sent as checksummed chunks (same total size cap as a single upload)
+UPLOAD_DIR = os.environ.get('UPLOAD_DIR', os.path.join(WORK_DIR, 'uploads'))
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_KB', '1024')) * 1024
+UPLOAD_MIN_CHUNK_SIZE = 64 * 1024
+UPLOAD_MAX_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_TTL = int(os.environ.get('UPLOAD_TTL', '86400'))  # seconds an idle upload is kept
+
+# Per-job work dirs: inputs up to SPOOL_RAM_FILE_MB go to a tmpfs while its SPOOL_RAM_MB budget lasts,
+# the rest to SPOOL_DIR; past SPOOL_MAX_MB in all, uploads get 503 with Retry-After
+SPOOL_RAM_DIR = os.environ.get('SPOOL_RAM_DIR', '/dev/shm/hwp-converter')  # empty = disk only
+SPOOL_RAM_MAX_BYTES = int(os.environ.get('SPOOL_RAM_MB', '48')) * 1024 * 1024
+SPOOL_RAM_FILE_MAX_BYTES = int(os.environ.get('SPOOL_RAM_FILE_MB', '8')) * 1024 * 1024
+SPOOL_DIR = os.environ.get('SPOOL_DIR', os.path.join(WORK_DIR, 'jobs'))
+SPOOL_MAX_BYTES = int(os.environ.get('SPOOL_MAX_MB', '4096')) * 1024 * 1024
+
+# PDF post-processing for optimize=web|small
+OPTIMIZE_DPI = int(os.environ.get('OPTIMIZE_DPI', '150'))  # image resolution for optimize=small
+OPTIMIZE_TIMEOUT = int(os.environ.get('OPTIMIZE_TIMEOUT', '60'))
+
+# Per-phase timing of /convert in Server-Timing and a JSON log line; requests slower than
+# PROFILE_THRESHOLD seconds (0 = never) keep stack samples and child stderr in PROFILE_DIR
+PROFILE_THRESHOLD = float(os.environ.get('PROFILE_THRESHOLD', '10'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/data/debug')
+PROFILE_MAX_CAPTURES = int(os.environ.get('PROFILE_MAX_CAPTURES', '50'))
+
+# Formats /extract reads directly, without a conversion engine
+EXTRACT_EXTENSIONS = {'hwp', 'hwpx'}
+
+# Optional full-text index of extracted text (empty SEARCH_INDEX_PATH disables it)
+SEARCH_INDEX_PATH = os.environ.get('SEARCH_INDEX_PATH', '')
+SEARCH_INDEX_MAX_BYTES = int(os.environ.get('SEARCH_INDEX_MAX_MB', '256')) * 1024 * 1024
+SEARCH_DOC_MAX_CHARS = int(os.environ.get('SEARCH_DOC_MAX_CHARS', '2000000'))  # text indexed per document
+SEARCH_MAX_RESULTS = 100
+SEARCH_QUEUE_MAX = 256  # documents waiting to be indexed; more are skipped
+
+PAGE_RANGE_PATTERN = re.compile(r'^\d+(-\d+)?(,\d+(-\d+)?)*$')
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
 
 os.makedirs(WORK_DIR, exist_ok=True)
 
+registry = Registry()
+QUEUE_WAIT = registry.histogram(
+    'converter_queue_wait_seconds', 'Time a conversion waited for a queue worker', ['format', 'engine'])
+CONVERSION_DURATION = registry.histogram(
+    'converter_conversion_duration_seconds', 'Time spent inside the conversion engine', ['format', 'engine'])
+INPUT_BYTES = registry.histogram(
+    'converter_input_bytes', 'Size of converted inputs', ['format', 'engine'], BYTES_BUCKETS)
+OUTPUT_BYTES = registry.histogram(
+    'converter_output_bytes', 'Size of produced outputs', ['format', 'engine'], BYTES_BUCKETS)
+CONVERSION_ERRORS = registry.counter(
+    'converter_conversion_errors_total',
+    'Failed conversions by reason (timeout, nonzero_exit, missing_output, stalled, memory, cpu_limit)',
+    ['format', 'engine', 'reason'])
+WORKER_KILLS = registry.counter(
+    'converter_worker_kills_total', 'Converter processes killed mid-conversion', ['engine', 'reason'])
+WORKER_RECYCLES = registry.counter(
+    'converter_worker_recycles_total', 'LibreOffice workers restarted between conversions', ['engine', 'reason'])
+IN_FLIGHT = registry.gauge('converter_in_flight', 'Conversions currently running', ['engine'])
+CACHE_LOOKUPS = registry.counter('converter_cache_lookups_total', 'PDF cache lookups by result', ['result'])
+QUEUE_DEPTH = registry.gauge('converter_queue_depth', 'Conversions waiting for a queue worker')
+QUEUE_REJECTED = registry.counter('converter_queue_rejected_total', 'Submissions refused because the queue was full')
+OPTIMIZE_DURATION = registry.histogram(
+    'converter_optimize_duration_seconds', 'Time spent post-processing PDFs', ['level'])
+OPTIMIZE_INPUT_BYTES = registry.histogram(
+    'converter_optimize_input_bytes', 'PDF size before post-processing', ['level'], BYTES_BUCKETS)
+OPTIMIZE_OUTPUT_BYTES = registry.histogram(
+    'converter_optimize_output_bytes', 'PDF size after post-processing', ['level'], BYTES_BUCKETS)
+OPTIMIZE_ERRORS = registry.counter(
+    'converter_optimize_errors_total', 'Post-processing failures (the unoptimized PDF is served)', ['level'])
+ENGINE_FALLBACKS = registry.counter(
+    'converter_engine_fallbacks_total', 'Conversions handed to the next engine after a failure', ['format', 'engine'])
+
+pool = LibreOfficePool(
+    LO_POOL_SIZE, LO_PROFILE_DIR, LO_BASE_PORT, LO_HEALTH_INTERVAL, LO_PROFILE_SNAPSHOT,
+    limits=JOB_LIMITS,
+    max_jobs=LO_MAX_JOBS,
+    recycle_rss=LO_RECYCLE_RSS,
+    on_recycle=lambda reason: WORKER_RECYCLES.labels(engine='soffice', reason=reason).inc(),
+    address_space=SOFFICE_ADDRESS_SPACE_LIMIT
+)
+splitter = SplitConverter(pool, SPLIT_MIN_BYTES, SPLIT_MAX_CHUNKS, OPTIMIZE_TIMEOUT, JOB_LIMITS)
+warmup = WarmUp()
+cache = ConversionCache(CACHE_DIR, CACHE_MAX_BYTES)
+thumbnail_cache = ConversionCache(THUMBNAIL_CACHE_DIR, THUMBNAIL_CACHE_MAX_BYTES, suffix='.img')
+text_cache = ConversionCache(TEXT_CACHE_DIR, TEXT_CACHE_MAX_BYTES, suffix='.txt')
+router = EngineRouter(
+    [SofficeEngine(pool, splitter), Hwp5OdtEngine(pool, JOB_LIMITS), JavaHwpxEngine(HWPX_JAR, JOB_LIMITS, JAVA_MAX_HEAP_MB)],
+    ENGINE_CHAINS,
+    min_samples=ENGINE_MIN_SAMPLES,
+    explore_every=ENGINE_EXPLORE_EVERY,
+    on_fallback=lambda fmt, engine: ENGINE_FALLBACKS.labels(format=fmt, engine=engine).inc()
+)
+optimize_reports = ReportLog()
+sheet_reports = ReportLog()
+search_index = SearchIndex(SEARCH_INDEX_PATH, SEARCH_INDEX_MAX_BYTES)
+indexer = IndexQueue(SEARCH_QUEUE_MAX)
+jobs = JobQueue(QUEUE_WORKERS, QUEUE_MAX, JOB_TTL, QUEUE_BATCH_PENALTY, QUEUE_AGING)
+profiler = Profiler(PROFILE_DIR, PROFILE_THRESHOLD, PROFILE_MAX_CAPTURES)
+timing_log = logging.getLogger('converter.timing')
+uploads = ChunkedUploads(UPLOAD_DIR, app.config['MAX_CONTENT_LENGTH'], UPLOAD_CHUNK_SIZE,
+                         UPLOAD_MIN_CHUNK_SIZE, UPLOAD_MAX_CHUNK_SIZE, UPLOAD_TTL)
+spool = JobSpool(SPOOL_RAM_DIR, SPOOL_DIR, SPOOL_RAM_MAX_BYTES, SPOOL_MAX_BYTES, SPOOL_RAM_FILE_MAX_BYTES)
+
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def _send_pdf(pdf_path, pdf_name, cache_hit):
+    response = send_file(
+        pdf_path,
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=pdf_name,
+        conditional=True
+    )
+    response.headers['X-Cache'] = 'HIT' if cache_hit else 'MISS'
+
+    report = optimize_reports.get(pdf_path)
+    if report is not None:
+        response.headers['X-Optimize-Level'] = report['level']
+        response.headers['X-Original-Size'] = str(report['input_bytes'])
+        response.headers['X-Optimized-Size'] = str(report['output_bytes'])
+        response.headers['X-Optimize-Time'] = f"{report['seconds']:.3f}"
+
+    report = sheet_reports.get(pdf_path)
+    if report is not None:
+        if report['truncated'] is not None:
+            response.headers['X-Truncated'] = 'true' if report['truncated'] else 'false'
+        if report['omitted_rows']:
+            response.headers['X-Omitted-Rows'] = str(report['omitted_rows'])
+        if report['total_pages'] is not None:
+            response.headers['X-Total-Pages'] = str(report['total_pages'])
+    return response
+
+
+def _error_response(error):
+    if isinstance(error, ConversionTimeout):
+        return jsonify({'error': 'Conversion timeout'}), 504
+    if isinstance(error, InvalidSheetOptions):
+        return jsonify({'error': str(error), 'sheets': error.details}), 422
+    if isinstance(error, ConversionError):
+        return jsonify({
+            'error': str(error),
+            'details': error.details
+        }), 500
+    return jsonify({'error': str(error)}), 500
+
+
+def _queue_full_response(error):
+    response = jsonify({'error': str(error)})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+@app.errorhandler(SpoolFull)
+def _spool_full_response(error):
+    response = jsonify({'error': str(error)})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(jobs.retry_after())
+    return response
+
+
+def _filter_data(options):
+    """PDF export settings for a set of conversion options"""
+    filter_data = {}
+    if 'pages' in options:
+        filter_data['PageRange'] = options['pages']
+    return filter_data
+
+
+def _options_key(options):
+    return '&'.join(f'{name}={value}' for name, value in sorted(options.items()))
+
+
+def _format_of(path):
+    return os.path.splitext(path)[1].lstrip('.').lower() or 'unknown'
+
+
+def _run_engine(engine, input_path, convert):
+    """Run one engine call, recording its metrics; convert() returns the output path"""
+    labels = {'format': _format_of(input_path), 'engine': engine}
+    INPUT_BYTES.labels(**labels).observe(os.path.getsize(input_path))
+    IN_FLIGHT.labels(engine=engine).inc()
+    started = time.monotonic()
+    try:
+        output_path = convert()
+        if not os.path.exists(output_path):
+            raise MissingOutput('PDF not generated')
+    except ConversionTimeout:
+        CONVERSION_ERRORS.labels(reason='timeout', **labels).inc()
+        WORKER_KILLS.labels(engine=engine, reason='timeout').inc()
+        raise
+    except ResourceLimitExceeded as e:
+        CONVERSION_ERRORS.labels(reason=e.reason, **labels).inc()
+        WORKER_KILLS.labels(engine=engine, reason=e.reason).inc()
+        raise
+    except MissingOutput:
+        CONVERSION_ERRORS.labels(reason='missing_output', **labels).inc()
+        raise
+    except ConversionError:
+        CONVERSION_ERRORS.labels(reason='nonzero_exit', **labels).inc()
+        raise
+    finally:
+        IN_FLIGHT.labels(engine=engine).dec()
+        CONVERSION_DURATION.labels(**labels).observe(time.monotonic() - started)
+
+    OUTPUT_BYTES.labels(**labels).observe(os.path.getsize(output_path))
+    return output_path
+
+
+def _convert_cached(input_path, job_dir, key, options):
+    """Convert down the format's engine chain and store the PDF under key"""
+    filter_data = _filter_data(options)
+    sheet = SheetExport.for_format(_format_of(input_path), options)
+    pdf_path, engine = router.convert(
+        _format_of(input_path),
+        lambda engine: _run_engine(
+            engine.name, input_path,
+            lambda: engine.convert(input_path, job_dir, CONVERT_TIMEOUT, filter_data, sheet)),
+        filter_data)
+    app.logger.info(f"Converted {os.path.basename(input_path)} with {engine}")
+    profiling.note(engine=engine)
+
+    report = None
+    if 'optimize' in options:
+        with profiling.phase('optimize'):
+            pdf_path, report = _optimize(pdf_path, job_dir, options['optimize'])
+
+    # A failed optimization is not what was asked for, so keep it out of the cache
+    if report is not None or 'optimize' not in options:
+        try:
+            with profiling.phase('cache'):
+                pdf_path = cache.put(key, pdf_path)
+        except OSError as e:
+            app.logger.warning(f"Could not cache {pdf_path}: {e}")
+
+    if report is not None:
+        optimize_reports.put(pdf_path, report)
+    if sheet is not None and sheet.report is not None:
+        sheet_reports.put(pdf_path, sheet.report)
+    return pdf_path
+
+
+def _optimize(pdf_path, job_dir, level):
+    """Post-process a PDF; on failure keep the PDF as converted"""
+    try:
+        optimized_path, report = optimize_pdf(pdf_path, job_dir, level, OPTIMIZE_DPI, OPTIMIZE_TIMEOUT, JOB_LIMITS)
+    except ConversionError as e:
+        OPTIMIZE_ERRORS.labels(level=level).inc()
+        app.logger.warning(f"optimize={level} failed for {pdf_path}: {e} {e.details}")
+        return pdf_path, None
+
+    OPTIMIZE_DURATION.labels(level=level).observe(report['seconds'])
+    OPTIMIZE_INPUT_BYTES.labels(level=level).observe(report['input_bytes'])
+    OPTIMIZE_OUTPUT_BYTES.labels(level=level).observe(report['output_bytes'])
+    return optimized_path, report
+
+
+def _own_result(pdf_path, job_dir):
+    """The job's own path to a PDF it hands out: a hard link, or a copy across filesystems, in job_dir
+
+    A finished job may be fetched until JOB_TTL runs out, by which time the
+    cache may have evicted its PDF, or the leader a coalesced job followed
+    may have released its job dir; the job dir lasts as long as the job.
+    """
+    if os.path.dirname(os.path.abspath(pdf_path)) == os.path.abspath(job_dir):
+        return pdf_path
+    own_path = os.path.join(job_dir, os.path.basename(pdf_path))
+    try:
+        os.link(pdf_path, own_path)
+    except OSError:
+        shutil.copyfile(pdf_path, own_path)
+    for reports in (optimize_reports, sheet_reports):
+        report = reports.get(pdf_path)
+        if report is not None:
+            reports.put(own_path, report)
+    return own_path
+
+
+def _conversion_options(default_pages=None):
+    """Read conversion options from the query string or form
+
+    Returns (options, None) on success or (None, error_response).
+    """
+    options = {}
+
+    pages = request.values.get('pages', default_pages)
+    if pages:
+        pages = pages.replace(' ', '')
+        if not PAGE_RANGE_PATTERN.match(pages):
+            return None, (jsonify({'error': 'Invalid pages, expected e.g. 1-3 or 1,4-5'}), 400)
+        options['pages'] = pages
+
+    optimize = request.values.get('optimize', 'none').lower()
+    if optimize not in OPTIMIZE_LEVELS:
+        return None, (jsonify({'error': f'optimize must be one of {list(OPTIMIZE_LEVELS)}'}), 400)
+    if optimize != 'none':
+        options['optimize'] = optimize
+
+    # Spreadsheet options; _submit drops them for other formats
+    try:
+        options.update(parse_sheet_options(request.values, options.get('pages')))
+    except ValueError as e:
+        return None, (jsonify({'error': str(e)}), 400)
+
+    return options, None
+
+
+class UploadRejected(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _stream_size(stream):
+    """Bytes left in a seekable stream, or None"""
+    try:
+        position = stream.tell()
+        size = stream.seek(0, os.SEEK_END) - position
+        stream.seek(position)
+        return size
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def _store_upload(file):
+    """Validate one uploaded file and stream it into a fresh job dir"""
+    return _store_stream(file.stream, file.filename, _stream_size(file.stream))
+
+
+def _store_stream(stream, original_name, size_hint=None):
+    if original_name == '':
+        raise UploadRejected('No file selected')
+
+    if not allowed_file(original_name):
+        raise UploadRejected(f'File type not allowed. Allowed: {ALLOWED_EXTENSIONS}')
+
+    # Create unique work directory (raises SpoolFull)
+    job_dir = spool.create(size_hint)
+
+    try:
+        # Save uploaded file; secure_filename drops non-ASCII names entirely,
+        # so keep the extension apart to route and extract by format
+        stem, ext = os.path.splitext(original_name)
+        filename = (secure_filename(stem) or 'document') + ext.lower()
+        input_path = os.path.join(job_dir, filename)
+        content_hash = save_stream(stream, input_path)
+    except Exception as e:
+        spool.release(job_dir)
+        raise UploadRejected(str(e), 500)
+
+    return {
+        'job_dir': job_dir,
+        'input_path': input_path,
+        'pdf_name': os.path.splitext(filename)[0] + '.pdf',
+        'content_hash': content_hash,
+    }
+
+
+def _accept_upload():
+    """Validate and store the uploaded `file` field
+
+    Returns (upload, None) on success or (None, error_response).
+    """
+    if 'file' not in request.files:
+        return None, (jsonify({'error': 'No file provided'}), 400)
+
+    try:
+        return _store_upload(request.files['file']), None
+    except UploadRejected as e:
+        return None, (jsonify({'error': str(e)}), e.status_code)
+
+
+def _copy_upload(upload):
+    """Give an accepted upload a second job dir so two jobs can own it"""
+    job_dir = spool.create(os.path.getsize(upload['input_path']), near=upload['job_dir'])
+    input_path = os.path.join(job_dir, os.path.basename(upload['input_path']))
+    os.link(upload['input_path'], input_path)
+    return dict(upload, job_dir=job_dir, input_path=input_path)
+
+
+def _index_text(upload, pdf_path=None):
+    """Add an upload's text to the search index; runs on the indexer thread
+
+    HWP/HWPX text is read from the document itself; other formats are
+    indexed from pdf_path, a PDF of the whole document.
+    """
+    fmt = _format_of(upload['input_path'])
+    try:
+        if fmt in EXTRACT_EXTENSIONS:
+            text = document_text(upload['input_path'], SEARCH_DOC_MAX_CHARS)
+        else:
+            text_dir = os.path.join(upload['job_dir'], 'index')
+            os.makedirs(text_dir, exist_ok=True)
+            with open(pdf_text(pdf_path, text_dir, limits=JOB_LIMITS), encoding='utf-8', errors='replace') as f:
+                text = f.read(SEARCH_DOC_MAX_CHARS).replace('\f', '\n')
+        search_index.add(upload['content_hash'], os.path.basename(upload['input_path']), fmt, text)
+    except Exception as e:
+        app.logger.warning(f"Could not index {upload['input_path']}: {e}")
+
+
+def _index_later(upload, pdf_path=None):
+    """Queue _index_text to run after the job, holding the upload's job dir until it has
+
+    Other formats than HWP/HWPX are skipped without pdf_path, as are
+    documents whose hash is indexed already.
+    """
+    if _format_of(upload['input_path']) not in EXTRACT_EXTENSIONS and pdf_path is None:
+        return
+    if search_index.contains(upload['content_hash']):
+        return
+    job_dir = upload['job_dir']
+    spool.hold(job_dir)
+
+    def index():
+        try:
+            _index_text(upload, pdf_path)
+        finally:
+            spool.release(job_dir)
+
+    if not indexer.submit(index):
+        spool.release(job_dir)
+
+
+# Options that convert only part of a document; such jobs neither train the queue's cost
+# estimates nor feed the search index
+PARTIAL_OPTIONS = ('pages', 'sheets', 'max_pages', 'max_rows')
+
+
+def _submit(upload, options, lane=BATCH):
+    """Queue a conversion for an accepted upload; cache hits finish immediately
+
+    An upload identical to one already queued or running (same cache key)
+    follows that job instead of taking a queue slot of its own.
+    """
+    job_dir = upload['job_dir']
+    cleanup = functools.partial(spool.release, job_dir)
+    fmt = _format_of(upload['input_path'])
+    if fmt not in SHEET_FORMATS:
+        # They don't apply, so they must neither split the cache key nor make the job partial
+        options = {name: value for name, value in options.items() if name not in SHEET_OPTION_NAMES}
+    key = cache_key(upload['content_hash'], 'pdf', CONVERTER_VERSION, _options_key(options))
+
+    cached_path = cache.get(key)
+    sheet = SheetExport.for_format(fmt, options)
+    if cached_path and sheet is not None and sheet.truncates and sheet_reports.get(cached_path) is None:
+        cached_path = None  # Its truncation report is gone (e.g. after a restart); convert again for the headers
+    CACHE_LOOKUPS.labels(result='hit' if cached_path else 'miss').inc()
+    if cached_path:
+        try:
+            own_path = _own_result(cached_path, job_dir)
+        except OSError as e:
+            app.logger.warning(f"Cached {cached_path} is gone, converting again: {e}")
+        else:
+            return jobs.add_finished(own_path, upload['pdf_name'], cleanup, cache_hit=True)
+
+    submitted = time.monotonic()
+    timeline = profiling.current()
+
+    def run():
+        # Phases recorded while converting belong to the request that queued the job
+        with profiling.bind(timeline):
+            waited = time.monotonic() - submitted
+            QUEUE_WAIT.labels(format=fmt, engine=router.preferred(fmt)).observe(waited)
+            profiling.add_phase('queue', waited)
+            pdf_path = _own_result(_convert_cached(upload['input_path'], job_dir, key, options), job_dir)
+        if search_index.enabled:
+            _index_later(upload, None if partial else pdf_path)
+        return pdf_path
+
+    partial = any(name in options for name in PARTIAL_OPTIONS)
+    try:
+        job = jobs.submit(run, upload['pdf_name'], cleanup, lane, fmt, os.path.getsize(upload['input_path']),
+                          key=key, share=lambda pdf_path: _own_result(pdf_path, job_dir),
+                          costed=not partial)
+    except QueueFull:
+        QUEUE_REJECTED.labels().inc()
+        cleanup()
+        raise
+    if job.leader is not None:
+        profiling.note(coalesced=True)
+    return job
+
+
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({'status': 'ok'})
+    return jsonify({
+        'status': 'ok',
+        'ready': warmup.ready,
+        'libreoffice': pool.status(),
+        'engines': router.stats(),
+        'split': splitter.stats(),
+        'cache': cache.stats(),
+        'thumbnail_cache': thumbnail_cache.stats(),
+        'text_cache': text_cache.stats(),
+        'queue': jobs.stats(),
+        'uploads': uploads.stats(),
+        'spool': spool.stats(),
+        'search': search_index.stats(),
+        'indexer': indexer.stats(),
+    })
+
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """200 once startup warm-up has finished; 503 until then (unlike /health, which only means the process is up)"""
+    status = warmup.status()
+    if not status['ready']:
+        response = jsonify(dict(status, status='warming'))
+        response.status_code = 503
+        response.headers['Retry-After'] = '5'
+        return response
+    return jsonify(dict(status, status='ready'))
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    QUEUE_DEPTH.labels().set(jobs.stats()['queued'])
+    return Response(registry.render(), content_type=CONTENT_TYPE)
+
+
+@app.route('/results/<content_hash>', methods=['GET'])
+def result_by_hash(content_hash):
+    """Cached output for a document the server has converted before
+
+    Clients hash the file first and GET (or HEAD) this before uploading it;
+    a 404 means the document has to be sent to /convert. The ETag is the
+    cache key, so If-None-Match revalidation is answered with 304. `pages`
+    selects the same page-range variant as on /convert, `name` the
+    download name.
+    """
+    content_hash = content_hash.lower()
+    if not SHA256_PATTERN.match(content_hash):
+        return jsonify({'error': 'Expected a hex SHA-256'}), 400
+    if request.args.get('format', 'pdf') != 'pdf':
+        return jsonify({'error': 'format must be pdf'}), 400
+
+    options, error = _conversion_options()
+    if error:
+        return error
+
+    key = cache_key(content_hash, 'pdf', CONVERTER_VERSION, _options_key(options))
+    pdf_path = cache.get(key)
+    CACHE_LOOKUPS.labels(result='hit' if pdf_path else 'miss').inc()
+    if pdf_path is None:
+        return jsonify({'error': 'Not converted yet', 'sha256': content_hash}), 404
+
+    pdf_name = (secure_filename(os.path.splitext(request.args.get('name', ''))[0]) or 'document') + '.pdf'
+    response = send_file(
+        pdf_path,
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=pdf_name,
+        conditional=True,
+        etag=key
+    )
+    response.headers['X-Cache'] = 'HIT'
+    response.headers['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+
+def _wait_and_send(job):
+    try:
+        if not job.wait(SYNC_TIMEOUT):
+            return jsonify({'error': 'Conversion timeout'}), 504
+        if job.status == FAILED:
+            return _error_response(job.error)
+        return _send_pdf(job.result, job.download_name, job.cache_hit)
+    finally:
+        # send_file already holds the PDF open, so the job dir can go now
+        jobs.discard(job)
+
+
+def _timed(route):
+    """Time a route's phases: Server-Timing header, one JSON log line, a capture if slow
+
+    The header goes out with the response, so it covers everything up to
+    the send; the log line is written once the body has been sent and adds
+    the send phase.
+    """
+    @functools.wraps(route)
+    def timed(*args, **kwargs):
+        timeline = Timeline(request.method, request.path)
+        profiler.begin(timeline)
+        try:
+            with profiling.bind(timeline):
+                response = make_response(route(*args, **kwargs))
+        except BaseException:
+            profiler.end(timeline)
+            raise
+
+        timeline.note(status=response.status_code, output_bytes=response.content_length)
+        response.headers['Server-Timing'] = timeline.server_timing()
+        response.headers['X-Request-Id'] = timeline.id
+        sending = time.monotonic()
+
+        def finish():
+            timeline.add('send', time.monotonic() - sending)
+            record = timeline.to_dict()
+            capture = profiler.end(timeline)
+            if capture:
+                record['profile'] = capture
+            timing_log.info(json.dumps(record, ensure_ascii=False))
+
+        # Not call_on_close: send_file's passthrough body never calls Response.close
+        response.response = ClosingIterator(response.response, finish)
+        return response
+    return timed
 
 
 @app.route('/convert', methods=['POST'])
+@_timed
 def convert():
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file provided'}), 400
+    """Synchronous conversion: queue the upload and wait for its PDF
 
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({'error': 'No file selected'}), 400
+    Every allowed format is accepted here; the engine is picked from the
+    format's ENGINE_CHAINS entry. Optional `pages` (e.g. 1-3) exports only
+    that page range; `optimize=web` linearizes the PDF and `optimize=small`
+    also subsets fonts and downsamples images to OPTIMIZE_DPI.
 
-    if not allowed_file(file.filename):
-        return jsonify({'error': f'File type not allowed. Allowed: {ALLOWED_EXTENSIONS}'}), 400
+    Spreadsheets also take `sheets` (names or 1-based positions, comma
+    separated), `fit_width=1`, `used_range=1` (print only cells with
+    content), `max_rows` per sheet and `max_pages`; when rows or pages are
+    cut, X-Truncated is true and X-Omitted-Rows / X-Total-Pages say how
+    much. These need the LibreOffice worker pool.
 
-    # Create unique work directory
-    job_id = str(uuid.uuid4())
-    job_dir = os.path.join(WORK_DIR, job_id)
-    os.makedirs(job_dir, exist_ok=True)
+    `outputs` (e.g. pdf,png:page1,text) asks for several artifacts of the
+    document at once; see _convert_outputs.
+    """
+    options, error = _conversion_options()
+    if error:
+        return error
+
+    outputs = None
+    if request.values.get('outputs'):
+        try:
+            outputs = parse_outputs(request.values['outputs'], supported_formats(), OUTPUTS_MAX)
+            width = int(request.values.get('width', THUMBNAIL_DEFAULT_WIDTH))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if not 16 <= width <= THUMBNAIL_MAX_WIDTH:
+            return jsonify({'error': f'width must be between 16 and {THUMBNAIL_MAX_WIDTH}'}), 400
+
+    with profiling.phase('upload'):
+        request.files  # Reading the multipart body happens here
+    with profiling.phase('save'):
+        upload, error = _accept_upload()
+    if error:
+        return error
+    profiling.note(format=_format_of(upload['input_path']), input_bytes=os.path.getsize(upload['input_path']),
+                   sha256=upload['content_hash'])
+
+    if outputs:
+        return _convert_outputs(upload, options, outputs, width)
 
     try:
-        # Save uploaded file
-        filename = secure_filename(file.filename)
-        input_path = os.path.join(job_dir, filename)
-        file.save(input_path)
-
-        # Convert to PDF
-        result = subprocess.run(
-            ['soffice', '--headless', '--convert-to', 'pdf', input_path, '--outdir', job_dir],
-            capture_output=True,
-            text=True,
-            timeout=120
-        )
-
-        if result.returncode != 0:
-            return jsonify({
-                'error': 'Conversion failed',
-                'details': result.stderr
-            }), 500
-
-        # Find output PDF
-        pdf_name = os.path.splitext(filename)[0] + '.pdf'
-        pdf_path = os.path.join(job_dir, pdf_name)
-
-        if not os.path.exists(pdf_path):
-            return jsonify({'error': 'PDF not generated'}), 500
-
-        # Return PDF file
-        return send_file(
-            pdf_path,
-            mimetype='application/pdf',
-            as_attachment=True,
-            download_name=pdf_name
-        )
-
-    except subprocess.TimeoutExpired:
-        return jsonify({'error': 'Conversion timeout'}), 504
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        job = _submit(upload, options, INTERACTIVE)
+    except QueueFull as e:
+        return _queue_full_response(e)
+
+    return _wait_and_send(job)
+
+
+def _output_key(content_hash, output, options, width):
+    if output.kind == 'pdf':
+        return cache_key(content_hash, 'pdf', CONVERTER_VERSION, _options_key(options))
+    # Images and text depend on what was exported (pages, sheets), not on PDF optimization
+    exported = _options_key({name: value for name, value in options.items() if name != 'optimize'})
+    if output.kind == 'image':
+        return _thumbnail_key(content_hash, width, output.format, output.page, exported)
+    return cache_key(content_hash, 'text', CONVERTER_VERSION, exported)
+
+
+def _output_cache(output):
+    return {'pdf': cache, 'image': thumbnail_cache, 'text': text_cache}[output.kind]
+
+
+def _read_output(output, path, cache_status):
+    item = {'output': output.name, 'status': 'ok', 'cache': cache_status, 'bytes': os.path.getsize(path)}
+    if output.kind == 'text':
+        with open(path, encoding='utf-8') as f:
+            item.update(content_type='text/plain; charset=utf-8', text=f.read())
+    else:
+        item.update(content_type='application/pdf' if output.kind == 'pdf' else MIME_TYPES[output.format],
+                    data=_read_thumbnail(path))
+    return item
+
+
+def _convert_outputs(upload, options, outputs, width):
+    """Several artifacts of one upload from a single engine load, as JSON
+
+    Artifacts already cached are answered from their caches. Everything
+    else comes from one conversion: the PDF is converted (or found in the
+    cache) once, then page images are rendered from it and text is taken
+    from it with pdftotext. HWP/HWPX text without `pages` is read straight
+    from the document instead. With `pages`, page<n> counts within the
+    exported range. Each artifact is cached on its own, keyed by content
+    hash, so later requests for any subset are hits.
+    """
+    content_hash = upload['content_hash']
+    job_dir = upload['job_dir']
+    direct_text = _format_of(upload['input_path']) in EXTRACT_EXTENSIONS and 'pages' not in options
+
+    items = {}
+    missing = []
+    for output in outputs:
+        key = _output_key(content_hash, output, options, width)
+        path = _output_cache(output).get(key)
+        if path:
+            items[output.name] = _read_output(output, path, 'HIT')
+        else:
+            missing.append((output, key))
+
+    job = None
+    try:
+        pdf_path = None
+        pdf_cache = 'MISS'
+        if any(output.kind != 'text' or not direct_text for output, _ in missing):
+            try:
+                job = _submit(upload, options, INTERACTIVE)
+            except QueueFull as e:
+                return _queue_full_response(e)
+            if not job.wait(SYNC_TIMEOUT):
+                return jsonify({'error': 'Conversion timeout'}), 504
+            if job.status == FAILED:
+                return _error_response(job.error)
+            pdf_path = job.result
+            pdf_cache = 'HIT' if job.cache_hit else 'MISS'
+
+        for output, key in missing:
+            try:
+                if output.kind == 'pdf':
+                    path = pdf_path
+                elif output.kind == 'image':
+                    with profiling.phase('render'):
+                        path = render_thumbnail(pdf_path, job_dir, width, output.format, limits=JOB_LIMITS,
+                                                page=output.page)
+                elif direct_text:
+                    path = os.path.join(job_dir, 'text.txt')
+                    with profiling.phase('text'), open(path, 'w', encoding='utf-8') as f:
+                        f.write(document_text(upload['input_path']))
+                else:
+                    with profiling.phase('text'):
+                        path = pdf_text(pdf_path, job_dir, limits=JOB_LIMITS)
+            except (ConversionError, UnsupportedDocument) as e:
+                items[output.name] = {'output': output.name, 'status': 'error', 'error': str(e)}
+                continue
+
+            if output.kind != 'pdf':
+                try:
+                    path = _output_cache(output).put(key, path)
+                except OSError as e:
+                    app.logger.warning(f"Could not cache {output.name} of {content_hash}: {e}")
+            items[output.name] = _read_output(output, path, pdf_cache if output.kind == 'pdf' else 'MISS')
     finally:
-        # Cleanup (keep for debugging in dev, remove in prod)
-        import shutil
-        shutil.rmtree(job_dir, ignore_errors=True)
+        if job is not None:
+            jobs.discard(job)
+        else:
+            spool.release(job_dir)
+
+    return jsonify({
+        'sha256': content_hash,
+        'width': width,
+        'outputs': [items[output.name] for output in outputs],
+    })
+
+
+@app.route('/preview', methods=['POST'])
+def preview():
+    """Fast first-page PDF (or `pages`), cached apart from full conversions
+
+    With `full=1` the full conversion is queued as a job as well; its id is
+    returned in X-Full-Job-Id so the client can fetch it from /jobs.
+    """
+    options, error = _conversion_options(default_pages='1')
+    if error:
+        return error
+
+    upload, error = _accept_upload()
+    if error:
+        return error
+
+    full_upload = None
+    if request.values.get('full') == '1':
+        try:
+            full_upload = _copy_upload(upload)
+        except SpoolFull:
+            pass  # As with a full queue below, the preview goes ahead alone
+
+    try:
+        job = _submit(upload, options, INTERACTIVE)
+    except QueueFull as e:
+        if full_upload:
+            spool.release(full_upload['job_dir'])
+        return _queue_full_response(e)
+
+    # Queued after the preview so page 1 is never stuck behind the full export
+    full_job = None
+    if full_upload:
+        try:
+            full_job = _submit(full_upload, {})
+        except QueueFull:
+            pass  # The preview still matters; the client can request the full PDF later
+
+    response = make_response(_wait_and_send(job))
+    if full_job is not None:
+        response.headers['X-Full-Job-Id'] = full_job.id
+        response.headers['X-Full-Job-Url'] = url_for('job_status', job_id=full_job.id)
+    return response
+
+
+def _extract_text(document):
+    try:
+        for _, text in document.paragraphs():
+            yield text + '\n'
+    finally:
+        document.close()
+
+
+def _extract_json(document):
+    """Stream {"format", "sections": [{"index", "paragraphs"}]} paragraph by paragraph"""
+    try:
+        yield '{"format": %s, "sections": [' % json.dumps(document.format)
+        current = None
+        for section, text in document.paragraphs():
+            if section != current:
+                if current is not None:
+                    yield ']}, '
+                yield '{"index": %d, "paragraphs": [' % section
+                current = section
+            else:
+                yield ', '
+            yield json.dumps(text, ensure_ascii=False)
+        if current is not None:
+            yield ']}'
+        yield ']}'
+    finally:
+        document.close()
+
+
+@app.route('/extract', methods=['POST'])
+def extract():
+    """Plain text (`format=text`, default) or JSON paragraphs of an HWP/HWPX file
+
+    Read straight from the document, without LibreOffice; the response is
+    streamed a paragraph at a time.
+    """
+    fmt = request.values.get('format', 'text').lower()
+    if fmt not in ('text', 'json'):
+        return jsonify({'error': 'format must be text or json'}), 400
+
+    upload, error = _accept_upload()
+    if error:
+        return error
+
+    job_dir = upload['job_dir']
+    if _format_of(upload['input_path']) not in EXTRACT_EXTENSIONS:
+        spool.release(job_dir)
+        return jsonify({'error': f'Text extraction supports {sorted(EXTRACT_EXTENSIONS)} only'}), 400
+
+    try:
+        document = open_document(upload['input_path'])
+    except UnsupportedDocument as e:
+        spool.release(job_dir)
+        return jsonify({'error': str(e)}), 422
+
+    def generate():
+        try:
+            yield from (_extract_json if fmt == 'json' else _extract_text)(document)
+        except Exception as e:
+            # Headers are gone already; the client sees a truncated body
+            app.logger.error(f"Extraction of {upload['input_path']} failed mid-stream: {e}")
+        finally:
+            if search_index.enabled:
+                _index_later(upload)
+            spool.release(job_dir)
+
+    response = Response(
+        generate(),
+        mimetype='application/json' if fmt == 'json' else 'text/plain',
+    )
+    response.headers['X-Content-SHA256'] = upload['content_hash']
+    return response
+
+
+@app.route('/search', methods=['GET'])
+def search():
+    """Documents whose extracted text matches every word of `q`, best first
+
+    Each result has the document's sha256 (usable with /thumbnail) and a
+    snippet with matches wrapped in <mark>. `limit` defaults to 20.
+    """
+    if not search_index.enabled:
+        return jsonify({'error': 'Search index disabled'}), 503
+
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'error': 'No query provided'}), 400
+    try:
+        limit = int(request.args.get('limit', '20'))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    if not 1 <= limit <= SEARCH_MAX_RESULTS:
+        return jsonify({'error': f'limit must be between 1 and {SEARCH_MAX_RESULTS}'}), 400
+
+    return jsonify({'query': q, 'results': search_index.search(q, limit)})
+
+
+def _thumbnail_key(content_hash, width, fmt, page=1, exported=''):
+    target = f'thumbnail.{fmt}' if page == 1 else f'page{page}.{fmt}'
+    return cache_key(content_hash, target, CONVERTER_VERSION, f'width={width}' + (f'&{exported}' if exported else ''))
+
+
+def _read_thumbnail(path):
+    with open(path, 'rb') as f:
+        return base64.b64encode(f.read()).decode('ascii')
+
+
+@app.route('/thumbnail', methods=['POST'])
+def thumbnail():
+    """Page-1 thumbnails for a batch of documents in one round trip
+
+    Send documents as repeated `file` fields, and/or the SHA-256 of documents
+    sent before as repeated `sha256` fields (answered from cache only).
+    `width` (default 256) and `format` (png|webp) apply to the whole batch.
+    """
+    try:
+        width = int(request.values.get('width', THUMBNAIL_DEFAULT_WIDTH))
+    except ValueError:
+        return jsonify({'error': 'width must be an integer'}), 400
+    if not 16 <= width <= THUMBNAIL_MAX_WIDTH:
+        return jsonify({'error': f'width must be between 16 and {THUMBNAIL_MAX_WIDTH}'}), 400
+
+    fmt = request.values.get('format', 'png').lower()
+    if fmt not in supported_formats():
+        return jsonify({'error': f'format must be one of {supported_formats()}'}), 400
+
+    files = request.files.getlist('file')
+    hashes = [value.lower() for value in request.values.getlist('sha256')]
+    if not all(SHA256_PATTERN.match(content_hash) for content_hash in hashes):
+        return jsonify({'error': 'sha256 must be a hex SHA-256'}), 400
+    if not files and not hashes:
+        return jsonify({'error': 'No file or sha256 provided'}), 400
+    if len(files) + len(hashes) > THUMBNAIL_BATCH_MAX:
+        return jsonify({'error': f'At most {THUMBNAIL_BATCH_MAX} documents per request'}), 400
+
+    results = []
+    for content_hash in hashes:
+        path = thumbnail_cache.get(_thumbnail_key(content_hash, width, fmt))
+        if path:
+            results.append({'sha256': content_hash, 'status': 'ok', 'cache': 'HIT', 'data': _read_thumbnail(path)})
+        else:
+            results.append({'sha256': content_hash, 'status': 'missing'})
+
+    # Queue every uncached document first so their page-1 exports run in parallel
+    pending = []
+    for file in files:
+        item = {'name': file.filename}
+        results.append(item)
+        try:
+            upload = _store_upload(file)
+        except UploadRejected as e:
+            item.update(status='error', error=str(e))
+            continue
+        except SpoolFull as e:
+            item.update(status='error', error=str(e), retry_after=jobs.retry_after())
+            continue
+
+        item['sha256'] = upload['content_hash']
+        key = _thumbnail_key(upload['content_hash'], width, fmt)
+        path = thumbnail_cache.get(key)
+        if path:
+            item.update(status='ok', cache='HIT', data=_read_thumbnail(path))
+            spool.release(upload['job_dir'])
+            continue
+
+        try:
+            pending.append((item, key, upload, _submit(upload, {'pages': '1'})))
+        except QueueFull as e:
+            item.update(status='error', error=str(e), retry_after=e.retry_after)
+
+    for item, key, upload, job in pending:
+        try:
+            if not job.wait(SYNC_TIMEOUT):
+                item.update(status='error', error='Conversion timeout')
+                continue
+            if job.status == FAILED:
+                item.update(status='error', error=str(job.error))
+                continue
+            image_path = render_thumbnail(job.result, upload['job_dir'], width, fmt, limits=JOB_LIMITS)
+            try:
+                image_path = thumbnail_cache.put(key, image_path)
+            except OSError as e:
+                app.logger.warning(f"Could not cache thumbnail for {item['name']}: {e}")
+            item.update(status='ok', cache='MISS', data=_read_thumbnail(image_path))
+        except ConversionError as e:
+            item.update(status='error', error=str(e))
+        finally:
+            jobs.discard(job)
+
+    return jsonify({'content_type': MIME_TYPES[fmt], 'width': width, 'thumbnails': results})
+
+
+def _discard_batch(entries):
+    for entry in entries:
+        if 'upload' in entry:
+            spool.release(entry.pop('upload')['job_dir'])
+
+
+def _add_batch_entry(entries, name, stream, size_hint=None):
+    if len(entries) >= BATCH_MAX_FILES:
+        raise UploadRejected(f'At most {BATCH_MAX_FILES} documents per batch')
+
+    entry = {'name': name}
+    entries.append(entry)
+    try:
+        entry['upload'] = _store_stream(stream, name, size_hint)
+        entry['sha256'] = entry['upload']['content_hash']
+    except UploadRejected as e:
+        entry.update(status='error', error=str(e))
+    except SpoolFull as e:
+        entry.update(status='error', error=str(e), retry_after=jobs.retry_after())
+
+
+def _collect_batch(entries, archive):
+    """Add every document of an uploaded zip archive to the batch"""
+    archive_dir = spool.create(_stream_size(archive.stream))
+    try:
+        archive_path = os.path.join(archive_dir, 'archive.zip')
+        archive.save(archive_path)
+        for name, size, stream in iter_archive(archive_path, BATCH_MAX_FILES, BATCH_MAX_BYTES):
+            _add_batch_entry(entries, name, stream, size)
+    except (ValueError, zipfile.BadZipFile) as e:
+        entries.append({'name': archive.filename, 'status': 'error', 'error': f'Unreadable archive: {e}'})
+    finally:
+        spool.release(archive_dir)
+
+
+def _finish_batch_entry(archive, entry, job, used_names):
+    if not job.wait(SYNC_TIMEOUT):
+        entry.update(status='error', error='Conversion timeout')
+    elif job.status == FAILED:
+        entry.update(status='error', error=str(job.error))
+    else:
+        pdf_name = unique_name(job.download_name, used_names)
+        # PDFs are already compressed
+        archive.write(job.result, pdf_name, compress_type=zipfile.ZIP_STORED)
+        entry.update(status='ok', pdf=pdf_name, cache='HIT' if job.cache_hit else 'MISS')
+        report = sheet_reports.get(job.result)
+        if report is not None and report['truncated'] is not None:
+            entry['truncated'] = report['truncated']
+
+
+@app.route('/batch', methods=['POST'])
+def batch():
+    """Convert many documents in one request and stream back a zip of PDFs
+
+    Send documents as repeated `file` fields and/or zip archives as `archive`
+    fields. The response zip holds one PDF per converted document plus a
+    manifest.json with a status for every input, so one bad document does
+    not fail the batch. `pages` and the spreadsheet options apply to every document.
+    """
+    options, error = _conversion_options()
+    if error:
+        return error
+
+    files = request.files.getlist('file')
+    archives = request.files.getlist('archive')
+    if not files and not archives:
+        return jsonify({'error': 'No file or archive provided'}), 400
+
+    entries = []
+    try:
+        for file in files:
+            _add_batch_entry(entries, file.filename, file.stream, _stream_size(file.stream))
+        for archive in archives:
+            _collect_batch(entries, archive)
+    except UploadRejected as e:
+        _discard_batch(entries)
+        return jsonify({'error': str(e)}), e.status_code
+    except SpoolFull:
+        _discard_batch(entries)
+        raise
+
+    def generate():
+        stream = ZipStream()
+        used_names = {'manifest.json'}
+        pending = deque(entry for entry in entries if 'upload' in entry)
+        running = deque()
+        try:
+            with zipfile.ZipFile(stream, 'w') as archive:
+                while pending or running:
+                    # Keep up to BATCH_PARALLELISM documents on the conversion queue
+                    while pending and len(running) < BATCH_PARALLELISM:
+                        try:
+                            running.append((pending[0], _submit(pending[0]['upload'], options)))
+                        except QueueFull as e:
+                            if running:
+                                break
+                            time.sleep(min(e.retry_after, 5))
+                            continue
+                        pending.popleft()
+
+                    entry, job = running.popleft()
+                    try:
+                        _finish_batch_entry(archive, entry, job, used_names)
+                    finally:
+                        entry.pop('upload')
+                        jobs.discard(job)
+                    yield stream.pop()
+
+                archive.writestr('manifest.json', json.dumps({'documents': entries}, ensure_ascii=False, indent=2))
+            yield stream.pop()
+        finally:
+            # Client went away mid-stream: drop what has not been converted yet
+            for _, job in running:
+                jobs.discard(job)
+            _discard_batch(pending)
+
+    return Response(
+        generate(),
+        mimetype='application/zip',
+        headers={'Content-Disposition': 'attachment; filename=converted.zip'}
+    )
+
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Asynchronous conversion: queue the upload and return a job id"""
+    options, error = _conversion_options()
+    if error:
+        return error
+
+    upload, error = _accept_upload()
+    if error:
+        return error
+
+    try:
+        job = _submit(upload, options)
+    except QueueFull as e:
+        return _queue_full_response(e)
+
+    response = jsonify(_job_status(job))
+    response.status_code = 202
+    response.headers['Location'] = url_for('job_status', job_id=job.id)
+    return response
+
+
+def _job_status(job):
+    data = job.to_dict()
+    data['status_url'] = url_for('job_status', job_id=job.id)
+    data['result_url'] = url_for('job_result', job_id=job.id)
+    return data
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(_job_status(job))
+
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """PDF of a finished job; Range requests get 206 so large downloads can resume"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job.status == FAILED:
+        return _error_response(job.error)
+    if job.status != DONE:
+        response = jsonify({'error': 'Job not finished', 'status': job.status})
+        response.status_code = 409
+        response.headers['Retry-After'] = '1'
+        return response
+    return _send_pdf(job.result, job.download_name, job.cache_hit)
+
+
+def _int_value(name, default=None):
+    value = request.values.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise UploadError(f'{name} must be an integer')
+
+
+def _read_up_to(stream, size):
+    """Up to size bytes of stream; a single read may return fewer before the end (e.g. under a2wsgi)"""
+    parts = []
+    remaining = size
+    while remaining > 0:
+        part = stream.read(remaining)
+        if not part:
+            break
+        parts.append(part)
+        remaining -= len(part)
+    return b''.join(parts)
+
+
+def _upload_status(upload):
+    data = upload.to_dict()
+    data['upload_url'] = url_for('upload_status', upload_id=upload.id)
+    return data
+
+
+@app.route('/uploads', methods=['POST'])
+def create_upload():
+    """Start a resumable upload of `filename` (`size` bytes, optional whole-file `sha256`)
+
+    Send each chunk with PUT /uploads/<id>/chunks/<index> and an
+    X-Chunk-SHA256 header, in any order and as often as needed; GET
+    /uploads/<id> lists the chunks still missing. POST
+    /uploads/<id>/complete then queues the conversion.
+    """
+    filename = request.values.get('filename', '')
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': f'File type not allowed. Allowed: {ALLOWED_EXTENSIONS}'}), 400
+
+    sha256 = request.values.get('sha256')
+    if sha256 is not None and not SHA256_PATTERN.match(sha256.lower()):
+        return jsonify({'error': 'sha256 must be a hex SHA-256'}), 400
+
+    try:
+        upload = uploads.create(filename, _int_value('size', 0), _int_value('chunk_size'),
+                                sha256.lower() if sha256 else None)
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status_code
+
+    response = jsonify(_upload_status(upload))
+    response.status_code = 201
+    response.headers['Location'] = url_for('upload_status', upload_id=upload.id)
+    return response
+
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    upload = uploads.get(upload_id)
+    if upload is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify(_upload_status(upload))
+
+
+@app.route('/uploads/<upload_id>', methods=['DELETE'])
+def delete_upload(upload_id):
+    upload = uploads.get(upload_id)
+    if upload is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    uploads.discard(upload)
+    return '', 204
+
+
+@app.route('/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+def put_chunk(upload_id, index):
+    upload = uploads.get(upload_id)
+    if upload is None:
+        return jsonify({'error': 'Upload not found'}), 404
+
+    checksum = request.headers.get('X-Chunk-SHA256', '')
+    if not SHA256_PATTERN.match(checksum.lower()):
+        return jsonify({'error': 'X-Chunk-SHA256 header with the chunk\'s hex SHA-256 is required'}), 400
+
+    # One byte past the chunk size is enough to tell an oversized chunk apart
+    data = _read_up_to(request.stream, upload.chunk_size + 1)
+    try:
+        uploads.write_chunk(upload, index, data, checksum)
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status_code
+
+    return jsonify({'index': index, 'received': len(upload.received), 'chunks': upload.chunk_count})
+
+
+@app.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    """Queue the assembled file like POST /jobs, or with `wait=1` answer like /convert"""
+    upload = uploads.get(upload_id)
+    if upload is None:
+        return jsonify({'error': 'Upload not found'}), 404
+
+    missing = upload.missing()
+    if missing:
+        return jsonify({'error': 'Upload incomplete', 'missing': missing}), 409
+
+    options, error = _conversion_options()
+    if error:
+        return error
+
+    try:
+        with open(upload.data_path, 'rb') as f:
+            stored = _store_stream(f, upload.filename, os.path.getsize(upload.data_path))
+    except UploadRejected as e:
+        return jsonify({'error': str(e)}), e.status_code
+
+    if upload.sha256 and stored['content_hash'] != upload.sha256:
+        spool.release(stored['job_dir'])
+        uploads.discard(upload)
+        return jsonify({'error': 'Assembled file does not match sha256', 'sha256': stored['content_hash']}), 422
+
+    wait = request.values.get('wait') == '1'
+    try:
+        job = _submit(stored, options, INTERACTIVE if wait else BATCH)
+    except QueueFull as e:
+        # The chunks stay, so the client can complete the upload again later
+        return _queue_full_response(e)
+    uploads.discard(upload)
+
+    if wait:
+        return _wait_and_send(job)
+
+    response = jsonify(_job_status(job))
+    response.status_code = 202
+    response.headers['Location'] = url_for('job_status', job_id=job.id)
+    return response
+
+
+def _warmup_stages():
+    if not WARMUP:
+        return [('start libreoffice workers', pool.start)]
+
+    warm_dir = os.path.join(WORK_DIR, 'warmup')
+    stages = [
+        ('profile snapshot', lambda: build_snapshot(LO_PROFILE_SNAPSHOT, CONVERT_TIMEOUT)),
+        ('start libreoffice workers', pool.start),
+    ]
+    for path in write_samples(warm_dir):
+        stages.append((f'convert {os.path.basename(path)}',
+                       lambda path=path: pool.warm_up(path, warm_dir, CONVERT_TIMEOUT)))
+    stages.append(('clean up', lambda: shutil.rmtree(warm_dir, ignore_errors=True)))
+    return stages
+
+
+def start_background():
+    """Start warm-up, queue workers and janitors; called once by whichever server runs the app"""
+    warmup.start(_warmup_stages())
+    jobs.start()
+    uploads.start()
+    spool.start()
+    if search_index.enabled:
+        indexer.start()
+    profiler.start()
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=3000)
+    # Development server; production runs `python3 serve.py` (see serve.py)
+    logging.basicConfig(level=logging.INFO)
+    start_background()
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', '3000')))
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Split Conversion
+Large presentations and workbooks exported as page ranges on several LibreOffice workers at once, then merged
+"""
+
+import logging
+import os
+import threading
+import time
+
+import profiling
+from lo_pool import ConversionError
+from pdf_merge import merge_pdfs
+
+logger = logging.getLogger(__name__)
+
+SPLIT_FORMATS = {'ppt', 'pptx', 'odp', 'xls', 'xlsx', 'ods'}
+
+
+class EmptyChunk(ConversionError):
+    """The document has fewer pages than there are chunks; this one has nothing to export"""
+
+
+class _Chunk:
+    """Prepare hook exporting the index-th of `count` equal page ranges of the loaded document
+
+    Every chunk loads the whole document and only narrows PageRange, so
+    slide numbers, "page n of m" fields and sheet pagination come out the
+    same as in a single export.
+    """
+
+    def __init__(self, index, count):
+        self.index = index
+        self.count = count
+        self.total = None
+        self.pages = None
+
+    def __call__(self, doc):
+        positions = exported_pages(doc)
+        self.total = len(positions)
+        first = self.total * self.index // self.count + 1
+        last = self.total * (self.index + 1) // self.count
+        if first > last:
+            raise EmptyChunk('Nothing to export')
+        self.pages = (first, last)
+        return {'PageRange': f'{positions[first - 1]}-{positions[last - 1]}'}
+
+
+def exported_pages(doc):
+    """1-based PageRange positions of the pages a PDF export of the whole document produces
+
+    PageRange counts a presentation's hidden slides but the export leaves
+    them out, so chunks are cut over the visible slides and mapped back to
+    their positions; a hidden slide inside a chunk's range is skipped.
+    """
+    if doc.supportsService('com.sun.star.presentation.PresentationDocument'):
+        slides = doc.getDrawPages()
+        return [i + 1 for i in range(slides.getCount()) if slides.getByIndex(i).Visible]
+    # The model itself as the selection means every visible sheet
+    return list(range(1, doc.getRendererCount(doc, ()) + 1))
+
+
+class SplitConverter:
+    """Converts one large document as `chunks` page ranges on separate pool workers
+
+    Used for presentations and workbooks of at least min_bytes when the
+    pool has two or more workers and no page range or prepare hook was
+    asked for. Chunks that disagree on the page count fail the split, as
+    does any failed chunk; the caller then converts the document whole.
+    """
+
+    def __init__(self, pool, min_bytes, max_chunks=4, merge_timeout=60, limits=None):
+        self.pool = pool
+        self.min_bytes = min_bytes
+        self.max_chunks = max_chunks
+        self.merge_timeout = merge_timeout
+        self.limits = limits
+        self.splits = 0
+        self.failures = 0
+
+    def chunks(self):
+        return min(self.max_chunks, self.pool.size)
+
+    def applies(self, input_path, filter_data=None, prepare=None):
+        fmt = os.path.splitext(input_path)[1].lstrip('.').lower()
+        return (self.min_bytes > 0 and self.pool.enabled and self.chunks() >= 2 and fmt in SPLIT_FORMATS
+                and prepare is None and not (filter_data or {}).get('PageRange')
+                and os.path.getsize(input_path) >= self.min_bytes)
+
+    def convert(self, input_path, out_dir, timeout, filter_data=None):
+        """Convert input_path in chunks and return the merged PDF's path inside out_dir"""
+        count = self.chunks()
+        hooks = [_Chunk(i, count) for i in range(count)]
+        results = [None] * count
+        errors = [None] * count
+        deadline = time.monotonic() + timeout
+
+        def run(i):
+            chunk_dir = os.path.join(out_dir, f'chunk-{i}')
+            os.makedirs(chunk_dir, exist_ok=True)
+            try:
+                results[i] = self.pool.convert(input_path, chunk_dir, timeout, filter_data, hooks[i])
+            except EmptyChunk:
+                pass
+            except ConversionError as e:
+                errors[i] = e
+
+        with profiling.phase('chunks'):
+            threads = [threading.Thread(target=run, args=(i,), name=f'split-{i}', daemon=True)
+                       for i in range(count)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(max(deadline - time.monotonic(), 0) + 5)
+
+        try:
+            failed = next((error for error in errors if error is not None), None)
+            if failed is not None:
+                raise failed
+            if any(thread.is_alive() for thread in threads):
+                raise ConversionError('Split conversion failed', 'A chunk did not finish in time')
+            totals = {hook.total for hook in hooks}
+            if len(totals) != 1:
+                raise ConversionError('Split conversion failed', f'Chunks disagree on the page count: {totals}')
+            total = totals.pop()
+
+            parts = [path for path in results if path is not None]
+            if not parts:
+                raise ConversionError('Split conversion failed', 'The document has no pages')
+            pdf_path = os.path.join(out_dir, os.path.splitext(os.path.basename(input_path))[0] + '.pdf')
+            if len(parts) == 1:
+                os.replace(parts[0], pdf_path)
+                return pdf_path
+            with profiling.phase('merge'):
+                pages = merge_pdfs(parts, pdf_path, self.merge_timeout, self.limits)
+            if pages != total:
+                raise ConversionError('Split conversion failed', f'Merged {pages} pages, expected {total}')
+        except ConversionError:
+            self.failures += 1
+            raise
+
+        self.splits += 1
+        logger.info('Converted %s in %d chunks (%d pages)', os.path.basename(input_path), len(parts), pages)
+        return pdf_path
+
+    def stats(self):
+        return {
+            'min_bytes': self.min_bytes,
+            'chunks': self.chunks() if self.pool.enabled else 0,
+            'splits': self.splits,
+            'failures': self.failures,
+        }
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Job Spool
+Per-job work directories on a size-capped tmpfs, spilling to disk, reclaimed in the background
+"""
+
+import fcntl
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+LOCK_NAME = '.lock'  # held by the owning process for as long as it runs
+
+
+class SpoolFull(Exception):
+    """No room for another job under the spool quota"""
+
+    def __init__(self):
+        super().__init__('Job spool is full')
+
+
+class _Root:
+    """This process's directory under a spool base that other instances may share"""
+
+    def __init__(self, base, max_bytes, instance):
+        self.base = base
+        self.path = os.path.join(base, instance)
+        self.max_bytes = max_bytes
+        self._lock_file = None
+
+    def claim(self):
+        os.makedirs(self.path, exist_ok=True)
+        self._lock_file = open(os.path.join(self.path, LOCK_NAME), 'w')
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+class _Job:
+    def __init__(self, root, reserved):
+        self.root = root
+        self.reserved = reserved  # expected bytes, from the size hint
+        self.measured = 0  # bytes on disk at the janitor's last pass
+        self.holds = 1  # releases still due before the directory goes
+
+    @property
+    def size(self):
+        return max(self.reserved, self.measured)
+
+
+def _tree_size(path):
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(directory, name)).st_blocks * 512
+            except OSError:
+                pass
+    return total
+
+
+def _free(path):
+    stat = os.statvfs(path)
+    return stat.f_bavail * stat.f_frsize
+
+
+def _abandoned(path, cutoff):
+    """Whether an instance directory's process is gone (its lock is free)
+
+    A directory without a lock file is either being set up right now or
+    left by an older layout, so it only counts once it is older than cutoff.
+    """
+    try:
+        with open(os.path.join(path, LOCK_NAME)) as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            return True
+    except FileNotFoundError:
+        try:
+            return os.lstat(path).st_mtime <= cutoff
+        except OSError:
+            return False
+    except OSError:
+        return False
+
+
+class JobSpool:
+    """Work directories for jobs, on RAM while small and on disk otherwise
+
+    A job whose input is at most ram_file_max bytes goes to ram_dir, which
+    should be a tmpfs, while the RAM budget has room for it (input bytes
+    times `expansion`, for the PDF and images written next to it); the rest
+    goes to disk_dir. Together they may hold max_bytes, else create()
+    raises SpoolFull; a job counts as the larger of that reservation and
+    what the janitor last measured in its directory.
+    release() only hands a directory to the janitor thread, which deletes
+    it, re-measures live jobs and sweeps directories no live job owns.
+
+    Several servers may share ram_dir and disk_dir (one /dev/shm, one
+    volume): each keeps its jobs in its own <pid>-<id> subdirectory, locked
+    while it runs, and only removes another's once that lock is free.
+    """
+
+    def __init__(self, ram_dir, disk_dir, ram_max_bytes, max_bytes, ram_file_max, expansion=3,
+                 interval=10, orphan_grace=300):
+        instance = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self.ram = _Root(ram_dir, ram_max_bytes, instance) if ram_dir and ram_max_bytes else None
+        self.disk = _Root(disk_dir, max_bytes, instance)
+        self.max_bytes = max_bytes
+        self.ram_file_max = ram_file_max
+        self.expansion = expansion
+        self.interval = interval
+        self.orphan_grace = orphan_grace
+        self.rejected = 0
+        self.reclaimed = 0
+        self.orphans = 0
+        self._live = {}  # job dir -> _Job
+        self._released = queue.Queue()
+        self._lock = threading.Lock()
+        for root in self._roots():
+            root.claim()
+
+    def _roots(self):
+        return [root for root in (self.ram, self.disk) if root is not None]
+
+    def start(self):
+        threading.Thread(target=self._janitor, name='spool-janitor', daemon=True).start()
+
+    def create(self, size_hint=None, near=None):
+        """Make a job directory for about size_hint input bytes and return its path
+
+        An unknown size (None) goes to disk. With `near` (another job dir)
+        the new one goes on the same root, so files can be hard-linked
+        between them.
+        """
+        size = (size_hint or 0) * self.expansion
+        with self._lock:
+            if near is not None:
+                root = self._live[near].root if near in self._live else self.disk
+            elif size_hint is not None and size_hint <= self.ram_file_max and self._ram_fits(size):
+                root = self.ram
+            else:
+                root = self.disk
+            if self._used() + size > self.max_bytes or self._used(root) + size > root.max_bytes:
+                self.rejected += 1
+                raise SpoolFull()
+            job_dir = os.path.join(root.path, uuid.uuid4().hex)
+            os.makedirs(job_dir)
+            self._live[job_dir] = _Job(root, size)
+        return job_dir
+
+    def _ram_fits(self, size):
+        return (self.ram is not None and self._used(self.ram) + size <= self.ram.max_bytes
+                and _free(self.ram.path) > size)
+
+    def _used(self, root=None):
+        return sum(job.size for job in self._live.values() if root is None or job.root is root)
+
+    def hold(self, job_dir):
+        """Keep job_dir through one more release(), for work that outlives its job"""
+        with self._lock:
+            self._live[job_dir].holds += 1
+
+    def release(self, job_dir):
+        """Forget job_dir once every hold on it is released; the janitor deletes it off the request path"""
+        with self._lock:
+            job = self._live.get(job_dir)
+            if job is None:
+                return
+            job.holds -= 1
+            if job.holds:
+                return
+            del self._live[job_dir]
+        self._released.put(job_dir)
+
+    def _janitor(self):
+        self._sweep_instances()
+        last_sweep = time.monotonic()
+        while True:
+            try:
+                job_dir = self._released.get(timeout=self.interval)
+            except queue.Empty:
+                job_dir = None
+            if job_dir is not None:
+                shutil.rmtree(job_dir, ignore_errors=True)
+                self.reclaimed += 1
+            if time.monotonic() - last_sweep >= self.interval:
+                self._sweep(self.orphan_grace)
+                self._sweep_instances()
+                self._measure()
+                last_sweep = time.monotonic()
+
+    def _sweep(self, grace):
+        """Remove job dirs of this process that no live job owns (leaked by a failed request)"""
+        cutoff = time.time() - grace
+        for root in self._roots():
+            for name in os.listdir(root.path):
+                if name == LOCK_NAME:
+                    continue
+                path = os.path.join(root.path, name)
+                with self._lock:
+                    if path in self._live:
+                        continue
+                try:
+                    if os.lstat(path).st_mtime > cutoff:
+                        continue
+                except OSError:
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+                self.orphans += 1
+
+    def _sweep_instances(self):
+        """Remove the directories of other servers on the same roots that have exited"""
+        cutoff = time.time() - self.orphan_grace
+        for root in self._roots():
+            for name in os.listdir(root.base):
+                path = os.path.join(root.base, name)
+                if path == root.path or not os.path.isdir(path) or not _abandoned(path, cutoff):
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+                self.orphans += 1
+
+    def _measure(self):
+        with self._lock:
+            live = list(self._live.items())
+        for job_dir, job in live:
+            job.measured = _tree_size(job_dir)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'jobs': len(self._live),
+                'ram_jobs': sum(1 for job in self._live.values() if job.root is self.ram),
+                'ram_bytes': self._used(self.ram) if self.ram else None,
+                'ram_max_bytes': self.ram.max_bytes if self.ram else None,
+                'bytes': self._used(),
+                'max_bytes': self.max_bytes,
+                'rejected': self.rejected,
+                'reclaimed': self.reclaimed,
+                'orphans_removed': self.orphans,
+            }
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Spreadsheet Export
+Sheet selection, fit-to-width, used-range and row/page caps applied to a loaded Calc document before PDF export
+"""
+
+import logging
+
+from lo_pool import ConversionError
+
+logger = logging.getLogger(__name__)
+
+SHEET_FORMATS = {'xls', 'xlsx', 'ods', 'csv'}
+OPTION_NAMES = ('sheets', 'fit_width', 'used_range', 'max_rows', 'max_pages')
+
+MAX_ROWS = 1048576  # rows in an .xlsx sheet
+MAX_SHEETS = 256
+MAX_PAGES = 100000
+
+# com.sun.star.sheet.CellFlags: VALUE | DATETIME | STRING | FORMULA; formats and notes don't count
+CONTENT_FLAGS = 1 | 2 | 4 | 16
+
+
+class InvalidSheetOptions(ConversionError):
+    """Options that don't fit the workbook, such as a sheet it doesn't have"""
+
+
+def _flag(values, name):
+    value = values.get(name, '0').lower()
+    if value not in ('0', '1', 'true', 'false'):
+        raise ValueError(f'{name} must be 0 or 1')
+    return value in ('1', 'true')
+
+
+def _count(values, name, maximum):
+    value = values.get(name)
+    if not value:
+        return None
+    if not value.isdigit() or not 1 <= int(value) <= maximum:
+        raise ValueError(f'{name} must be a whole number from 1 to {maximum}')
+    return int(value)
+
+
+def parse_sheet_options(values, pages=None):
+    """Spreadsheet options from request values, as strings for a cache key
+
+    `sheets` is a comma-separated list of sheet names or 1-based positions.
+    Raises ValueError with a message for the client.
+    """
+    options = {}
+    sheets = [part.strip() for part in values.get('sheets', '').split(',') if part.strip()]
+    if len(sheets) > MAX_SHEETS:
+        raise ValueError(f'At most {MAX_SHEETS} sheets')
+    if sheets:
+        options['sheets'] = ','.join(sheets)
+    for name in ('fit_width', 'used_range'):
+        if _flag(values, name):
+            options[name] = '1'
+    for name, maximum in (('max_rows', MAX_ROWS), ('max_pages', MAX_PAGES)):
+        count = _count(values, name, maximum)
+        if count is not None:
+            options[name] = str(count)
+    if 'max_pages' in options and pages:
+        raise ValueError('Use either pages or max_pages')
+    return options
+
+
+class SheetExport:
+    """A prepare hook for LibreOfficePool.convert carrying one request's spreadsheet options
+
+    Called with the loaded document on the worker; it hides sheets that
+    were not selected, narrows each sheet's print area and returns the PDF
+    filter data that caps the page count. What was cut is left in
+    `report` for the response headers.
+
+    max_rows applies to each sheet; max_pages to the whole export.
+    """
+
+    def __init__(self, options):
+        self.sheets = options['sheets'].split(',') if 'sheets' in options else None
+        self.fit_width = 'fit_width' in options
+        self.used_range = 'used_range' in options
+        self.max_rows = int(options['max_rows']) if 'max_rows' in options else None
+        self.max_pages = int(options['max_pages']) if 'max_pages' in options else None
+        self.report = None
+
+    @classmethod
+    def for_format(cls, fmt, options):
+        """A hook for fmt and options, or None when there is nothing to apply"""
+        if fmt not in SHEET_FORMATS or not any(name in options for name in OPTION_NAMES):
+            return None
+        return cls(options)
+
+    @property
+    def truncates(self):
+        return self.max_rows is not None or self.max_pages is not None
+
+    def __call__(self, doc):
+        if not doc.supportsService('com.sun.star.sheet.SpreadsheetDocument'):
+            return {}
+        sheets = self._select(doc.getSheets())
+        omitted_rows = 0
+        for sheet in sheets:
+            if self.fit_width:
+                self._fit_width(doc, sheet)
+            if self.used_range and not sheet.getPrintAreas():
+                self._print_used_range(sheet)
+            if self.max_rows is not None:
+                omitted_rows += self._cap_rows(sheet)
+
+        total = self._page_count(doc) if self.max_pages is not None else None
+        self.report = {
+            'sheets': len(sheets),
+            'omitted_rows': omitted_rows,
+            'total_pages': total,
+            'truncated': self._truncated(omitted_rows, total),
+        }
+        if self.max_pages is None or (total is not None and total <= self.max_pages):
+            return {}
+        return {'PageRange': f'1-{self.max_pages}'}
+
+    def _truncated(self, omitted_rows, total_pages):
+        """Whether rows or pages were left out; None when the page count is unknown"""
+        if omitted_rows:
+            return True
+        if self.max_pages is None:
+            return False
+        return None if total_pages is None else total_pages > self.max_pages
+
+    def _select(self, sheets):
+        names = list(sheets.getElementNames())
+        if self.sheets is None:
+            return [sheets.getByName(name) for name in names if sheets.getByName(name).IsVisible]
+
+        selected = []
+        for token in self.sheets:
+            if token in names:
+                name = token
+            elif token.isdigit() and 1 <= int(token) <= len(names):
+                name = names[int(token) - 1]
+            else:
+                raise InvalidSheetOptions(f'No sheet {token!r} in this workbook', ', '.join(names))
+            if name not in selected:
+                selected.append(name)
+
+        # Hidden sheets are neither printed nor exported; show the selected ones
+        # first so the document never has zero visible sheets
+        for name in selected:
+            sheets.getByName(name).IsVisible = True
+        for name in names:
+            if name not in selected:
+                sheets.getByName(name).IsVisible = False
+        return [sheets.getByName(name) for name in selected]
+
+    def _fit_width(self, doc, sheet):
+        style = doc.getStyleFamilies().getByName('PageStyles').getByName(sheet.PageStyle)
+        style.ScaleToPagesX = 1
+        style.ScaleToPagesY = 0  # as many pages down as it takes
+
+    def _print_used_range(self, sheet):
+        """Print only the bounding box of cells with content, not trailing formatted cells"""
+        addresses = sheet.queryContentCells(CONTENT_FLAGS).getRangeAddresses()
+        if not addresses:
+            return
+        sheet.setPrintAreas((sheet.getCellRangeByPosition(
+            min(a.StartColumn for a in addresses), min(a.StartRow for a in addresses),
+            max(a.EndColumn for a in addresses), max(a.EndRow for a in addresses)).getRangeAddress(),))
+
+    def _cap_rows(self, sheet):
+        """Keep the first max_rows rows of the sheet's print areas; return how many were dropped"""
+        areas = sheet.getPrintAreas()
+        if not areas:
+            cursor = sheet.createCursor()
+            cursor.gotoEndOfUsedArea(False)
+            end = cursor.getRangeAddress()
+            areas = (sheet.getCellRangeByPosition(0, 0, end.EndColumn, end.EndRow).getRangeAddress(),)
+
+        kept, omitted, budget = [], 0, self.max_rows
+        for area in areas:
+            rows = area.EndRow - area.StartRow + 1
+            if budget <= 0:
+                omitted += rows
+                continue
+            if rows > budget:
+                omitted += rows - budget
+                area = sheet.getCellRangeByPosition(
+                    area.StartColumn, area.StartRow, area.EndColumn, area.StartRow + budget - 1).getRangeAddress()
+            kept.append(area)
+            budget -= min(rows, budget)
+        if omitted:
+            sheet.setPrintAreas(tuple(kept))
+        return omitted
+
+    def _page_count(self, doc):
+        """Pages the export would produce, or None if LibreOffice won't say"""
+        try:
+            # The model itself as the selection means every visible sheet
+            return doc.getRendererCount(doc, ())
+        except Exception as e:
+            logger.warning('Could not count spreadsheet pages: %s', e)
+            return None
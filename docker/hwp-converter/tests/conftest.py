@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The server's modules sit next to server.py rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
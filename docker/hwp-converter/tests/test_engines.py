@@ -0,0 +1,132 @@
+import pytest
+
+from engines import DEFAULT_CHAINS, Engine, EngineRouter, parse_chains
+from lo_pool import ConversionError
+
+
+class FakeEngine(Engine):
+    def __init__(self, name, available=True, page_ranges=True, formats=None, fail=None):
+        self.name = name
+        self._available = available
+        self.page_ranges = page_ranges
+        self.formats = formats
+        self.fail = fail
+        self.calls = 0
+
+    def available(self):
+        return self._available
+
+    def convert(self, input_path, out_dir, timeout, filter_data, prepare=None):
+        self.calls += 1
+        if self.fail:
+            raise self.fail
+        return f'{out_dir}/{self.name}.pdf'
+
+
+def _router(*engines, chains='*=a,b', **kwargs):
+    return EngineRouter(list(engines), parse_chains(chains), **kwargs)
+
+
+def _names(engines):
+    return [engine.name for engine in engines]
+
+
+def test_parse_chains():
+    assert parse_chains(DEFAULT_CHAINS) == {
+        'hwp': ['soffice', 'hwp5odt'],
+        'hwpx': ['java', 'soffice'],
+        '*': ['soffice'],
+    }
+
+
+def test_parse_chains_shares_a_chain_between_formats_and_ignores_blanks():
+    assert parse_chains(' DOC, docx = soffice , ;; ppt=soffice,java ;') == {
+        'doc': ['soffice'],
+        'docx': ['soffice'],
+        'ppt': ['soffice', 'java'],
+    }
+
+
+@pytest.mark.parametrize('spec', ['hwp=', 'hwp', 'hwp=,'])
+def test_parse_chains_rejects_empty_chain(spec):
+    with pytest.raises(ValueError):
+        parse_chains(spec)
+
+
+def test_router_rejects_unknown_engine():
+    with pytest.raises(ValueError):
+        _router(FakeEngine('a'), chains='*=a,missing')
+
+
+def test_order_follows_chain_and_falls_back_to_wildcard():
+    router = _router(FakeEngine('a'), FakeEngine('b'), chains='hwp=b,a;*=a')
+    assert _names(router.order('hwp')) == ['b', 'a']
+    assert _names(router.order('docx')) == ['a']
+
+
+def test_order_skips_unavailable_and_unsuitable_engines():
+    router = _router(FakeEngine('a', available=False), FakeEngine('b', page_ranges=False),
+                     FakeEngine('c', formats={'hwpx'}), chains='*=a,b,c')
+    assert _names(router.order('hwpx')) == ['b', 'c']
+    assert _names(router.order('hwpx', {'PageRange': '1-2'})) == ['c']
+    assert _names(router.order('hwp', {'PageRange': '1-2'})) == []
+
+
+def test_order_prefers_reliable_fast_engine_once_measured():
+    router = _router(FakeEngine('a'), FakeEngine('b'), min_samples=3, explore_every=0)
+    for _ in range(3):
+        router.record('docx', 'a', True, 2.0)
+        router.record('docx', 'b', True, 0.5)
+    assert _names(router.order('docx')) == ['b', 'a']
+    # Fewer samples for another format keep its chain order
+    router.record('pptx', 'b', True, 0.1)
+    assert _names(router.order('pptx')) == ['a', 'b']
+
+
+def test_order_keeps_unreliable_engine_behind_chain():
+    router = _router(FakeEngine('a'), FakeEngine('b'), min_samples=4, min_success_rate=0.9, explore_every=0)
+    for ok in (True, True, True, False):
+        router.record('docx', 'b', ok, 0.1)
+    for _ in range(4):
+        router.record('docx', 'a', True, 5.0)
+    assert _names(router.order('docx')) == ['a', 'b']
+
+
+def test_order_explores_least_tried_engine():
+    router = _router(FakeEngine('a'), FakeEngine('b'), FakeEngine('c'), chains='*=a,b,c', explore_every=3)
+    router.record('docx', 'a', True, 1.0)
+    router.record('docx', 'b', True, 1.0)
+    assert _names(router.order('docx')) == ['a', 'b', 'c']
+    assert _names(router.order('docx')) == ['a', 'b', 'c']
+    assert _names(router.order('docx')) == ['c', 'a', 'b']
+    # Labelling looks without counting a request
+    assert router.preferred('docx') == 'a'
+    assert router._requests['docx'] == 3
+
+
+def test_convert_falls_back_and_records_failure():
+    failing = FakeEngine('a', fail=OSError('soffice: not found'))
+    working = FakeEngine('b')
+    fallbacks = []
+    router = _router(failing, working, on_fallback=lambda fmt, name: fallbacks.append((fmt, name)))
+
+    pdf_path, name = router.convert('docx', lambda engine: engine.convert('in.docx', '/out', 10, {}))
+    assert (pdf_path, name) == ('/out/b.pdf', 'b')
+    assert fallbacks == [('docx', 'a')]
+    stats = router.stats()
+    assert stats['fallbacks'] == 1
+    assert stats['formats']['docx']['a']['successes'] == 0
+    assert stats['formats']['docx']['b']['successes'] == 1
+
+
+def test_convert_raises_last_error_as_conversion_error():
+    router = _router(FakeEngine('a', fail=ConversionError('first')), FakeEngine('b', fail=OSError('disk full')))
+    with pytest.raises(ConversionError) as raised:
+        router.convert('docx', lambda engine: engine.convert('in.docx', '/out', 10, {}))
+    assert 'b: disk full' in raised.value.details
+
+
+def test_convert_without_page_range_engine_says_so():
+    router = _router(FakeEngine('a', page_ranges=False), chains='*=a')
+    with pytest.raises(ConversionError, match='page ranges'):
+        router.convert('docx', lambda engine: engine.convert('in.docx', '/out', 10, {}), {'PageRange': '1'})
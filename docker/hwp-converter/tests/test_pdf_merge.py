@@ -0,0 +1,113 @@
+import json
+import shutil
+import subprocess
+
+import pytest
+
+from pdf_merge import _shift, merge_pdfs
+
+needs_qpdf = pytest.mark.skipif(shutil.which('qpdf') is None, reason='qpdf is not installed')
+
+
+def _text(text):
+    return '<FEFF' + text.encode('utf-16-be').hex() + '>'
+
+
+def _write_pdf(path, page_count, outlines=()):
+    """A minimal PDF of blank pages; outlines are (title, page, open, kids) with 1-based pages"""
+    objects = [None, None]  # catalog, page tree
+    pages = []
+    for _ in range(page_count):
+        objects.append('<< /Type /Page /Parent 2 0 R /MediaBox [0 0 200 200] /Resources << >> >>')
+        pages.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{n} 0 R' for n in pages)}] /Count {page_count} >>"
+
+    def add(items, parent):
+        numbers = []
+        for _ in items:
+            objects.append(None)
+            numbers.append(len(objects))
+        visible = len(items)
+        for i, ((title, page, is_open, kids), number) in enumerate(zip(items, numbers)):
+            entries = [f'/Title {_text(title)}', f'/Parent {parent} 0 R', f'/Dest [{pages[page - 1]} 0 R /Fit]']
+            if i > 0:
+                entries.append(f'/Prev {numbers[i - 1]} 0 R')
+            if i + 1 < len(items):
+                entries.append(f'/Next {numbers[i + 1]} 0 R')
+            if kids:
+                first, last, count = add(kids, number)
+                entries.append(f'/First {first} 0 R /Last {last} 0 R /Count {count if is_open else -count}')
+                if is_open:
+                    visible += count
+            objects[number - 1] = '<< ' + ' '.join(entries) + ' >>'
+        return numbers[0], numbers[-1], visible
+
+    catalog = '<< /Type /Catalog /Pages 2 0 R'
+    if outlines:
+        objects.append(None)
+        root = len(objects)
+        first, last, count = add(outlines, root)
+        objects[root - 1] = f'<< /Type /Outlines /First {first} 0 R /Last {last} 0 R /Count {count} >>'
+        catalog += f' /Outlines {root} 0 R'
+    objects[0] = catalog + ' >>'
+
+    out = bytearray(b'%PDF-1.7\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f'{number} 0 obj\n{body}\nendobj\n'.encode('latin-1')
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    out += b''.join(f'{offset:010d} 00000 n \n'.encode() for offset in offsets)
+    out += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    with open(path, 'wb') as f:
+        f.write(out)
+    return str(path)
+
+
+def _outline(items):
+    return [(item['title'], item['destpageposfrom1'], item['open'], _outline(item['kids'])) for item in items]
+
+
+def _inspect(path):
+    check = subprocess.run(['qpdf', '--check', path], capture_output=True, text=True)
+    assert check.returncode == 0, check.stdout + check.stderr
+    result = subprocess.run(['qpdf', '--json', '--json-key=pages', '--json-key=outlines', path],
+                            capture_output=True, text=True, check=True)
+    description = json.loads(result.stdout)
+    return len(description['pages']), _outline(description['outlines'])
+
+
+@needs_qpdf
+def test_merge_shifts_nested_and_closed_bookmarks(tmp_path):
+    first = _write_pdf(tmp_path / 'a.pdf', 2, [('Chapter 1', 1, True, [('1.1', 2, True, [])])])
+    second = _write_pdf(tmp_path / 'b.pdf', 3, [
+        ('Chapter 2', 1, False, [('2.1', 2, True, []), ('2.2', 3, True, [('2.2.1', 3, True, [])])]),
+        ('부록', 3, True, []),
+    ])
+    third = _write_pdf(tmp_path / 'c.pdf', 1)
+    for path in (first, second, third):
+        _inspect(path)
+
+    dst = str(tmp_path / 'merged.pdf')
+    assert merge_pdfs([first, second, third], dst) == 6
+    assert _inspect(dst) == (6, [
+        ('Chapter 1', 1, True, [('1.1', 2, True, [])]),
+        ('Chapter 2', 3, False, [('2.1', 4, True, []), ('2.2', 5, True, [('2.2.1', 5, True, [])])]),
+        ('부록', 5, True, []),
+    ])
+
+
+@needs_qpdf
+def test_merge_without_bookmarks(tmp_path):
+    parts = [_write_pdf(tmp_path / f'{i}.pdf', i + 1) for i in range(3)]
+    dst = str(tmp_path / 'merged.pdf')
+    assert merge_pdfs(parts, dst) == 6
+    assert _inspect(dst) == (6, [])
+
+
+def test_shift_keeps_open_state_and_drops_missing_targets():
+    outlines = [{'title': 'a', 'destpageposfrom1': 2, 'open': False,
+                 'kids': [{'title': None, 'destpageposfrom1': None, 'kids': []}]}]
+    assert _shift(outlines, 10) == [{'title': 'a', 'page': 12, 'open': False,
+                                     'kids': [{'title': '', 'page': None, 'open': True, 'kids': []}]}]
@@ -0,0 +1,108 @@
+import pytest
+
+import scheduler
+from scheduler import BATCH, INTERACTIVE, CostModel, Scheduler, size_class
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(scheduler, 'time', clock)
+    return clock
+
+
+def _drain(queue):
+    return [queue.get() for _ in range(queue.qsize())]
+
+
+def test_shortest_expected_job_first(clock):
+    queue = Scheduler(10, batch_penalty=0)
+    queue.put_nowait('slow', INTERACTIVE, 30.0)
+    queue.put_nowait('fast', INTERACTIVE, 1.0)
+    queue.put_nowait('medium', INTERACTIVE, 5.0)
+    assert _drain(queue) == ['fast', 'medium', 'slow']
+
+
+def test_equal_scores_keep_submission_order(clock):
+    queue = Scheduler(10)
+    for name in 'abc':
+        queue.put_nowait(name, INTERACTIVE, 2.0)
+    assert _drain(queue) == ['a', 'b', 'c']
+
+
+def test_aging_lets_a_waiting_job_beat_newer_cheaper_work(clock):
+    queue = Scheduler(10, batch_penalty=0, aging=1.0)
+    queue.put_nowait('large', INTERACTIVE, 30.0)
+    clock.now += 20
+    queue.put_nowait('small early', INTERACTIVE, 5.0)  # large has waited 20 s: 30 - 20 > 5
+    clock.now += 15
+    queue.put_nowait('small late', INTERACTIVE, 5.0)  # large has waited 35 s: 30 - 35 < 5
+    assert _drain(queue) == ['small early', 'large', 'small late']
+
+
+def test_without_aging_large_job_waits_behind_cheaper_work(clock):
+    queue = Scheduler(10, batch_penalty=0, aging=0)
+    queue.put_nowait('large', INTERACTIVE, 30.0)
+    clock.now += 1000
+    queue.put_nowait('small', INTERACTIVE, 5.0)
+    assert _drain(queue) == ['small', 'large']
+
+
+def test_batch_penalty_ages_away(clock):
+    queue = Scheduler(10, batch_penalty=60.0, aging=1.0)
+    queue.put_nowait('batch', BATCH, 1.0)
+    queue.put_nowait('interactive', INTERACTIVE, 10.0)
+    clock.now += 70
+    queue.put_nowait('late interactive', INTERACTIVE, 1.0)
+    assert _drain(queue) == ['interactive', 'batch', 'late interactive']
+
+
+def test_bounded_and_tracks_lanes_and_pending_seconds(clock):
+    queue = Scheduler(2)
+    assert queue.put_nowait('a', BATCH, 3.0)
+    assert queue.put_nowait('b', INTERACTIVE, 4.0)
+    assert not queue.put_nowait('c', INTERACTIVE, 1.0)
+    assert queue.stats() == {'lanes': {INTERACTIVE: 1, BATCH: 1}, 'pending_seconds': 7.0}
+    assert queue.get() == 'b'
+    assert queue.pending_seconds() == 3.0
+
+
+def test_size_class_buckets_by_powers_of_four():
+    assert [size_class(size) for size in (0, 65536, 65537, 262144, 262145)] == [0, 0, 1, 1, 2]
+
+
+def test_cost_model_prior_then_history():
+    costs = CostModel(base_seconds=2.0, seconds_per_mb=1.0, alpha=0.5)
+    assert costs.estimate('pptx', 2**20) == pytest.approx(9.0)
+    assert costs.estimate('unknown', 0) == pytest.approx(2.0)
+
+    costs.record('pptx', 2**20, 12.0)
+    assert costs.estimate('pptx', 2**20) == pytest.approx(12.0)
+    # Another size class of the same format scales the learned rate
+    assert costs.estimate('pptx', 4 * 2**20) == pytest.approx(2.0 + 10.0 * 4)
+    costs.record('pptx', 2**20, 4.0)
+    assert costs.estimate('pptx', 2**20) == pytest.approx(8.0)
+    assert costs.stats() == {'pptx': {'samples': 2, 'seconds_per_mb': 6.0}}
+
+
+def test_move_rescores_in_place(clock):
+    queue = Scheduler(2, batch_penalty=60.0, aging=1.0)
+    queue.put_nowait('batch', BATCH, 5.0)
+    clock.now += 10
+    queue.put_nowait('interactive', INTERACTIVE, 10.0)
+    assert queue.move('batch', INTERACTIVE)
+    assert not queue.move('missing', INTERACTIVE)
+    # One entry per item: same size, same pending seconds, still room for nothing more
+    assert queue.stats() == {'lanes': {INTERACTIVE: 2, BATCH: 0}, 'pending_seconds': 15.0}
+    assert not queue.put_nowait('third', INTERACTIVE, 1.0)
+    # It keeps the credit for the 10 s it waited
+    assert _drain(queue) == ['batch', 'interactive']
+    assert queue.qsize() == 0
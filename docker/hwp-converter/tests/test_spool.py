@@ -0,0 +1,120 @@
+import os
+
+import pytest
+
+from spool import LOCK_NAME, JobSpool, SpoolFull
+
+KB = 1024
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    return str(tmp_path / 'ram'), str(tmp_path / 'disk')
+
+
+def _spool(dirs, ram_max=30 * KB, max_bytes=100 * KB, ram_file_max=10 * KB, **kwargs):
+    return JobSpool(dirs[0], dirs[1], ram_max, max_bytes, ram_file_max, expansion=3, **kwargs)
+
+
+def _on(spool, job_dir):
+    return 'ram' if os.path.dirname(job_dir) == spool.ram.path else 'disk'
+
+
+def _write(job_dir, size):
+    with open(os.path.join(job_dir, 'input'), 'wb') as f:
+        f.write(os.urandom(size))
+
+
+def test_small_jobs_on_ram_large_and_unknown_on_disk(dirs):
+    spool = _spool(dirs)
+    assert _on(spool, spool.create(4 * KB)) == 'ram'
+    assert _on(spool, spool.create(11 * KB)) == 'disk'
+    assert _on(spool, spool.create()) == 'disk'
+
+
+def test_spills_to_disk_once_ram_budget_is_used(dirs):
+    spool = _spool(dirs)
+    first = spool.create(8 * KB)  # reserves 24 KB of the 30 KB budget
+    assert _on(spool, first) == 'ram'
+    assert _on(spool, spool.create(8 * KB)) == 'disk'
+    spool.release(first)
+    assert _on(spool, spool.create(8 * KB)) == 'ram'
+    assert spool.stats()['ram_bytes'] == 24 * KB
+
+
+def test_quota_rejects_and_release_frees_room(dirs):
+    spool = _spool(dirs, max_bytes=60 * KB)
+    job_dir = spool.create(15 * KB)
+    spool.create(5 * KB)
+    with pytest.raises(SpoolFull):
+        spool.create(2 * KB)
+    assert spool.stats()['rejected'] == 1
+    spool.release(job_dir)
+    spool.release(job_dir)  # a second release is ignored
+    spool.create(2 * KB)
+    assert spool.stats()['jobs'] == 2
+
+
+def test_hold_keeps_dir_until_every_release(dirs):
+    spool = _spool(dirs)
+    job_dir = spool.create(KB)
+    spool.hold(job_dir)
+    spool.release(job_dir)
+    assert spool.stats()['jobs'] == 1
+    spool.release(job_dir)
+    assert spool.stats()['jobs'] == 0
+    spool.release(job_dir)  # nothing left to release
+
+
+def test_without_ram_dir_everything_goes_to_disk(dirs):
+    spool = JobSpool('', dirs[1], 0, 100 * KB, 10 * KB)
+    assert spool.ram is None
+    assert os.path.dirname(spool.create(KB)) == spool.disk.path
+
+
+def test_near_shares_the_root(dirs):
+    spool = _spool(dirs)
+    disk_job = spool.create()
+    assert _on(spool, spool.create(KB, near=disk_job)) == 'disk'
+    ram_job = spool.create(KB)
+    assert _on(spool, spool.create(KB, near=ram_job)) == 'ram'
+
+
+def test_measured_size_counts_when_above_reservation(dirs):
+    spool = _spool(dirs, max_bytes=200 * KB)
+    job_dir = spool.create(KB)
+    _write(job_dir, 64 * KB)
+    spool._measure()
+    assert spool.stats()['bytes'] >= 64 * KB
+
+
+def test_sweep_removes_leaked_dirs_only(dirs):
+    spool = _spool(dirs)
+    live = spool.create(KB)
+    leaked = os.path.join(spool.disk.path, 'leaked')
+    os.makedirs(leaked)
+    spool._sweep(grace=0)
+    assert os.path.isdir(live)
+    assert not os.path.exists(leaked)
+    assert os.path.exists(os.path.join(spool.disk.path, LOCK_NAME))
+    assert spool.stats()['orphans_removed'] == 1
+
+
+def test_sweep_instances_removes_exited_servers_only(dirs):
+    spool = _spool(dirs)
+    running = _spool(dirs)  # holds its own lock
+    exited = os.path.join(dirs[1], '1-deadbeef')
+    os.makedirs(exited)
+    open(os.path.join(exited, LOCK_NAME), 'w').close()
+    unlocked = os.path.join(dirs[1], 'old-layout')
+    os.makedirs(unlocked)
+
+    spool._sweep_instances()
+    assert not os.path.exists(exited)
+    assert os.path.isdir(running.disk.path)
+    assert os.path.isdir(unlocked)  # within orphan_grace it may still be setting up
+
+    spool.orphan_grace = -1
+    spool._sweep_instances()
+    assert not os.path.exists(unlocked)
+    assert os.path.isdir(spool.disk.path) and os.path.isdir(running.disk.path)
@@ -0,0 +1,51 @@
+import pytest
+
+from spreadsheets import MAX_SHEETS, SheetExport, parse_sheet_options
+
+
+def test_no_options():
+    assert parse_sheet_options({}) == {}
+    assert parse_sheet_options({'sheets': ' , ', 'fit_width': '0', 'used_range': 'false', 'max_rows': ''}) == {}
+
+
+def test_all_options_normalised():
+    values = {'sheets': ' Summary , 2,,Data ', 'fit_width': 'TRUE', 'used_range': '1',
+              'max_rows': '500', 'max_pages': '10'}
+    assert parse_sheet_options(values) == {
+        'sheets': 'Summary,2,Data',
+        'fit_width': '1',
+        'used_range': '1',
+        'max_rows': '500',
+        'max_pages': '10',
+    }
+
+
+@pytest.mark.parametrize('values', [
+    {'fit_width': 'yes'},
+    {'used_range': '2'},
+    {'max_rows': '0'},
+    {'max_rows': '-1'},
+    {'max_rows': '1.5'},
+    {'max_rows': '1048577'},
+    {'max_pages': 'ten'},
+    {'max_pages': '100001'},
+    {'sheets': ','.join(str(i) for i in range(MAX_SHEETS + 1))},
+])
+def test_invalid_values(values):
+    with pytest.raises(ValueError):
+        parse_sheet_options(values)
+
+
+def test_max_pages_excludes_pages():
+    with pytest.raises(ValueError, match='pages or max_pages'):
+        parse_sheet_options({'max_pages': '3'}, pages='1-2')
+    assert parse_sheet_options({'max_rows': '3'}, pages='1-2') == {'max_rows': '3'}
+
+
+def test_hook_only_for_spreadsheets_with_options():
+    options = parse_sheet_options({'max_rows': '5', 'sheets': 'A'})
+    assert SheetExport.for_format('docx', options) is None
+    assert SheetExport.for_format('xlsx', {}) is None
+    hook = SheetExport.for_format('xlsx', options)
+    assert hook.sheets == ['A'] and hook.max_rows == 5 and hook.truncates
+    assert not SheetExport.for_format('csv', {'fit_width': '1'}).truncates
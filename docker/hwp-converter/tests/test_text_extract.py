@@ -0,0 +1,85 @@
+import os
+import struct
+import zlib
+
+import pytest
+
+from text_extract import HWPTAG_PARA_TEXT, UnsupportedDocument, _inflate, _para_text, _records, open_document
+
+SAMPLE_HWP = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'test_samples', 'sample.hwp')
+
+
+def _record(tag, payload, extended=False):
+    if extended or len(payload) >= 0xFFF:
+        return struct.pack('<II', tag | 0xFFF << 20, len(payload)) + payload
+    return struct.pack('<I', tag | len(payload) << 20) + payload
+
+
+def _split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+RECORDS = [
+    (HWPTAG_PARA_TEXT, 'Hello'.encode('utf-16-le')),
+    (0x10, b''),
+    (0x42, bytes(range(256)) * 20),  # longer than 0xFFF, so the size is in the extended field
+    (0x43, b'\x01\x02\x03'),
+]
+STREAM = b''.join(_record(tag, payload) for tag, payload in RECORDS)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 4, 5, 7, 64, 4096, len(STREAM)])
+def test_records_are_independent_of_chunk_boundaries(chunk_size):
+    assert list(_records(_split(STREAM, chunk_size))) == RECORDS
+
+
+def test_records_payloads_are_bytes():
+    assert all(type(payload) is bytes for _, payload in _records(_split(STREAM, 5)))
+
+
+def test_records_extended_size_below_limit():
+    assert list(_records([_record(0x44, b'abc', extended=True)])) == [(0x44, b'abc')]
+
+
+def test_records_drop_truncated_tail():
+    assert list(_records(_split(STREAM[:-1], 10))) == RECORDS[:-1]
+    assert list(_records([b'\x01\x02'])) == []
+
+
+def test_para_text_controls():
+    units = [ord('a')] + [9] + [0] * 7 + [ord('b'), 13]  # tab (an 8-unit inline control), paragraph end
+    units += [2] + [0] * 7  # extended control, no text
+    units += [ord('c'), 30, ord('d'), 24, ord('e')]  # non-breaking space, hyphen
+    assert _para_text(struct.pack(f'<{len(units)}H', *units)) == 'a\tbc d-e'
+
+
+def test_para_text_surrogate_pairs_and_odd_length():
+    assert _para_text('한글 😀'.encode('utf-16-le') + b'\x00') == '한글 😀'
+
+
+def test_inflate_streams_raw_deflate():
+    data = b'x' * 300000 + bytes(range(256))
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush()
+    chunks = list(_inflate(_split(compressed, 100)))
+    assert b''.join(chunks) == data
+    assert max(len(chunk) for chunk in chunks) <= 64 * 1024
+
+
+def test_open_document_rejects_other_files(tmp_path):
+    path = tmp_path / 'not.hwp'
+    path.write_bytes(b'plain text' * 100)
+    with pytest.raises(UnsupportedDocument):
+        open_document(str(path))
+
+
+@pytest.mark.skipif(not os.path.exists(SAMPLE_HWP), reason='sample.hwp not available')
+def test_sample_hwp_paragraphs():
+    document = open_document(SAMPLE_HWP)
+    try:
+        paragraphs = list(document.paragraphs())
+    finally:
+        document.close()
+    assert paragraphs
+    assert all(text and text == text.strip() for _, text in paragraphs)
+    assert [number for number, _ in paragraphs] == sorted(number for number, _ in paragraphs)
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Text Extraction
+Read paragraph text from HWP 5.x and HWPX files without LibreOffice
+"""
+
+import re
+import struct
+import zipfile
+import zlib
+import xml.etree.ElementTree as ET
+
+READ_SIZE = 64 * 1024
+
+# Compound File Binary (OLE2) container used by HWP 5.x
+CFB_SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+END_OF_CHAIN = 0xFFFFFFFE
+NO_STREAM = 0xFFFFFFFF
+STORAGE, STREAM, ROOT = 1, 2, 5
+
+# HWP 5.x records
+HWP_SIGNATURE = b'HWP Document File'
+FLAG_COMPRESSED = 0x1
+FLAG_PASSWORD = 0x2
+FLAG_DISTRIBUTION = 0x4
+HWPTAG_PARA_TEXT = 0x10 + 51
+
+# UTF-16 control codes that take one code unit; every other code below 32
+# carries 7 more units of inline/extended control data
+CHAR_CONTROLS = {0, 10, 13} | set(range(24, 32))
+CONTROL_TEXT = {9: '\t', 10: '\n', 24: '-', 30: ' ', 31: ' '}
+
+HWPX_SECTION = re.compile(r'^Contents/section(\d+)\.xml$')
+
+
+class UnsupportedDocument(Exception):
+    """The file is not a readable HWP/HWPX document"""
+
+
+class _CompoundFile:
+    """Minimal reader for the streams of an OLE2 compound file"""
+
+    def __init__(self, f):
+        self.f = f
+        header = f.read(512)
+        if len(header) < 512 or header[:8] != CFB_SIGNATURE:
+            raise UnsupportedDocument('Not an HWP 5.x file')
+
+        self.sector_size = 1 << struct.unpack_from('<H', header, 0x1E)[0]
+        self.mini_sector_size = 1 << struct.unpack_from('<H', header, 0x20)[0]
+        (fat_sectors, dir_start, _, self.mini_cutoff, minifat_start, minifat_sectors,
+         difat_start, difat_sectors) = struct.unpack_from('<IIIIIIII', header, 0x2C)
+
+        f.seek(0, 2)
+        self.sector_count = max((f.tell() - 512) // self.sector_size, 0)
+
+        difat = list(struct.unpack_from('<109I', header, 0x4C))
+        sector = difat_start
+        for _ in range(difat_sectors):
+            if sector >= self.sector_count:
+                break
+            entries = struct.unpack(f'<{self.sector_size // 4}I', self._sector(sector))
+            difat.extend(entries[:-1])
+            sector = entries[-1]
+
+        self.fat = []
+        for sector in difat[:fat_sectors]:
+            if sector < self.sector_count:
+                self.fat.extend(struct.unpack(f'<{self.sector_size // 4}I', self._sector(sector)))
+
+        directory = b''.join(self._chain(dir_start, self._sector, self.fat))
+        self.entries = [self._entry(directory[i:i + 128]) for i in range(0, len(directory) - 127, 128)]
+        if not self.entries or self.entries[0]['type'] != ROOT:
+            raise UnsupportedDocument('Damaged HWP directory')
+
+        root = self.entries[0]
+        self.mini_fat = []
+        if minifat_sectors:
+            data = b''.join(self._chain(minifat_start, self._sector, self.fat))
+            self.mini_fat = list(struct.unpack(f'<{len(data) // 4}I', data[:len(data) // 4 * 4]))
+        self.mini_stream = b''.join(self._read_chain(root['start'], root['size'], big=True)) if self.mini_fat else b''
+
+    def _sector(self, index):
+        self.f.seek(512 + index * self.sector_size)
+        return self.f.read(self.sector_size)
+
+    def _mini_sector(self, index):
+        offset = index * self.mini_sector_size
+        return self.mini_stream[offset:offset + self.mini_sector_size]
+
+    def _chain(self, start, read, table):
+        """Yield the sectors of a chain, stopping at loops or bad links"""
+        sector = start
+        for _ in range(len(table) + 1):
+            if sector == END_OF_CHAIN or sector >= len(table):
+                return
+            yield read(sector)
+            sector = table[sector]
+        raise UnsupportedDocument('Damaged HWP sector chain')
+
+    def _read_chain(self, start, size, big):
+        if big:
+            chunks = self._chain(start, self._sector, self.fat)
+        else:
+            chunks = self._chain(start, self._mini_sector, self.mini_fat)
+        remaining = size
+        for chunk in chunks:
+            if remaining <= 0:
+                return
+            yield chunk[:remaining]
+            remaining -= len(chunk)
+
+    @staticmethod
+    def _entry(raw):
+        name_length = struct.unpack_from('<H', raw, 64)[0]
+        left, right, child = struct.unpack_from('<III', raw, 68)
+        start, size = struct.unpack_from('<IQ', raw, 116)
+        return {
+            'name': raw[:max(name_length - 2, 0)].decode('utf-16-le', 'replace'),
+            'type': raw[66],
+            'left': left,
+            'right': right,
+            'child': child,
+            'start': start,
+            'size': size & 0xFFFFFFFF,
+        }
+
+    def children(self, index):
+        """Entries directly inside storage `index`, keyed by name"""
+        found = {}
+        seen = set()
+        stack = [self.entries[index]['child']]
+        while stack:
+            i = stack.pop()
+            if i == NO_STREAM or i >= len(self.entries) or i in seen:
+                continue
+            seen.add(i)
+            entry = self.entries[i]
+            found[entry['name']] = i
+            stack.extend((entry['left'], entry['right']))
+        return found
+
+    def open(self, index):
+        """Yield the bytes of stream `index` in sector-sized pieces"""
+        entry = self.entries[index]
+        return self._read_chain(entry['start'], entry['size'], big=entry['size'] >= self.mini_cutoff)
+
+
+def _inflate(chunks):
+    decompressor = zlib.decompressobj(-15)
+    for chunk in chunks:
+        data = decompressor.decompress(chunk, READ_SIZE)
+        while data:
+            yield data
+            data = decompressor.decompress(decompressor.unconsumed_tail, READ_SIZE)
+    tail = decompressor.flush()
+    if tail:
+        yield tail
+
+
+def _records(chunks):
+    """Yield (tag, payload) for the HWP records in a byte stream
+
+    Chunks are appended to one buffer that is read by offset; consumed bytes
+    are dropped only once they are at least half of it, so a record spread
+    over many chunks is not copied again for each one.
+    """
+    buffer = bytearray()
+    offset = 0
+    for chunk in chunks:
+        if offset and offset * 2 >= len(buffer):
+            del buffer[:offset]
+            offset = 0
+        buffer += chunk
+        while len(buffer) - offset >= 4:
+            header = struct.unpack_from('<I', buffer, offset)[0]
+            tag, size, start = header & 0x3FF, header >> 20, offset + 4
+            if size == 0xFFF:
+                if len(buffer) - offset < 8:
+                    break
+                size = struct.unpack_from('<I', buffer, start)[0]
+                start += 4
+            if len(buffer) < start + size:
+                break
+            yield tag, bytes(buffer[start:start + size])
+            offset = start + size
+
+
+def _para_text(payload):
+    units = struct.unpack(f'<{len(payload) // 2}H', payload[:len(payload) // 2 * 2])
+    out = []
+    i = 0
+    while i < len(units):
+        code = units[i]
+        if code >= 32:
+            out.append(chr(code))
+            i += 1
+            continue
+        out.append(CONTROL_TEXT.get(code, ''))
+        i += 1 if code in CHAR_CONTROLS else 8
+    # Surrogate pairs were split into single units above
+    return ''.join(out).encode('utf-16-le', 'surrogatepass').decode('utf-16-le', 'replace').strip()
+
+
+class HwpDocument:
+    format = 'hwp'
+
+    def __init__(self, path):
+        self.path = path
+        self._f = open(path, 'rb')
+        try:
+            self._cfb = _CompoundFile(self._f)
+            top = self._cfb.children(0)
+            if 'FileHeader' not in top or 'BodyText' not in top:
+                raise UnsupportedDocument('Not an HWP 5.x file')
+            header = b''.join(self._cfb.open(top['FileHeader']))
+            if not header.startswith(HWP_SIGNATURE):
+                raise UnsupportedDocument('Not an HWP 5.x file')
+            flags = struct.unpack_from('<I', header, 36)[0]
+            if flags & (FLAG_PASSWORD | FLAG_DISTRIBUTION):
+                raise UnsupportedDocument('Encrypted or distribution-only HWP documents have no readable text')
+            self.compressed = bool(flags & FLAG_COMPRESSED)
+
+            sections = self._cfb.children(top['BodyText'])
+            self.sections = [sections[name] for name in sorted(
+                (name for name in sections if re.match(r'^Section\d+$', name)), key=lambda n: int(n[7:]))]
+        except (struct.error, IndexError) as e:
+            self._f.close()
+            raise UnsupportedDocument(f'Damaged HWP file: {e}')
+        except BaseException:
+            self._f.close()
+            raise
+
+    def paragraphs(self):
+        """Yield (section index, paragraph text) for every non-empty paragraph"""
+        for number, index in enumerate(self.sections):
+            chunks = self._cfb.open(index)
+            if self.compressed:
+                chunks = _inflate(chunks)
+            for tag, payload in _records(chunks):
+                if tag == HWPTAG_PARA_TEXT:
+                    text = _para_text(payload)
+                    if text:
+                        yield number, text
+
+    def close(self):
+        self._f.close()
+
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+class HwpxDocument:
+    format = 'hwpx'
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            self._zip = zipfile.ZipFile(path)
+        except zipfile.BadZipFile:
+            raise UnsupportedDocument('Not an HWPX file')
+        sections = [(int(m.group(1)), name) for name in self._zip.namelist() for m in [HWPX_SECTION.match(name)] if m]
+        if not sections:
+            self._zip.close()
+            raise UnsupportedDocument('HWPX file has no sections')
+        self.sections = [name for _, name in sorted(sections)]
+
+    def paragraphs(self):
+        """Yield (section index, paragraph text); nested table paragraphs come first"""
+        for number, name in enumerate(self.sections):
+            stack = []
+            with self._zip.open(name) as stream:
+                for event, elem in ET.iterparse(stream, events=('start', 'end')):
+                    tag = _local(elem.tag)
+                    if tag == 'p':
+                        if event == 'start':
+                            stack.append([])
+                            continue
+                        text = ''.join(stack.pop()).strip()
+                        elem.clear()
+                        if text:
+                            yield number, text
+                    elif tag == 't' and event == 'end' and stack:
+                        stack[-1].append(_run_text(elem))
+
+    def close(self):
+        self._zip.close()
+
+
+def _run_text(elem):
+    parts = [elem.text or '']
+    for child in elem:
+        name = _local(child.tag)
+        if name == 'tab':
+            parts.append('\t')
+        elif name == 'lineBreak':
+            parts.append('\n')
+        parts.append(child.tail or '')
+    return ''.join(parts)
+
+
+def open_document(path):
+    """Open an HWP or HWPX file for extraction; raises UnsupportedDocument"""
+    with open(path, 'rb') as f:
+        magic = f.read(8)
+    if magic == CFB_SIGNATURE:
+        return HwpDocument(path)
+    if magic[:4] == b'PK\x03\x04':
+        return HwpxDocument(path)
+    raise UnsupportedDocument('Only HWP and HWPX documents are supported')
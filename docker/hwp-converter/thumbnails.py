@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Thumbnail Rendering
+Rasterize the first page of a converted PDF to a small PNG or WebP
+"""
+
+import os
+import subprocess
+
+import governor
+from lo_pool import ConversionError, ConversionTimeout, ResourceLimitExceeded
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow missing -> PNG only
+    Image = None
+
+MIME_TYPES = {'png': 'image/png', 'webp': 'image/webp'}
+
+
+def supported_formats():
+    return ['png', 'webp'] if Image is not None else ['png']
+
+
+def render_thumbnail(pdf_path, out_dir, width, fmt='png', timeout=30, limits=None, page=1):
+    """Render `page` (default 1) of pdf_path at `width` pixels wide; return the image path"""
+    prefix = os.path.join(out_dir, 'thumbnail' if page == 1 else f'page{page}')
+    try:
+        result, killed = governor.run(
+            ['pdftoppm', '-png', '-f', str(page), '-l', str(page), '-singlefile',
+             '-scale-to-x', str(width), '-scale-to-y', '-1', pdf_path, prefix],
+            timeout,
+            limits
+        )
+    except subprocess.TimeoutExpired:
+        raise ConversionTimeout('Thumbnail timeout')
+    if killed:
+        raise ResourceLimitExceeded(killed, result.stderr)
+
+    png_path = prefix + '.png'
+    if result.returncode != 0 or not os.path.exists(png_path):
+        raise ConversionError('Thumbnail rendering failed', result.stderr)
+
+    if fmt == 'png':
+        return png_path
+
+    webp_path = prefix + '.webp'
+    with Image.open(png_path) as image:
+        image.save(webp_path, 'WEBP', quality=80)
+    return webp_path
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Resumable Uploads
+Files sent as checksummed chunks in any order, kept on disk until complete or expired
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class UploadError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ChunkedUpload:
+    def __init__(self, upload_id, directory, filename, size, chunk_size, sha256=None,
+                 received=(), created_at=None, updated_at=None):
+        self.id = upload_id
+        self.dir = directory
+        self.filename = filename
+        self.size = size
+        self.chunk_size = chunk_size
+        self.sha256 = sha256
+        self.received = set(received)
+        self.created_at = created_at or time.time()
+        self.updated_at = updated_at or self.created_at
+
+    @property
+    def data_path(self):
+        return os.path.join(self.dir, 'data')
+
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.size // self.chunk_size))
+
+    def chunk_length(self, index):
+        if index == self.chunk_count - 1:
+            return self.size - index * self.chunk_size
+        return self.chunk_size
+
+    def missing(self):
+        return [i for i in range(self.chunk_count) if i not in self.received]
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'size': self.size,
+            'chunk_size': self.chunk_size,
+            'chunks': self.chunk_count,
+            'received': len(self.received),
+            'missing': self.missing(),
+            'sha256': self.sha256,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+        }
+
+    def _meta(self):
+        return {
+            'filename': self.filename,
+            'size': self.size,
+            'chunk_size': self.chunk_size,
+            'sha256': self.sha256,
+            'received': sorted(self.received),
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+        }
+
+
+class ChunkedUploads:
+    """Uploads in progress under root/<id>/, surviving restarts; idle ones expire after ttl"""
+
+    def __init__(self, root, max_bytes, default_chunk_size, min_chunk_size, max_chunk_size, ttl=86400):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.default_chunk_size = default_chunk_size
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.ttl = ttl
+        self.expired = 0
+        self._uploads = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        for upload_id in os.listdir(self.root):
+            directory = os.path.join(self.root, upload_id)
+            try:
+                with open(os.path.join(directory, 'meta.json')) as f:
+                    self._uploads[upload_id] = ChunkedUpload(upload_id, directory, **json.load(f))
+            except (OSError, ValueError, TypeError):
+                shutil.rmtree(directory, ignore_errors=True)
+        logger.info('Resumable uploads: %d in progress', len(self._uploads))
+
+    def start(self):
+        threading.Thread(target=self._expire_loop, name='upload-janitor', daemon=True).start()
+
+    def create(self, filename, size, chunk_size=None, sha256=None):
+        if not 0 < size <= self.max_bytes:
+            raise UploadError(f'size must be between 1 and {self.max_bytes} bytes', 413 if size > 0 else 400)
+        chunk_size = chunk_size or self.default_chunk_size
+        if not self.min_chunk_size <= chunk_size <= self.max_chunk_size:
+            raise UploadError(f'chunk_size must be between {self.min_chunk_size} and {self.max_chunk_size}')
+
+        upload_id = uuid.uuid4().hex
+        directory = os.path.join(self.root, upload_id)
+        os.makedirs(directory)
+        upload = ChunkedUpload(upload_id, directory, filename, size, chunk_size, sha256)
+        with open(upload.data_path, 'wb') as f:
+            f.truncate(size)
+        self._save(upload)
+        with self._lock:
+            self._uploads[upload_id] = upload
+        return upload
+
+    def get(self, upload_id):
+        with self._lock:
+            return self._uploads.get(upload_id)
+
+    def write_chunk(self, upload, index, data, checksum):
+        """Store chunk `index` if its SHA-256 matches checksum; re-sending a chunk is fine"""
+        if not 0 <= index < upload.chunk_count:
+            raise UploadError(f'Chunk index must be between 0 and {upload.chunk_count - 1}', 416)
+        if len(data) != upload.chunk_length(index):
+            raise UploadError(f'Chunk {index} must be {upload.chunk_length(index)} bytes, got {len(data)}')
+        if hashlib.sha256(data).hexdigest() != checksum.lower():
+            raise UploadError(f'Checksum mismatch for chunk {index}', 422)
+
+        fd = os.open(upload.data_path, os.O_WRONLY)
+        try:
+            os.pwrite(fd, data, index * upload.chunk_size)
+        finally:
+            os.close(fd)
+
+        with self._lock:
+            upload.received.add(index)
+            upload.updated_at = time.time()
+            self._save(upload)
+
+    def _save(self, upload):
+        path = os.path.join(upload.dir, 'meta.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(upload._meta(), f)
+        os.replace(path + '.tmp', path)
+
+    def discard(self, upload):
+        with self._lock:
+            self._uploads.pop(upload.id, None)
+        shutil.rmtree(upload.dir, ignore_errors=True)
+
+    def _expire_loop(self):
+        while True:
+            time.sleep(300)
+            cutoff = time.time() - self.ttl
+            with self._lock:
+                expired = [upload for upload in self._uploads.values() if upload.updated_at < cutoff]
+            for upload in expired:
+                self.discard(upload)
+                self.expired += 1
+
+    def stats(self):
+        with self._lock:
+            uploads = list(self._uploads.values())
+        return {
+            'in_progress': len(uploads),
+            'bytes_received': sum(
+                sum(upload.chunk_length(i) for i in upload.received) for upload in uploads),
+            'expired': self.expired,
+        }
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Startup Warm-up
+Prebuilt LibreOffice profile snapshot and throwaway conversions run before reporting ready
+
+Run as `python3 warmup.py <snapshot_dir>` at image build time to bake the snapshot in.
+"""
+
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+
+from lo_pool import convert_with_soffice
+
+logger = logging.getLogger(__name__)
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'warmup')
+
+# One small document per LibreOffice module, with Hangul so the CJK fonts get loaded; the
+# packages below warm the DOCX, XLSX, PPTX and HWPX import filters, and shipped samples in
+# SAMPLES_DIR cover binary formats (HWP via H2Orestart)
+BUILTIN_SAMPLES = {
+    'warmup.txt': '가나다라 Warm-up 문서\n',
+    'warmup.csv': '이름,값\n가나다,1\n',
+    'warmup.fodp': (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<office:document xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0"'
+        ' xmlns:draw="urn:oasis:names:tc:opendocument:xmlns:drawing:1.0"'
+        ' xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0"'
+        ' xmlns:svg="urn:oasis:names:tc:opendocument:xmlns:svg-compatible:1.0"'
+        ' office:version="1.2" office:mimetype="application/vnd.oasis.opendocument.presentation">'
+        '<office:body><office:presentation><draw:page draw:name="page1">'
+        '<draw:frame svg:x="2cm" svg:y="2cm" svg:width="10cm" svg:height="3cm">'
+        '<draw:text-box><text:p>가나다라 Warm-up</text:p></draw:text-box></draw:frame>'
+        '</draw:page></office:presentation></office:body></office:document>\n'
+    ),
+}
+
+_XML = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_CT = 'application/vnd.openxmlformats-officedocument.'
+_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/'
+_PML = ('xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main"'
+        ' xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+        ' xmlns:p="http://schemas.openxmlformats.org/presentationml/2006/main"')
+_SHAPES = ('<p:cSld><p:spTree><p:nvGrpSpPr><p:cNvPr id="1" name=""/><p:cNvGrpSpPr/><p:nvPr/></p:nvGrpSpPr>'
+           '<p:grpSpPr/>{}</p:spTree></p:cSld>')
+_COLOR_MAP = ('<p:clrMap bg1="lt1" tx1="dk1" bg2="lt2" tx2="dk2" accent1="accent1" accent2="accent2"'
+              ' accent3="accent3" accent4="accent4" accent5="accent5" accent6="accent6" hlink="hlink"'
+              ' folHlink="folHlink"/>')
+
+
+def _content_types(overrides):
+    return (_XML + '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            + ''.join(f'<Override PartName="/{part}" ContentType="{_CT}{kind}"/>' for part, kind in overrides)
+            + '</Types>')
+
+
+def _relationships(targets):
+    return (_XML + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + ''.join(f'<Relationship Id="rId{i}" Type="{kind}" Target="{target}"/>'
+                      for i, (kind, target) in enumerate(targets, 1))
+            + '</Relationships>')
+
+
+def _theme():
+    colors = ''.join(f'<a:{name}><a:srgbClr val="{value}"/></a:{name}>' for name, value in (
+        ('dk1', '000000'), ('lt1', 'FFFFFF'), ('dk2', '44546A'), ('lt2', 'E7E6E6'), ('accent1', '4472C4'),
+        ('accent2', 'ED7D31'), ('accent3', 'A5A5A5'), ('accent4', 'FFC000'), ('accent5', '5B9BD5'),
+        ('accent6', '70AD47'), ('hlink', '0563C1'), ('folHlink', '954F72')))
+    fonts = '<a:latin typeface="Calibri"/><a:ea typeface=""/><a:cs typeface=""/>'
+    fill = '<a:solidFill><a:schemeClr val="phClr"/></a:solidFill>'
+    line = f'<a:ln w="6350">{fill}</a:ln>'
+    return (_XML + '<a:theme xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" name="Warm-up">'
+            f'<a:themeElements><a:clrScheme name="Warm-up">{colors}</a:clrScheme>'
+            f'<a:fontScheme name="Warm-up"><a:majorFont>{fonts}</a:majorFont><a:minorFont>{fonts}</a:minorFont>'
+            f'</a:fontScheme><a:fmtScheme name="Warm-up"><a:fillStyleLst>{fill * 3}</a:fillStyleLst>'
+            f'<a:lnStyleLst>{line * 3}</a:lnStyleLst>'
+            f'<a:effectStyleLst>{"<a:effectStyle><a:effectLst/></a:effectStyle>" * 3}</a:effectStyleLst>'
+            f'<a:bgFillStyleLst>{fill * 3}</a:bgFillStyleLst></a:fmtScheme></a:themeElements></a:theme>')
+
+
+# Office Open XML and HWPX documents are zip packages, built from these members
+# in order (HWPX wants its uncompressed mimetype first)
+PACKAGE_SAMPLES = {
+    'warmup.docx': [
+        ('[Content_Types].xml', _content_types([('word/document.xml',
+                                                 'wordprocessingml.document.main+xml')])),
+        ('_rels/.rels', _relationships([(_REL + 'officeDocument', 'word/document.xml')])),
+        ('word/document.xml', _XML + '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml'
+                                     '/2006/main"><w:body><w:p><w:r><w:t>가나다라 Warm-up 문서</w:t></w:r></w:p>'
+                                     '</w:body></w:document>'),
+    ],
+    'warmup.xlsx': [
+        ('[Content_Types].xml', _content_types([('xl/workbook.xml', 'spreadsheetml.sheet.main+xml'),
+                                                ('xl/worksheets/sheet1.xml', 'spreadsheetml.worksheet+xml')])),
+        ('_rels/.rels', _relationships([(_REL + 'officeDocument', 'xl/workbook.xml')])),
+        ('xl/workbook.xml', _XML + '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+                                   ' xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+                                   '<sheets><sheet name="시트1" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+        ('xl/_rels/workbook.xml.rels', _relationships([(_REL + 'worksheet', 'worksheets/sheet1.xml')])),
+        ('xl/worksheets/sheet1.xml', _XML + '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml'
+                                            '/2006/main"><sheetData><row r="1"><c r="A1" t="inlineStr"><is>'
+                                            '<t>가나다</t></is></c><c r="B1"><v>1</v></c></row></sheetData>'
+                                            '</worksheet>'),
+    ],
+    'warmup.pptx': [
+        ('[Content_Types].xml', _content_types([
+            ('ppt/presentation.xml', 'presentationml.presentation.main+xml'),
+            ('ppt/slideMasters/slideMaster1.xml', 'presentationml.slideMaster+xml'),
+            ('ppt/slideLayouts/slideLayout1.xml', 'presentationml.slideLayout+xml'),
+            ('ppt/slides/slide1.xml', 'presentationml.slide+xml'),
+            ('ppt/theme/theme1.xml', 'theme+xml'),
+        ])),
+        ('_rels/.rels', _relationships([(_REL + 'officeDocument', 'ppt/presentation.xml')])),
+        ('ppt/presentation.xml', _XML + f'<p:presentation {_PML}>'
+                                        '<p:sldMasterIdLst><p:sldMasterId id="2147483648" r:id="rId1"/>'
+                                        '</p:sldMasterIdLst><p:sldIdLst><p:sldId id="256" r:id="rId2"/></p:sldIdLst>'
+                                        '<p:sldSz cx="9144000" cy="6858000"/><p:notesSz cx="6858000" cy="9144000"/>'
+                                        '</p:presentation>'),
+        ('ppt/_rels/presentation.xml.rels', _relationships([
+            (_REL + 'slideMaster', 'slideMasters/slideMaster1.xml'),
+            (_REL + 'slide', 'slides/slide1.xml'),
+            (_REL + 'theme', 'theme/theme1.xml'),
+        ])),
+        ('ppt/slideMasters/slideMaster1.xml', _XML + f'<p:sldMaster {_PML}>' + _SHAPES.format('') + _COLOR_MAP
+                                              + '<p:sldLayoutIdLst><p:sldLayoutId id="2147483649" r:id="rId1"/>'
+                                                '</p:sldLayoutIdLst></p:sldMaster>'),
+        ('ppt/slideMasters/_rels/slideMaster1.xml.rels', _relationships([
+            (_REL + 'slideLayout', '../slideLayouts/slideLayout1.xml'),
+            (_REL + 'theme', '../theme/theme1.xml'),
+        ])),
+        ('ppt/slideLayouts/slideLayout1.xml', _XML + f'<p:sldLayout {_PML} type="blank">' + _SHAPES.format('')
+                                              + '<p:clrMapOvr><a:masterClrMapping/></p:clrMapOvr></p:sldLayout>'),
+        ('ppt/slideLayouts/_rels/slideLayout1.xml.rels', _relationships([
+            (_REL + 'slideMaster', '../slideMasters/slideMaster1.xml'),
+        ])),
+        ('ppt/slides/slide1.xml', _XML + f'<p:sld {_PML}>' + _SHAPES.format(
+            '<p:sp><p:nvSpPr><p:cNvPr id="2" name="Warm-up"/><p:cNvSpPr txBox="1"/><p:nvPr/></p:nvSpPr>'
+            '<p:spPr><a:xfrm><a:off x="720000" y="720000"/><a:ext cx="3600000" cy="1080000"/></a:xfrm>'
+            '<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></p:spPr><p:txBody><a:bodyPr/><a:lstStyle/>'
+            '<a:p><a:r><a:rPr lang="ko-KR"/><a:t>가나다라 Warm-up</a:t></a:r></a:p></p:txBody></p:sp>')
+            + '<p:clrMapOvr><a:masterClrMapping/></p:clrMapOvr></p:sld>'),
+        ('ppt/slides/_rels/slide1.xml.rels', _relationships([
+            (_REL + 'slideLayout', '../slideLayouts/slideLayout1.xml'),
+        ])),
+        ('ppt/theme/theme1.xml', _theme()),
+    ],
+    'warmup.hwpx': [
+        ('mimetype', 'application/hwp+zip'),
+        ('version.xml', _XML + '<hv:HCFVersion xmlns:hv="http://www.hancom.co.kr/hwpml/2011/version"'
+                               ' tagetApplication="WORDPROCESSOR" major="5" minor="1" micro="0" buildNumber="1"'
+                               ' os="1" xmlVersion="1.4" application="Hancom Office Hangul" appVersion="11, 0, 0, 0"/>'),
+        ('META-INF/container.xml', _XML + '<ocf:container xmlns:ocf="urn:oasis:names:tc:opendocument:xmlns:container"'
+                                          '><ocf:rootfiles><ocf:rootfile full-path="Contents/content.hpf"'
+                                          ' media-type="application/hwpml-package+xml"/></ocf:rootfiles>'
+                                          '</ocf:container>'),
+        ('Contents/content.hpf', _XML + '<opf:package xmlns:opf="http://www.idpf.org/2007/opf/" version="" id="">'
+                                        '<opf:metadata/><opf:manifest>'
+                                        '<opf:item id="header" href="Contents/header.xml" media-type="application/xml"/>'
+                                        '<opf:item id="section0" href="Contents/section0.xml"'
+                                        ' media-type="application/xml"/></opf:manifest><opf:spine>'
+                                        '<opf:itemref idref="header" linear="yes"/>'
+                                        '<opf:itemref idref="section0" linear="yes"/></opf:spine></opf:package>'),
+        ('Contents/header.xml', _XML + '<hh:head xmlns:hh="http://www.hancom.co.kr/hwpml/2011/head" version="1.4"'
+                                       ' secCnt="1"><hh:beginNum page="1" footnote="1" endnote="1" pic="1" tbl="1"'
+                                       ' equation="1"/><hh:refList><hh:fontfaces itemCnt="2">'
+                                       + ''.join(f'<hh:fontface lang="{lang}" fontCnt="1"><hh:font id="0"'
+                                                 f' face="함초롬바탕" type="TTF" isEmbedded="0"/></hh:fontface>'
+                                                 for lang in ('HANGUL', 'LATIN'))
+                                       + '</hh:fontfaces><hh:charProperties itemCnt="1"><hh:charPr id="0"'
+                                         ' height="1000" textColor="#000000" shadeColor="none" useFontSpace="0"'
+                                         ' useKerning="0" symMark="NONE" borderFillIDRef="0"><hh:fontRef hangul="0"'
+                                         ' latin="0" hanja="0" japanese="0" other="0" symbol="0" user="0"/>'
+                                         '</hh:charPr></hh:charProperties><hh:paraProperties itemCnt="1">'
+                                         '<hh:paraPr id="0"><hh:align horizontal="JUSTIFY" vertical="BASELINE"/>'
+                                         '<hh:lineSpacing type="PERCENT" value="160" unit="HWPUNIT"/></hh:paraPr>'
+                                         '</hh:paraProperties><hh:styles itemCnt="1"><hh:style id="0" type="PARA"'
+                                         ' name="바탕글" engName="Normal" paraPrIDRef="0" charPrIDRef="0"'
+                                         ' nextStyleIDRef="0" langID="1042" lockForm="0"/></hh:styles>'
+                                         '</hh:refList></hh:head>'),
+        ('Contents/section0.xml', _XML + '<hs:sec xmlns:hs="http://www.hancom.co.kr/hwpml/2011/section"'
+                                         ' xmlns:hp="http://www.hancom.co.kr/hwpml/2011/paragraph">'
+                                         '<hp:p id="0" paraPrIDRef="0" styleIDRef="0" pageBreak="0" columnBreak="0"'
+                                         ' merged="0"><hp:run charPrIDRef="0"><hp:secPr textDirection="HORIZONTAL">'
+                                         '<hp:pagePr landscape="WIDELY" width="59528" height="84188"'
+                                         ' gutterType="LEFT_ONLY"><hp:margin header="4252" footer="4252" gutter="0"'
+                                         ' left="8504" right="8504" top="5668" bottom="4252"/></hp:pagePr></hp:secPr>'
+                                         '<hp:t>가나다라 Warm-up 문서</hp:t></hp:run></hp:p></hs:sec>'),
+    ],
+}
+
+
+def _write_package(path, members):
+    with zipfile.ZipFile(path, 'w') as package:
+        for name, content in members:
+            package.writestr(name, content, zipfile.ZIP_STORED if name == 'mimetype' else zipfile.ZIP_DEFLATED)
+
+
+def write_samples(out_dir):
+    """Put every warm-up document into out_dir and return their paths"""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for name, content in BUILTIN_SAMPLES.items():
+        path = os.path.join(out_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        paths.append(path)
+    for name, members in PACKAGE_SAMPLES.items():
+        path = os.path.join(out_dir, name)
+        _write_package(path, members)
+        paths.append(path)
+    if os.path.isdir(SAMPLES_DIR):
+        for name in sorted(os.listdir(SAMPLES_DIR)):
+            paths.append(shutil.copy(os.path.join(SAMPLES_DIR, name), os.path.join(out_dir, name)))
+    return paths
+
+
+def build_snapshot(snapshot_dir, timeout=120):
+    """Create a LibreOffice user profile at snapshot_dir unless one is there
+
+    The profile is made by converting every warm-up document in it, which
+    registers shared extensions and fills the profile's caches. It is moved
+    into place only when complete. Returns True if a snapshot was built.
+    """
+    if os.path.isdir(snapshot_dir):
+        return False
+
+    work_dir = tempfile.mkdtemp(prefix='lo-snapshot-')
+    try:
+        profile_dir = os.path.join(work_dir, 'profile')
+        for path in write_samples(os.path.join(work_dir, 'samples')):
+            convert_with_soffice(path, work_dir, timeout, profile_dir=profile_dir)
+        os.makedirs(os.path.dirname(snapshot_dir) or '.', exist_ok=True)
+        shutil.move(profile_dir, snapshot_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return True
+
+
+class WarmUp:
+    """Named startup stages run once on a background thread; ready once all have run
+
+    A failing stage is logged and recorded but does not hold readiness back;
+    the server can still convert, only more slowly at first.
+    """
+
+    def __init__(self):
+        self.steps = []
+        self.seconds = None
+        self._ready = threading.Event()
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def start(self, stages):
+        threading.Thread(target=self._run, args=(stages,), name='warm-up', daemon=True).start()
+
+    def _run(self, stages):
+        started = time.monotonic()
+        for name, fn in stages:
+            step_started = time.monotonic()
+            error = None
+            try:
+                fn()
+            except Exception as e:
+                error = str(e)
+                logger.warning('Warm-up step %r failed: %s', name, e)
+            seconds = time.monotonic() - step_started
+            logger.info('Warm-up step %r took %.2fs', name, seconds)
+            self.steps.append({'step': name, 'seconds': round(seconds, 3), 'error': error})
+
+        self.seconds = round(time.monotonic() - started, 3)
+        logger.info('Warm-up finished in %.2fs', self.seconds)
+        self._ready.set()
+
+    def status(self):
+        return {
+            'ready': self.ready,
+            'seconds': self.seconds,
+            'steps': list(self.steps),
+        }
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) != 2:
+        sys.exit('usage: warmup.py <snapshot_dir>')
+    started = time.monotonic()
+    built = build_snapshot(sys.argv[1])
+    logger.info('Profile snapshot %s %s in %.2fs', sys.argv[1], 'built' if built else 'already present',
+                time.monotonic() - started)
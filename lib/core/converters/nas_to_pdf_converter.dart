@@ -3,6 +3,7 @@ import 'dart:convert';
 import 'dart:io';
 import 'dart:typed_data';
 
+import 'package:crypto/crypto.dart';
 import 'package:flutter/services.dart';
 import 'package:path/path.dart' as p;
 
@@ -26,6 +27,9 @@ class NasToPdfConverter implements DocumentConverter {
   /// HWP/HWPX 변환 엔드포인트 (Flask)
   static const _hwpUrl = 'https://kkomjang.synology.me:4000/convert';
 
+  /// 변환 결과 조회 엔드포인트 (Flask) - 파일 해시로 캐시된 PDF 조회
+  static const _resultsUrl = 'https://kkomjang.synology.me:4000/results';
+
   /// Office 문서 변환 엔드포인트 (Gotenberg) - 4000 포트로 통합
   static const _officeUrl =
       'https://kkomjang.synology.me:4000/forms/libreoffice/convert';
@@ -46,8 +50,16 @@ class NasToPdfConverter implements DocumentConverter {
     final url = _getEndpointUrl(ext);
     final fieldName = _getFieldName(ext);
 
-    // 3. NAS API 호출 (자동 retry 포함)
+    // 3. 서버에 이미 변환된 결과가 있으면 업로드 없이 받아옴 (Flask만 지원)
     final fileName = p.basename(filePath);
+    if (url == _hwpUrl) {
+      final known = await _fetchKnownResult(fileBytes, fileName);
+      if (known != null) {
+        return known;
+      }
+    }
+
+    // 4. NAS API 호출 (자동 retry 포함)
     return _requestConversionWithRetry(fileBytes, fileName, url, fieldName);
   }
 
@@ -117,6 +129,56 @@ class NasToPdfConverter implements DocumentConverter {
     throw lastException ?? Exception('변환 실패: 최대 재시도 횟수($maxRetries)를 초과했습니다.');
   }
 
+  /// 파일 해시로 서버 캐시를 먼저 조회
+  ///
+  /// 캐시 미스(404)나 네트워크 오류 시 null을 반환하고, 호출 측에서 업로드로 진행
+  Future<Uint8List?> _fetchKnownResult(
+    Uint8List fileBytes,
+    String fileName,
+  ) async {
+    final hash = sha256.convert(fileBytes).toString();
+    final client = HttpClient();
+    client.connectionTimeout = const Duration(seconds: 10);
+    try {
+      final request = await client.getUrl(
+        Uri.parse('$_resultsUrl/$hash?format=pdf'),
+      );
+      request.headers.set(
+        HttpHeaders.authorizationHeader,
+        'Basic a2tvbWk6a2tvbWk=',
+      );
+      final response = await request.close().timeout(
+        const Duration(seconds: 10),
+      );
+
+      if (response.statusCode != HttpStatus.ok) {
+        await response.drain<void>();
+        appLogger.d(
+          '[NasToPdfConverter] No known result for $fileName '
+          '(${response.statusCode}), uploading',
+        );
+        return null;
+      }
+
+      final responseBytes = await _readResponseBytes(
+        response,
+      ).timeout(const Duration(seconds: 65));
+      appLogger.d(
+        '[NasToPdfConverter] Known result for $fileName: '
+        '${responseBytes.length} bytes, upload skipped',
+      );
+      return responseBytes;
+    } catch (e) {
+      appLogger.w(
+        '[NasToPdfConverter] Result lookup failed, uploading instead',
+        error: e,
+      );
+      return null;
+    } finally {
+      client.close(force: true);
+    }
+  }
+
   String _getEndpointUrl(String extension) {
     switch (extension) {
       case 'hwp':
@@ -2,14 +2,28 @@
 """
 Test script for document conversion API on kkomjang.synology.me:4000
 Tests all sample files (HWP, HWPX, DOC, DOCX, XLS, XLSX, PPT, PPTX)
+
+Also works as a load-testing benchmark:
+    python3 test_conversions.py --concurrency 1,4,8 --requests 20 --output results.json
+    python3 test_conversions.py --concurrency 4 --requests 10,hwp=20,pptx=5
+    python3 test_conversions.py --target local --compare baseline.json
+    python3 test_conversions.py --target stub   # offline, no LibreOffice needed
 """
 
+import argparse
+import json
+import math
 import os
+import subprocess
 import sys
+import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import requests
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 # ANSI color codes
 GREEN = '\033[92m'
@@ -30,6 +44,11 @@ HWP_EXTENSIONS = {'.hwp'}
 HWPX_EXTENSIONS = {'.hwpx'}
 OFFICE_EXTENSIONS = {'.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx'}
 
+# Local targets
+SERVER_PATH = Path(__file__).resolve().parent.parent / 'docker' / 'hwp-converter' / 'server.py'
+LOCAL_PORT = 3900
+STUB_PDF = b'%PDF-1.4\n1 0 obj<</Type/Catalog>>endobj\ntrailer<</Root 1 0 R>>\n%%EOF\n'
+
 def format_size(bytes_size: int) -> str:
     """Format bytes to human-readable size"""
     for unit in ['B', 'KB', 'MB']:
@@ -38,10 +57,14 @@ def format_size(bytes_size: int) -> str:
         bytes_size /= 1024.0
     return f"{bytes_size:.2f} GB"
 
-def test_conversion(file_path: Path) -> Tuple[bool, Dict]:
+def test_conversion(file_path: Path, base_url: Optional[str] = None) -> Tuple[bool, Dict]:
     """
     Test document conversion for a single file
 
+    With base_url, every format is posted to {base_url}/convert (the
+    converter server in docker/hwp-converter); otherwise the NAS routing
+    table above is used.
+
     Returns:
         (success: bool, result: dict with status, time, size, error)
     """
@@ -51,6 +74,7 @@ def test_conversion(file_path: Path) -> Tuple[bool, Dict]:
         'input_size': format_size(file_path.stat().st_size),
         'status_code': None,
         'time': None,
+        'seconds': None,
         'output_size': None,
         'error': None
     }
@@ -58,7 +82,10 @@ def test_conversion(file_path: Path) -> Tuple[bool, Dict]:
     try:
         # Determine endpoint and field name based on file type
         file_ext = file_path.suffix.lower()
-        if file_ext in HWP_EXTENSIONS:
+        if base_url:
+            url = f"{base_url}/convert"
+            field_name = 'file'
+        elif file_ext in HWP_EXTENSIONS:
             url = HWP_URL
             field_name = 'file'  # Flask uses singular 'file'
         elif file_ext in HWPX_EXTENSIONS:
@@ -88,6 +115,7 @@ def test_conversion(file_path: Path) -> Tuple[bool, Dict]:
 
             result['status_code'] = response.status_code
             result['time'] = f"{elapsed_time:.2f}s"
+            result['seconds'] = elapsed_time
 
             # Check response
             if response.status_code == 200:
@@ -104,13 +132,16 @@ def test_conversion(file_path: Path) -> Tuple[bool, Dict]:
         result['error'] = str(e)
         return False, result
 
-def print_header():
+def print_header(base_url: Optional[str] = None):
     """Print test header"""
     print(f"\n{BLUE}{'='*80}{RESET}")
     print(f"{BLUE}Document Conversion Test Suite{RESET}")
-    print(f"{BLUE}HWP:       {HWP_URL}{RESET}")
-    print(f"{BLUE}HWPX:      {HWPX_URL}{RESET}")
-    print(f"{BLUE}Office:    {OFFICE_URL}{RESET}")
+    if base_url:
+        print(f"{BLUE}All:       {base_url}/convert{RESET}")
+    else:
+        print(f"{BLUE}HWP:       {HWP_URL}{RESET}")
+        print(f"{BLUE}HWPX:      {HWPX_URL}{RESET}")
+        print(f"{BLUE}Office:    {OFFICE_URL}{RESET}")
     print(f"{BLUE}{'='*80}{RESET}\n")
 
 def print_result(success: bool, result: Dict):
@@ -151,13 +182,139 @@ def print_summary(results: List[Tuple[bool, Dict]]):
     print(f"\nTotal execution time: {total_time:.2f}s")
     print(f"{BLUE}{'='*80}{RESET}\n")
 
-def main():
-    """Main test function"""
-    # Disable SSL warnings
-    import urllib3
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of values (None when empty)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+def run_level(file_path: Path, concurrency: int, request_count: int, base_url: Optional[str]) -> Dict:
+    """Send request_count conversions of one sample, concurrency at a time"""
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(lambda _: test_conversion(file_path, base_url), range(request_count)))
+    wall_time = time.time() - start_time
+
+    latencies = [result['seconds'] for success, result in outcomes if success]
+    errors = sum(1 for success, _ in outcomes if not success)
+    error_kinds = sorted({result['error'] for success, result in outcomes if not success})
+
+    return {
+        'file': file_path.name,
+        'format': file_path.suffix.lower().lstrip('.'),
+        'concurrency': concurrency,
+        'requests': request_count,
+        'ok': len(latencies),
+        'errors': errors,
+        'error_rate': errors / request_count,
+        'error_kinds': error_kinds,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'mean': sum(latencies) / len(latencies) if latencies else None,
+        'throughput': len(latencies) / wall_time if wall_time > 0 else 0.0,
+        'wall_time': wall_time,
+    }
+
+def _fmt_seconds(value: Optional[float]) -> str:
+    return f"{value:.3f}s" if value is not None else "-"
+
+def print_bench_result(row: Dict):
+    """Print latency/throughput line for one sample at one concurrency level"""
+    color = GREEN if row['errors'] == 0 else (YELLOW if row['ok'] else RED)
+    print(f"{color}[{row['format']:5s}]{RESET} {row['file']:24s} c={row['concurrency']:<3d} n={row['requests']:<4d} "
+          f"p50 {_fmt_seconds(row['p50']):>8s}  p95 {_fmt_seconds(row['p95']):>8s}  "
+          f"p99 {_fmt_seconds(row['p99']):>8s}  {row['throughput']:6.2f} req/s  "
+          f"err {row['error_rate'] * 100:5.1f}%")
+    for kind in row['error_kinds']:
+        print(f"        {RED}{kind}{RESET}")
+
+def compare_results(rows: List[Dict], baseline_path: Path, threshold: float) -> List[str]:
+    """Return one message per regression against a saved results file"""
+    baseline = json.loads(baseline_path.read_text())
+    base_rows = {(row['file'], row['concurrency']): row for row in baseline['results']}
+    regressions = []
+
+    for row in rows:
+        base = base_rows.get((row['file'], row['concurrency']))
+        if base is None:
+            continue
+        label = f"{row['file']} c={row['concurrency']}"
+
+        if base['p95'] and row['p95'] and row['p95'] > base['p95'] * (1 + threshold):
+            regressions.append(f"{label}: p95 {base['p95']:.3f}s → {row['p95']:.3f}s")
+        if base['throughput'] and row['throughput'] < base['throughput'] * (1 - threshold):
+            regressions.append(f"{label}: throughput {base['throughput']:.2f} → {row['throughput']:.2f} req/s")
+        if row['error_rate'] > base['error_rate'] + 0.01:
+            regressions.append(f"{label}: error rate {base['error_rate']:.1%} → {row['error_rate']:.1%}")
+
+    return regressions
+
+class StubConverterHandler(BaseHTTPRequestHandler):
+    """Stand-in for the converter: answers /convert with a tiny PDF after a delay"""
+
+    base_delay = 0.05
+    bytes_per_second = 5 * 1024 * 1024
+
+    def do_GET(self):
+        self._reply(200, b'{"status": "ok"}', 'application/json')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        time.sleep(self.base_delay + length / self.bytes_per_second)
+        self._reply(200, STUB_PDF, 'application/pdf')
+
+    def _reply(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub(port: int, delay: float) -> ThreadingHTTPServer:
+    StubConverterHandler.base_delay = delay
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubConverterHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
 
-    # Find all sample files
+def start_local_server(port: int, state_dir: str, server_cache: bool) -> subprocess.Popen:
+    """Run docker/hwp-converter/server.py with its state under state_dir"""
+    env = dict(os.environ,
+               PORT=str(port),
+               WORK_DIR=os.path.join(state_dir, 'work'),
+               CACHE_DIR=os.path.join(state_dir, 'cache'),
+               THUMBNAIL_CACHE_DIR=os.path.join(state_dir, 'thumbnails'),
+               TEXT_CACHE_DIR=os.path.join(state_dir, 'text'),
+               PROFILE_DIR=os.path.join(state_dir, 'debug'),
+               SPOOL_RAM_DIR=os.path.join(state_dir, 'spool-ram'),
+               LO_PROFILE_DIR=os.path.join(state_dir, 'lo-profiles'),
+               LO_PROFILE_SNAPSHOT=os.path.join(state_dir, 'lo-profile-snapshot'))
+    if not server_cache:
+        env['CACHE_MAX_MB'] = '0'
+
+    process = subprocess.Popen([sys.executable, str(SERVER_PATH)], env=env, cwd=str(SERVER_PATH.parent),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 300  # /ready waits for the profile snapshot and warm-up conversions
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server.py exited with code {process.returncode}")
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/ready", timeout=2).status_code == 200:
+                return process
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("server.py did not become ready")
+
+def find_sample_files() -> List[Path]:
+    """Find all sample files in the current directory"""
     current_dir = Path.cwd()
     extensions = ['.hwp', '.hwpx', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx']
 
@@ -176,21 +333,146 @@ def main():
         print(f"Looking for: {', '.join(extensions)}")
         sys.exit(1)
 
-    print_header()
+    return sample_files
+
+def request_counts(spec: str) -> Tuple[Optional[int], Dict[str, int]]:
+    """'10,hwp=20,pptx=5' -> (10, {'hwp': 20, 'pptx': 5}); the bare number is the default for other formats"""
+    default = None
+    per_format = {}
+    for part in spec.split(','):
+        name, _, count = part.rpartition('=')
+        name = name.strip().lower().lstrip('.')
+        try:
+            value = int(count)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f'not a request count: {part!r}')
+        if value < 1:
+            raise argparse.ArgumentTypeError(f'request counts must be at least 1: {part!r}')
+        if name:
+            per_format[name] = value
+        else:
+            default = value
+    return default, per_format
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', choices=['remote', 'local', 'stub'], default='remote',
+                        help='remote NAS (default), local docker/hwp-converter/server.py, or an offline stub')
+    parser.add_argument('--concurrency', default=None,
+                        help='comma-separated concurrency levels, e.g. 1,4,8 (enables benchmark mode)')
+    parser.add_argument('--requests', type=request_counts, default=None,
+                        help='requests per sample per concurrency level, e.g. 20 or 10,hwp=20,pptx=5 '
+                             '(per format; the bare number, else the highest concurrency, for the rest; '
+                             'enables benchmark mode)')
+    parser.add_argument('--formats', default=None, help='only these extensions, e.g. hwp,docx')
+    parser.add_argument('--output', type=Path, help='write benchmark results as JSON')
+    parser.add_argument('--compare', type=Path, help='flag regressions against a saved results JSON')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative p95/throughput change counted as a regression (default 0.2)')
+    parser.add_argument('--timeout', type=int, default=TIMEOUT, help='per-request timeout in seconds')
+    parser.add_argument('--port', type=int, default=LOCAL_PORT, help='port for local/stub targets')
+    parser.add_argument('--stub-delay', type=float, default=0.05, help='stub base latency in seconds')
+    parser.add_argument('--server-cache', action='store_true',
+                        help='keep the local server PDF cache on (repeat requests then measure cache hits)')
+    return parser.parse_args()
+
+def run_tests(sample_files: List[Path], base_url: Optional[str]) -> bool:
+    """Original pass/fail run: every sample once"""
+    print_header(base_url)
     print(f"Found {len(sample_files)} sample files\n")
 
     # Run tests
     results = []
     for file_path in sample_files:
-        success, result = test_conversion(file_path)
+        success, result = test_conversion(file_path, base_url)
         print_result(success, result)
         results.append((success, result))
 
     # Print summary
     print_summary(results)
+    return all(success for success, _ in results)
+
+def run_benchmark(sample_files: List[Path], base_url: Optional[str], args: argparse.Namespace) -> bool:
+    levels = [int(level) for level in (args.concurrency or '1').split(',')]
+    default_count, per_format = args.requests or (None, {})
+    default_count = default_count or max(levels)
+    counts = ', '.join([f'{fmt}={count}' for fmt, count in sorted(per_format.items())] + [f'others={default_count}'])
+
+    print_header(base_url)
+    print(f"Benchmark: {len(sample_files)} samples × concurrency {levels} × requests ({counts})\n")
+
+    rows = []
+    for file_path in sample_files:
+        request_count = per_format.get(file_path.suffix.lower().lstrip('.'), default_count)
+        for concurrency in levels:
+            row = run_level(file_path, concurrency, request_count, base_url)
+            print_bench_result(row)
+            rows.append(row)
+
+    if args.output:
+        args.output.write_text(json.dumps({
+            'target': args.target,
+            'base_url': base_url,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': rows,
+        }, indent=2))
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        regressions = compare_results(rows, args.compare, args.threshold)
+        print(f"\n{BLUE}Compared with {args.compare} (threshold {args.threshold:.0%}){RESET}")
+        for message in regressions:
+            print(f"{RED}REGRESSION{RESET} {message}")
+        if not regressions:
+            print(f"{GREEN}No regressions{RESET}")
+        return not regressions
+
+    return all(row['errors'] == 0 for row in rows)
+
+def main():
+    """Main test function"""
+    global TIMEOUT
+
+    # Disable SSL warnings
+    import urllib3
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    args = parse_args()
+    TIMEOUT = args.timeout
+
+    sample_files = find_sample_files()
+    if args.formats:
+        wanted = {f".{ext.strip().lower().lstrip('.')}" for ext in args.formats.split(',')}
+        sample_files = [path for path in sample_files if path.suffix.lower() in wanted]
+
+    stub = None
+    local_server = None
+    state_dir = None
+    base_url = None
+    try:
+        if args.target == 'stub':
+            stub = start_stub(args.port, args.stub_delay)
+            base_url = f"http://127.0.0.1:{args.port}"
+        elif args.target == 'local':
+            state_dir = tempfile.TemporaryDirectory(prefix='converter-bench-')
+            local_server = start_local_server(args.port, state_dir.name, args.server_cache)
+            base_url = f"http://127.0.0.1:{args.port}"
+
+        if args.concurrency or args.requests or args.output or args.compare:
+            success = run_benchmark(sample_files, base_url, args)
+        else:
+            success = run_tests(sample_files, base_url)
+    finally:
+        if stub is not None:
+            stub.shutdown()
+        if local_server is not None:
+            local_server.terminate()
+            local_server.wait()
+        if state_dir is not None:
+            state_dir.cleanup()
 
     # Exit code based on results
-    sys.exit(0 if all(success for success, _ in results) else 1)
+    sys.exit(0 if success else 1)
 
 if __name__ == '__main__':
     main()
@@ -4,14 +4,838 @@ HWPX Flask Integration
 Add this to existing hwp_converter.py
 """
 
+import asyncio
+import collections
+import contextlib
+import functools
+import hashlib
+import json
+import logging
 import os
+import queue
+import resource
+import shutil
+import signal
 import subprocess
+import sys
 import tempfile
-from flask import Flask, request, send_file, jsonify
+import threading
+import time
+import traceback
+import uuid
+from flask import Flask, Response, request, send_file, jsonify, make_response
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import ClosingIterator
+
+try:
+    import uvicorn
+    from a2wsgi import WSGIMiddleware
+except ImportError:  # uvicorn/a2wsgi missing -> Flask development server
+    uvicorn = None
 
 app = Flask(__name__)
 
+JAR_PATH = '/app/hwpx-converter-1.0.0.jar'  # Docker container path
+HWPX_TIMEOUT = 180
+CHUNK_SIZE = 1024 * 1024  # upload bytes copied to disk at a time
+JAVA_MAX_HEAP_MB = int(os.environ.get('JAVA_MAX_HEAP_MB', '1024'))  # -Xmx per JVM, 0 = JVM default
+JAVA_HEAP_ARGS = [f'-Xmx{JAVA_MAX_HEAP_MB}m'] if JAVA_MAX_HEAP_MB else []
+
+# Resident JVMs running `--serve` (HWPX_WORKERS=0 uses `java -jar` per request)
+HWPX_WORKERS = int(os.environ.get('HWPX_WORKERS', '1'))
+HWPX_WORKER_MAX_JOBS = int(os.environ.get('HWPX_WORKER_MAX_JOBS', '200'))
+HWPX_WORKER_START_TIMEOUT = 60
+HWPX_RECYCLE_RSS = int(os.environ.get('HWPX_RECYCLE_RSS_MB', '1536')) * 1024 * 1024  # resident JVM size that restarts it
+HWPX_RECYCLE_CPU_SECONDS = int(os.environ.get('HWPX_RECYCLE_CPU_SECONDS', '3600'))  # CPU time that restarts it, 0 = never
+
+# Per-conversion limits on every JVM (0 disables one), as JOB_* in docker/hwp-converter; a JVM that
+# hits one is killed. JVMs reserve their heap up front, so -Xmx stands in for RLIMIT_AS. The CPU
+# budget counts GC and JIT threads too, hence the same default as the wall-clock HWPX_TIMEOUT.
+JOB_MAX_CPU_SECONDS = int(os.environ.get('JOB_MAX_CPU_SECONDS', '180'))
+JOB_STALL_SECONDS = int(os.environ.get('JOB_STALL_SECONDS', '30'))  # no CPU progress for this long
+JOB_MAX_RSS = int(os.environ.get('JOB_MAX_RSS_MB', '2048')) * 1024 * 1024
+
+# Listener and handler threads when served by uvicorn (see serve() below)
+SERVER_HOST = os.environ.get('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.environ.get('PORT', '5000'))
+SERVER_THREADS = int(os.environ.get('SERVER_THREADS', '16'))
+SERVER_KEEP_ALIVE = int(os.environ.get('SERVER_KEEP_ALIVE', '75'))
+SERVER_BACKLOG = int(os.environ.get('SERVER_BACKLOG', '2048'))
+
+
+class HwpxConversionError(Exception):
+    """Java converter failed; `details` carries its stderr"""
+
+    def __init__(self, message, details=''):
+        super().__init__(message)
+        self.details = details
+
+
+class HwpxResourceLimitExceeded(HwpxConversionError):
+    """JVM was killed for its memory or CPU use, or for making no progress"""
+
+    def __init__(self, reason, details=''):
+        super().__init__(f'Conversion stopped: {reason}', details)
+        self.reason = reason
+
+
+class _Call:
+    def __init__(self, share=None):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.share = share
+        self.followers = []
+
+
+class SingleFlight:
+    """Run fn once per key at a time; concurrent callers share its outcome"""
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, share=None):
+        """Return (result, shared); shared is True for callers that only waited
+
+        A waiter's share(result) runs on the leader's thread before the
+        leader returns, so it can take over a result the leader is about to
+        clean up (a file in its work dir); the waiter gets what it returned.
+        If the leading call raises, every waiter re-raises the same exception.
+        """
+        with self._lock:
+            leader = self._calls.get(key)
+            if leader is None:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                call = _Call(share)
+                leader.followers.append(call)
+                self.coalesced += 1
+
+        if leader is not None:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            # No waiter can join any more; hand each one the outcome
+            for follower in call.followers:
+                if call.error is not None:
+                    follower.error = call.error
+                else:
+                    try:
+                        follower.result = follower.share(call.result) if follower.share else call.result
+                    except Exception as e:
+                        follower.error = e
+                follower.done.set()
+        return call.result, False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+            }
+
+
+# Prometheus metrics (same text format as docker/hwp-converter/metrics.py)
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 180)
+BYTES_BUCKETS = (10e3, 100e3, 500e3, 1e6, 5e6, 10e6, 25e6, 50e6)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+            return child
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            children = sorted(self._children.items())
+        for key, child in children:
+            lines.extend(self._render_child(key, child))
+        return lines
+
+    def _render_child(self, key, child):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_number(child.value)}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _render_child(self, key, child):
+        lines = []
+        for bound, count in zip(child.buckets, child.counts):
+            labels = _format_labels(self.labelnames, key, [('le', _format_number(bound))])
+            lines.append(f'{self.name}_bucket{labels} {count}')
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f'{self.name}_sum{labels} {child.sum}')
+        lines.append(f'{self.name}_count{labels} {child.count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+QUEUE_WAIT = registry.histogram(
+    'converter_queue_wait_seconds', 'Time a conversion waited for a free JVM', ['format', 'engine'])
+CONVERSION_DURATION = registry.histogram(
+    'converter_conversion_duration_seconds', 'Time spent inside the conversion engine', ['format', 'engine'])
+INPUT_BYTES = registry.histogram(
+    'converter_input_bytes', 'Size of converted inputs', ['format', 'engine'], BYTES_BUCKETS)
+OUTPUT_BYTES = registry.histogram(
+    'converter_output_bytes', 'Size of produced outputs', ['format', 'engine'], BYTES_BUCKETS)
+CONVERSION_ERRORS = registry.counter(
+    'converter_conversion_errors_total',
+    'Failed conversions by reason (timeout, nonzero_exit, missing_output, stalled, memory, cpu_limit)',
+    ['format', 'engine', 'reason'])
+WORKER_KILLS = registry.counter(
+    'converter_worker_kills_total', 'Converter processes killed mid-conversion', ['engine', 'reason'])
+WORKER_RECYCLES = registry.counter(
+    'converter_worker_recycles_total', 'Resident JVMs restarted between conversions', ['engine', 'reason'])
+IN_FLIGHT = registry.gauge('converter_in_flight', 'Conversions currently running', ['engine'])
+HWPX_LABELS = {'format': 'hwpx', 'engine': 'java'}
+
+
+# Per-phase timing of /convert_hwpx: Server-Timing header and a JSON log line per request;
+# requests slower than PROFILE_THRESHOLD seconds (0 = never) keep stack samples and JVM stderr
+PROFILE_THRESHOLD = float(os.environ.get('PROFILE_THRESHOLD', '10'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'hwpx-profiles'))
+PROFILE_MAX_CAPTURES = int(os.environ.get('PROFILE_MAX_CAPTURES', '50'))
+PROFILE_INTERVAL = 0.05  # seconds between stack samples
+
+
+class RequestTiming:
+    """Phases of one request, recorded on the thread serving it"""
+
+    def __init__(self, path):
+        self.id = uuid.uuid4().hex[:16]
+        self.path = path
+        self.thread = threading.get_ident()
+        self.started = time.monotonic()
+        self.started_at = time.time()
+        self.phases = []
+        self.fields = {}
+        self.processes = []
+        self.samples = collections.Counter()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.monotonic() - started))
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def server_timing(self):
+        metrics = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.phases]
+        metrics.append(f'total;dur={self.elapsed() * 1000:.1f}')
+        return ', '.join(metrics)
+
+    def to_dict(self):
+        return {
+            'request_id': self.id,
+            'path': self.path,
+            'started_at': self.started_at,
+            'total_ms': round(self.elapsed() * 1000, 1),
+            'phases': [{'name': name, 'ms': round(seconds * 1000, 1)} for name, seconds in self.phases],
+            **self.fields,
+        }
+
+
+_timing = threading.local()
+timing_log = logging.getLogger('converter.timing')
+_slow_requests = set()
+_slow_requests_lock = threading.Lock()
+
+
+def _phase(name):
+    timing = getattr(_timing, 'current', None)
+    return timing.phase(name) if timing is not None else contextlib.nullcontext()
+
+
+def _record_process(args, returncode, seconds, stderr):
+    timing = getattr(_timing, 'current', None)
+    if timing is not None:
+        timing.processes.append({'args': [str(arg) for arg in args], 'returncode': returncode,
+                                 'seconds': round(seconds, 4), 'stderr': (stderr or '')[-4000:]})
+
+
+def _sample_slow_requests():
+    """Sample the stacks of requests past half of PROFILE_THRESHOLD; fast ones are never sampled"""
+    while True:
+        time.sleep(PROFILE_INTERVAL)
+        with _slow_requests_lock:
+            due = [timing for timing in _slow_requests if timing.elapsed() >= PROFILE_THRESHOLD / 2]
+        if not due:
+            continue
+        frames = sys._current_frames()
+        for timing in due:
+            frame = frames.get(timing.thread)
+            if frame is not None:
+                timing.samples[';'.join(f'{os.path.basename(f.filename)}:{f.name}:{f.lineno}'
+                                        for f in traceback.extract_stack(frame))] += 1
+
+
+def _save_profile(timing, record):
+    """Write a capture of a slow request and keep only the newest PROFILE_MAX_CAPTURES"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    capture = dict(record, processes=timing.processes, sample_interval_ms=PROFILE_INTERVAL * 1000,
+                   stacks=[{'stack': stack, 'samples': count} for stack, count in timing.samples.most_common(100)])
+    name = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(timing.started_at))}-{timing.id}.json"
+    path = os.path.join(PROFILE_DIR, name)
+    with open(path, 'w') as f:
+        json.dump(capture, f, ensure_ascii=False, indent=1)
+    for old in sorted(n for n in os.listdir(PROFILE_DIR) if n.endswith('.json'))[:-PROFILE_MAX_CAPTURES]:
+        os.remove(os.path.join(PROFILE_DIR, old))
+    return path
+
+
+def _timed(route):
+    """Server-Timing header and a JSON log line once the body is sent; a capture if slow"""
+    @functools.wraps(route)
+    def timed(*args, **kwargs):
+        timing = RequestTiming(request.path)
+        _timing.current = timing
+        if PROFILE_THRESHOLD > 0:
+            with _slow_requests_lock:
+                _slow_requests.add(timing)
+        response = None
+        try:
+            response = make_response(route(*args, **kwargs))
+        finally:
+            _timing.current = None
+            if response is None:
+                # The route raised: finish() below will never run to stop the sampling
+                with _slow_requests_lock:
+                    _slow_requests.discard(timing)
+        timing.fields.update(status=response.status_code, output_bytes=response.content_length)
+        response.headers['Server-Timing'] = timing.server_timing()
+        response.headers['X-Request-Id'] = timing.id
+        record = timing.to_dict()
+        sending = time.monotonic()
+
+        def finish():
+            timing.phases.append(('send', time.monotonic() - sending))
+            record.update(phases=timing.to_dict()['phases'], total_ms=round(timing.elapsed() * 1000, 1))
+            with _slow_requests_lock:
+                _slow_requests.discard(timing)
+            if PROFILE_THRESHOLD > 0 and timing.elapsed() >= PROFILE_THRESHOLD:
+                try:
+                    record['profile'] = _save_profile(timing, record)
+                except OSError as e:
+                    app.logger.warning(f"Could not save profile of request {timing.id}: {e}")
+            timing_log.info(json.dumps(record, ensure_ascii=False))
+
+        # send_file's passthrough body never calls Response.close, so close the iterator instead
+        response.response = ClosingIterator(response.response, finish)
+        return response
+    return timed
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _supervisor_loop():
+    """Event loop, on its own thread, that owns every JVM's pipes and exit status
+
+    Same design as docker/hwp-converter/governor.py: waiting on JVMs and
+    draining their output costs no threads; the request thread only blocks
+    on the result.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='jvm-supervisor', daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+def _supervise(coro):
+    """Run coro on the supervisor loop and wait for its result on the calling thread"""
+    return asyncio.run_coroutine_threadsafe(coro, _supervisor_loop()).result()
+
+
+# Kill reasons, as reported in metrics (the same as docker/hwp-converter/governor.py)
+STALLED = 'stalled'
+MEMORY = 'memory'
+CPU_LIMIT = 'cpu_limit'
+
+CLK_TCK = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def _jvm_usage(pid):
+    """(CPU seconds, resident bytes) of one JVM; it runs no child processes"""
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    # utime, stime are fields 14 and 15 of stat, rss is 24; the split drops the first two
+    return (int(fields[11]) + int(fields[12])) / CLK_TCK, int(fields[21]) * PAGE_SIZE
+
+
+def _cpu_rlimit(seconds):
+    """preexec_fn capping a one-shot JVM's CPU time: SIGXCPU, then SIGKILL 5s later if ignored"""
+    def apply():
+        if seconds:
+            resource.setrlimit(resource.RLIMIT_CPU, (seconds, seconds + 5))
+    return apply
+
+
+def _set_cpu_budget(pid, seconds):
+    """Let a running JVM use `seconds` more CPU time before SIGXCPU"""
+    try:
+        used, _ = _jvm_usage(pid)
+        _, hard = resource.prlimit(pid, resource.RLIMIT_CPU)
+        soft = int(used + seconds) + 1
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+        resource.prlimit(pid, resource.RLIMIT_CPU, (soft, hard))
+    except (OSError, IndexError, ValueError):
+        pass
+
+
+def _clear_cpu_budget(pid):
+    try:
+        _, hard = resource.prlimit(pid, resource.RLIMIT_CPU)
+        resource.prlimit(pid, resource.RLIMIT_CPU, (hard, hard))
+    except OSError:
+        pass
+
+
+class _JvmWatchdog:
+    """Kill a JVM that stops using CPU or grows past max_rss (governor.Watchdog for one process)
+
+    Runs as a coroutine on the supervisor loop; `reason` is set to STALLED
+    or MEMORY when it fired.
+    """
+
+    def __init__(self, process, stall_seconds=0, max_rss=0, interval=1.0):
+        self.process = process
+        self.stall_seconds = stall_seconds
+        self.max_rss = max_rss
+        self.interval = interval
+        self.reason = None
+
+    def start(self):
+        """The watch task, or None when no limit is set"""
+        if self.stall_seconds or self.max_rss:
+            return asyncio.ensure_future(self.watch())
+        return None
+
+    async def watch(self):
+        try:
+            last_cpu, _ = _jvm_usage(self.process.pid)
+            last_progress = time.monotonic()
+            while self.process.returncode is None:
+                await asyncio.sleep(self.interval)
+                cpu, rss = _jvm_usage(self.process.pid)
+                now = time.monotonic()
+                if cpu > last_cpu:
+                    last_cpu, last_progress = cpu, now
+                if self.max_rss and rss > self.max_rss:
+                    self._fire(MEMORY, f'resident memory {rss >> 20} MB')
+                    return
+                if self.stall_seconds and now - last_progress > self.stall_seconds:
+                    self._fire(STALLED, f'no CPU progress for {self.stall_seconds}s')
+                    return
+        except (OSError, IndexError, ValueError):
+            return  # exited between polls
+
+    def _fire(self, reason, detail):
+        if self.process.returncode is not None:
+            return
+        self.reason = reason
+        app.logger.warning(f"Killing JVM {self.process.pid}: {detail}")
+        self.process.kill()
+
+
+def _kill_reason(watchdog, returncode):
+    if watchdog.reason is not None:
+        return watchdog.reason
+    if returncode == -signal.SIGXCPU:
+        return CPU_LIMIT
+    return None
+
+
+class HwpxWorkerUnavailable(Exception):
+    """No resident JVM could take the job; callers fall back to `java -jar`"""
+
+
+class HwpxWorker:
+    """Resident JVM running HwpxToPdfConverter in --serve mode
+
+    The process and its pipes belong to the supervisor loop; start(),
+    convert() and stop() are called from request threads and block on it.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.home_dir = None
+        self.jobs = 0
+        self.stderr_tail = collections.deque(maxlen=50)
+        self.stderr_lines = 0
+
+    def start(self):
+        self.home_dir = tempfile.mkdtemp(prefix=f'hwpx-worker-{self.index}-')
+        try:
+            self.process = _supervise(self._spawn())
+        except OSError as e:
+            raise HwpxWorkerUnavailable(f'Cannot start JVM: {e}')
+
+        line, timed_out = _supervise(self._read_line(HWPX_WORKER_START_TIMEOUT))
+        if line != 'READY':
+            self.stop()
+            raise HwpxWorkerUnavailable('JVM did not become ready' + (' (timeout)' if timed_out else ''))
+        self.jobs = 0
+        app.logger.info(f"HWPX worker {self.index} ready (pid {self.process.pid})")
+
+    async def _spawn(self):
+        process = await asyncio.create_subprocess_exec(
+            'java', *JAVA_HEAP_ARGS, '-jar', JAR_PATH, '--serve',
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env={'HOME': self.home_dir}
+        )
+        asyncio.ensure_future(self._drain_stderr(process))
+        return process
+
+    def stop(self):
+        if self.process is not None:
+            _supervise(self._stop(self.process))
+            self.process = None
+        if self.home_dir is not None:
+            shutil.rmtree(self.home_dir, ignore_errors=True)
+            self.home_dir = None
+
+    @staticmethod
+    async def _stop(process):
+        try:
+            process.stdin.close()
+            await asyncio.wait_for(process.wait(), 5)
+        except (OSError, asyncio.TimeoutError):
+            if process.returncode is None:
+                process.kill()
+            await process.wait()
+
+    def is_alive(self):
+        return self.process is not None and self.process.returncode is None
+
+    def usage(self):
+        """(CPU seconds, resident bytes) of the JVM so far"""
+        if not self.is_alive():
+            return 0, 0
+        try:
+            return _jvm_usage(self.process.pid)
+        except (OSError, IndexError, ValueError):
+            return 0, 0
+
+    async def _drain_stderr(self, process):
+        # JVM logs go to stderr; keep the pipe from filling and remember the tail
+        while True:
+            line = await process.stderr.readline()
+            if not line:
+                return
+            self.stderr_tail.append(line.decode('utf-8', errors='replace'))
+            self.stderr_lines += 1
+
+    async def _read_line(self, timeout):
+        """Read one protocol line; kill the JVM if it takes longer than timeout"""
+        process = self.process
+        try:
+            line = await asyncio.wait_for(process.stdout.readline(), timeout)
+        except asyncio.TimeoutError:
+            if process.returncode is None:
+                process.kill()
+            return '', True
+        return line.decode('utf-8', errors='replace').strip(), False
+
+    async def _request(self, job, timeout):
+        """Send one job and read its result line; return (line, timed_out, kill reason)"""
+        process = self.process
+        watchdog = _JvmWatchdog(process, JOB_STALL_SECONDS, JOB_MAX_RSS)
+        watching = watchdog.start()
+        try:
+            process.stdin.write(job.encode('utf-8'))
+            await process.stdin.drain()
+            line, timed_out = await self._read_line(timeout)
+        finally:
+            if watching is not None:
+                watching.cancel()
+        if not line and not timed_out:
+            # Wait briefly for the exit status to tell SIGXCPU from a crash
+            try:
+                await asyncio.wait_for(process.wait(), 5)
+            except asyncio.TimeoutError:
+                pass
+        return line, timed_out, _kill_reason(watchdog, process.returncode)
+
+    def convert(self, hwpx_path, pdf_path, timeout):
+        started = time.monotonic()
+        stderr_lines = self.stderr_lines
+        pid = self.process.pid
+        if JOB_MAX_CPU_SECONDS:
+            _set_cpu_budget(pid, JOB_MAX_CPU_SECONDS)
+        try:
+            line, timed_out, killed = _supervise(self._request(f'{hwpx_path}\t{pdf_path}\n', timeout))
+        except (OSError, RuntimeError) as e:
+            # A closed pipe, or a transport already torn down after the JVM exited
+            raise HwpxWorkerUnavailable(f'JVM not accepting jobs: {e}')
+        finally:
+            if JOB_MAX_CPU_SECONDS and self.is_alive():
+                _clear_cpu_budget(pid)
+
+        # The resident JVM's stderr since the job was sent, as far as the tail reaches
+        new_lines = min(self.stderr_lines - stderr_lines, len(self.stderr_tail))
+        _record_process(['java', '-jar', JAR_PATH, '--serve'], line or 'exited', time.monotonic() - started,
+                        ''.join(list(self.stderr_tail)[len(self.stderr_tail) - new_lines:]))
+        if timed_out:
+            raise subprocess.TimeoutExpired(['java', '-jar', JAR_PATH, '--serve'], timeout)
+        if killed:
+            raise HwpxResourceLimitExceeded(killed, ''.join(self.stderr_tail)[-500:])
+        if not line:
+            raise HwpxWorkerUnavailable('JVM exited: ' + ''.join(self.stderr_tail)[-500:])
+
+        self.jobs += 1
+        if line.startswith('ERR'):
+            raise HwpxConversionError('HWPX conversion failed', line[4:])
+
+
+class HwpxWorkerPool:
+    """Warm JVMs handed out one job at a time
+
+    A JVM is restarted off the request path after max_jobs conversions, once
+    its resident memory passes recycle_rss or its total CPU time passes
+    recycle_cpu_seconds, and right after it was killed for a job limit.
+    """
+
+    def __init__(self, size, max_jobs, recycle_rss=0, recycle_cpu_seconds=0):
+        self.size = size
+        self.max_jobs = max_jobs
+        self.recycle_rss = recycle_rss
+        self.recycle_cpu_seconds = recycle_cpu_seconds
+        self.recycles = 0
+        self.fallbacks = 0
+        self.workers = [HwpxWorker(i) for i in range(size)]
+        self._idle = queue.Queue()
+        for worker in self.workers:
+            self._idle.put(worker)
+
+    def start(self):
+        for worker in self.workers:
+            try:
+                worker.start()
+            except HwpxWorkerUnavailable as e:
+                # Retried on first use
+                app.logger.error(f"HWPX worker {worker.index} failed to start: {e}")
+
+    def convert(self, hwpx_path, pdf_path, timeout):
+        if self.size == 0:
+            raise HwpxWorkerUnavailable('Resident workers disabled')
+
+        waiting_since = time.monotonic()
+        try:
+            with _phase('acquire'):
+                worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise subprocess.TimeoutExpired(['java', '-jar', JAR_PATH, '--serve'], timeout)
+        QUEUE_WAIT.labels(**HWPX_LABELS).observe(time.monotonic() - waiting_since)
+
+        try:
+            if not worker.is_alive():
+                with _phase('start'):
+                    worker.stop()
+                    worker.start()
+            with _phase('convert'):
+                worker.convert(hwpx_path, pdf_path, timeout)
+        except (HwpxWorkerUnavailable, subprocess.TimeoutExpired):
+            worker.stop()
+            self._idle.put(worker)
+            raise
+        except HwpxResourceLimitExceeded as e:
+            self._start_recycle(worker, e.reason)
+            raise
+        except HwpxConversionError:
+            self._release(worker)
+            raise
+        self._release(worker)
+
+    def _recycle_reason(self, worker):
+        if worker.jobs >= self.max_jobs:
+            return 'jobs'
+        cpu, rss = worker.usage()
+        if self.recycle_rss and rss > self.recycle_rss:
+            return 'rss'
+        if self.recycle_cpu_seconds and cpu > self.recycle_cpu_seconds:
+            return 'cpu'
+        return None
+
+    def _release(self, worker):
+        reason = self._recycle_reason(worker)
+        if reason is None:
+            self._idle.put(worker)
+            return
+        self._start_recycle(worker, reason)
+
+    def _start_recycle(self, worker, reason):
+        # Restart off the request path; the worker rejoins the pool when warm
+        self.recycles += 1
+        WORKER_RECYCLES.labels(engine='java', reason=reason).inc()
+        threading.Thread(target=self._recycle, args=(worker, reason), daemon=True).start()
+
+    def _recycle(self, worker, reason):
+        app.logger.info(f"Recycling HWPX worker {worker.index} ({reason})")
+        worker.stop()
+        try:
+            worker.start()
+        except HwpxWorkerUnavailable as e:
+            app.logger.error(f"HWPX worker {worker.index} failed to restart: {e}")
+        finally:
+            self._idle.put(worker)
+
+    def stats(self):
+        return {
+            'size': self.size,
+            'idle': self._idle.qsize(),
+            'alive': sum(1 for worker in self.workers if worker.is_alive()),
+            'recycles': self.recycles,
+            'fallbacks': self.fallbacks,
+        }
+
+
+hwpx_flights = SingleFlight()
+hwpx_workers = HwpxWorkerPool(HWPX_WORKERS, HWPX_WORKER_MAX_JOBS, HWPX_RECYCLE_RSS, HWPX_RECYCLE_CPU_SECONDS)
+
 # Existing HWP conversion route
 @app.route('/convert', methods=['POST'])
 def convert_hwp():
@@ -22,8 +846,11 @@ def convert_hwp():
 
 # New HWPX conversion route using Java
 @app.route('/convert_hwpx', methods=['POST'])
+@_timed
 def convert_hwpx():
     """Convert HWPX files to PDF using Java hwpxlib"""
+    with _phase('upload'):
+        request.files  # Reading the multipart body happens here
     if 'file' not in request.files:
         return jsonify({'error': 'No file provided'}), 400
 
@@ -35,66 +862,209 @@ def convert_hwpx():
     if not file.filename.lower().endswith('.hwpx'):
         return jsonify({'error': 'Only HWPX files are supported'}), 400
 
+    hwpx_filename = secure_filename(file.filename)
+    pdf_filename = os.path.splitext(hwpx_filename)[0] + '.pdf'
+
+    # Create temporary directory; it lives until the PDF has been sent
+    work_dir = tempfile.mkdtemp(prefix='hwpx-job-')
     try:
-        # Create temporary directory
-        with tempfile.TemporaryDirectory() as work_dir:
-            # Save uploaded HWPX file
-            hwpx_filename = secure_filename(file.filename)
-            hwpx_path = os.path.join(work_dir, hwpx_filename)
-            file.save(hwpx_path)
-
-            # Output PDF path
-            pdf_filename = os.path.splitext(hwpx_filename)[0] + '.pdf'
-            pdf_path = os.path.join(work_dir, pdf_filename)
-
-            # Run Java converter
-            jar_path = '/app/hwpx-converter-1.0.0.jar'  # Docker container path
-            result = subprocess.run(
-                ['java', '-jar', jar_path, hwpx_path, pdf_path],
-                capture_output=True,
-                text=True,
-                timeout=180,
-                env={'HOME': work_dir}
-            )
-
-            if result.returncode != 0:
-                app.logger.error(f"Java conversion failed: {result.stderr}")
-                return jsonify({
-                    'error': 'HWPX conversion failed',
-                    'details': result.stderr
-                }), 500
-
-            if not os.path.exists(pdf_path):
-                return jsonify({'error': 'PDF file not generated'}), 500
-
-            app.logger.info(f"Successfully converted {hwpx_filename} to PDF")
-
-            # Send PDF file
-            return send_file(
-                pdf_path,
-                mimetype='application/pdf',
-                as_attachment=True,
-                download_name=pdf_filename
-            )
+        response = make_response(_convert_upload(file, hwpx_filename, pdf_filename, work_dir))
+    except BaseException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    response.response = ClosingIterator(response.response,
+                                        functools.partial(shutil.rmtree, work_dir, ignore_errors=True))
+    return response
+
+
+def _save_stream(stream, path):
+    """Copy a readable stream to path in chunks and return the SHA-256 of its bytes"""
+    digest = hashlib.sha256()
+    with open(path, 'wb') as out:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest()
+
+
+def _share_pdf(pdf_path, work_dir):
+    """A waiting request's own copy of the PDF its leader wrote: a hard link, or a copy across filesystems"""
+    own_path = os.path.join(work_dir, os.path.basename(pdf_path))
+    try:
+        os.link(pdf_path, own_path)
+    except OSError:
+        shutil.copyfile(pdf_path, own_path)
+    return own_path
+
+
+def _convert_upload(file, hwpx_filename, pdf_filename, work_dir):
+    # Save uploaded HWPX file, hashing it on the way
+    hwpx_path = os.path.join(work_dir, hwpx_filename)
+    with _phase('save'):
+        content_hash = _save_stream(file.stream, hwpx_path)
+    _timing.current.fields.update(format='hwpx', input_bytes=os.path.getsize(hwpx_path), sha256=content_hash)
+
+    try:
+        # Identical uploads already being converted wait for that JVM run
+        pdf_path, _ = hwpx_flights.do(content_hash, lambda: _convert_hwpx_file(hwpx_path, work_dir),
+                                      share=lambda path: _share_pdf(path, work_dir))
+        app.logger.info(f"Successfully converted {hwpx_filename} to PDF")
+
+        # Send PDF file
+        return send_file(
+            pdf_path,
+            mimetype='application/pdf',
+            as_attachment=True,
+            download_name=pdf_filename
+        )
 
     except subprocess.TimeoutExpired:
         app.logger.error("HWPX conversion timeout")
-        return jsonify({'error': 'Conversion timeout (>180s)'}), 504
+        return jsonify({'error': f'Conversion timeout (>{HWPX_TIMEOUT}s)'}), 504
+
+    except HwpxConversionError as e:
+        return jsonify({'error': str(e), 'details': e.details}), 500
 
     except Exception as e:
         app.logger.error(f"HWPX conversion error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 
+def _convert_hwpx_file(hwpx_path, work_dir):
+    """Run the Java converter on one saved HWPX upload and return the PDF's path in work_dir"""
+    # Output PDF path
+    pdf_path = os.path.splitext(hwpx_path)[0] + '.pdf'
+
+    INPUT_BYTES.labels(**HWPX_LABELS).observe(os.path.getsize(hwpx_path))
+    IN_FLIGHT.labels(engine='java').inc()
+    started = time.monotonic()
+    try:
+        # Run Java converter on a warm JVM, or a fresh one if none is usable
+        try:
+            hwpx_workers.convert(hwpx_path, pdf_path, HWPX_TIMEOUT)
+        except HwpxWorkerUnavailable as e:
+            app.logger.warning(f"HWPX workers unavailable ({e}), using one-shot converter")
+            hwpx_workers.fallbacks += 1
+            _convert_hwpx_oneshot(hwpx_path, pdf_path, work_dir)
+    except subprocess.TimeoutExpired:
+        CONVERSION_ERRORS.labels(reason='timeout', **HWPX_LABELS).inc()
+        WORKER_KILLS.labels(engine='java', reason='timeout').inc()
+        raise
+    except HwpxResourceLimitExceeded as e:
+        CONVERSION_ERRORS.labels(reason=e.reason, **HWPX_LABELS).inc()
+        WORKER_KILLS.labels(engine='java', reason=e.reason).inc()
+        raise
+    except HwpxConversionError:
+        CONVERSION_ERRORS.labels(reason='nonzero_exit', **HWPX_LABELS).inc()
+        raise
+    finally:
+        IN_FLIGHT.labels(engine='java').dec()
+        CONVERSION_DURATION.labels(**HWPX_LABELS).observe(time.monotonic() - started)
+
+    if not os.path.exists(pdf_path):
+        CONVERSION_ERRORS.labels(reason='missing_output', **HWPX_LABELS).inc()
+        raise HwpxConversionError('PDF file not generated')
+
+    OUTPUT_BYTES.labels(**HWPX_LABELS).observe(os.path.getsize(pdf_path))
+    return pdf_path
+
+
+async def _run_jvm(args, timeout, env):
+    """subprocess.run(capture_output=True, text=True) on the supervisor loop, under the JOB_* limits
+
+    Returns (CompletedProcess, kill reason or None).
+    """
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=env,
+        preexec_fn=_cpu_rlimit(JOB_MAX_CPU_SECONDS)
+    )
+    watchdog = _JvmWatchdog(process, JOB_STALL_SECONDS, JOB_MAX_RSS)
+    watching = watchdog.start()
+    output = asyncio.gather(process.stdout.read(), process.stderr.read(), process.wait())
+    try:
+        stdout, stderr, returncode = await asyncio.wait_for(asyncio.shield(output), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await output
+        raise subprocess.TimeoutExpired(args, timeout)
+    finally:
+        if watching is not None:
+            watching.cancel()
+    result = subprocess.CompletedProcess(args, returncode, stdout.decode('utf-8', errors='replace'),
+                                         stderr.decode('utf-8', errors='replace'))
+    return result, _kill_reason(watchdog, returncode)
+
+
+def _convert_hwpx_oneshot(hwpx_path, pdf_path, work_dir):
+    """Start a JVM just for this file"""
+    args = ['java', *JAVA_HEAP_ARGS, '-jar', JAR_PATH, hwpx_path, pdf_path]
+    started = time.monotonic()
+    with _phase('jvm'):
+        try:
+            result, killed = _supervise(_run_jvm(args, HWPX_TIMEOUT, {'HOME': work_dir}))
+        except subprocess.TimeoutExpired:
+            _record_process(args, 'timeout', time.monotonic() - started, '')
+            raise
+    _record_process(args, result.returncode, time.monotonic() - started, result.stderr)
+
+    if killed:
+        raise HwpxResourceLimitExceeded(killed, result.stderr)
+    if result.returncode != 0:
+        app.logger.error(f"Java conversion failed: {result.stderr}")
+        raise HwpxConversionError('HWPX conversion failed', result.stderr)
+
+
 # Health check endpoint
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
     return jsonify({
         'status': 'ok',
-        'converters': ['hwp', 'hwpx']
+        'converters': ['hwp', 'hwpx'],
+        'coalescing': {'hwpx': hwpx_flights.stats()},
+        'hwpx_workers': hwpx_workers.stats()
     })
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics endpoint"""
+    return Response(registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+def serve():
+    """Run on uvicorn: idle and queued connections live on the event loop, bodies are streamed"""
+    def terminated_input(environ, start_response):
+        # a2wsgi's wsgi.input ends by itself; lets Werkzeug read chunked uploads
+        environ['wsgi.input_terminated'] = True
+        return app(environ, start_response)
+
+    uvicorn.run(
+        WSGIMiddleware(terminated_input, workers=SERVER_THREADS),
+        host=SERVER_HOST,
+        port=SERVER_PORT,
+        backlog=SERVER_BACKLOG,
+        timeout_keep_alive=SERVER_KEEP_ALIVE,
+        interface='asgi3',
+        lifespan='off',
+    )
+
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    # INFO for the timing lines and worker lifecycle; set before app.logger is first used
+    logging.basicConfig(level=logging.INFO)
+    hwpx_workers.start()
+    if PROFILE_THRESHOLD > 0:
+        threading.Thread(target=_sample_slow_requests, name='profiler', daemon=True).start()
+    if uvicorn is not None:
+        serve()
+    else:
+        app.logger.warning('uvicorn/a2wsgi not installed; using the Flask development server')
+        app.run(host=SERVER_HOST, port=SERVER_PORT, debug=False)
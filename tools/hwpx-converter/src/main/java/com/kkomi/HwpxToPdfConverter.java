@@ -10,17 +10,30 @@ import org.apache.pdfbox.pdmodel.PDPageContentStream;
 import org.apache.pdfbox.pdmodel.common.PDRectangle;
 import org.apache.pdfbox.pdmodel.font.PDType0Font;
 import org.apache.pdfbox.pdmodel.font.PDType1Font;
+import org.apache.fontbox.ttf.TTFParser;
+import org.apache.fontbox.ttf.TrueTypeFont;
 import org.slf4j.Logger;
 import org.slf4j.LoggerFactory;
 
+import java.io.BufferedReader;
 import java.io.File;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
 import java.io.IOException;
+import java.io.InputStream;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.nio.charset.StandardCharsets;
 
 /**
  * HWPX to PDF Converter
  *
  * Converts HWPX files to PDF using hwpxlib for text extraction
  * and Apache PDFBox for PDF generation.
+ *
+ * Run with {@code --serve} to keep the JVM resident: each stdin line
+ * {@code <input.hwpx>\t<output.pdf>} is answered on stdout with
+ * {@code OK} or {@code ERR <message>}, after an initial {@code READY}.
  */
 public class HwpxToPdfConverter {
     private static final Logger logger = LoggerFactory.getLogger(HwpxToPdfConverter.class);
@@ -31,9 +44,23 @@ public class HwpxToPdfConverter {
     private static final float LINE_HEIGHT = FONT_SIZE * 1.5f;
     private static final int MAX_CHARS_PER_LINE = 80;
 
+    // Parsed once per JVM and shared by every document (embedded as a subset)
+    private static TrueTypeFont koreanTtf;
+
     public static void main(String[] args) {
+        if (args.length == 1 && "--serve".equals(args[0])) {
+            try {
+                serve();
+            } catch (IOException e) {
+                logger.error("Converter service stopped", e);
+                System.exit(1);
+            }
+            return;
+        }
+
         if (args.length < 2) {
             System.err.println("Usage: java -jar hwpx-converter.jar <input.hwpx> <output.pdf>");
+            System.err.println("       java -jar hwpx-converter.jar --serve");
             System.exit(1);
         }
 
@@ -52,6 +79,60 @@ public class HwpxToPdfConverter {
         }
     }
 
+    /**
+     * Serves conversion requests over stdin/stdout until stdin closes
+     *
+     * @throws IOException If stdin cannot be read
+     */
+    private static void serve() throws IOException {
+        PrintStream protocol = new PrintStream(new FileOutputStream(FileDescriptor.out), true, "UTF-8");
+        // Keep stray prints off the protocol channel
+        System.setOut(System.err);
+
+        try {
+            getKoreanFont();
+        } catch (IOException e) {
+            logger.warn("Korean font preload failed, documents will fall back to Helvetica", e);
+        }
+        protocol.println("READY");
+
+        BufferedReader requests = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        String line;
+        while ((line = requests.readLine()) != null) {
+            String[] paths = line.split("\t", 2);
+            if (paths.length < 2) {
+                protocol.println("ERR Malformed request");
+                continue;
+            }
+
+            try {
+                convertHwpxToPdf(paths[0], paths[1]);
+                protocol.println("OK");
+            } catch (Exception e) {
+                logger.error("Failed to convert {} to PDF", paths[0], e);
+                protocol.println("ERR " + String.valueOf(e.getMessage()).replace('\n', ' '));
+            }
+        }
+    }
+
+    /**
+     * Returns the bundled Noto Sans KR font, parsing it on first use
+     *
+     * @return Parsed TrueType font
+     * @throws IOException If the font resource is missing or invalid
+     */
+    private static synchronized TrueTypeFont getKoreanFont() throws IOException {
+        if (koreanTtf == null) {
+            try (InputStream fontStream = HwpxToPdfConverter.class.getResourceAsStream("/NotoSansKR.ttf")) {
+                if (fontStream == null) {
+                    throw new IOException("Korean font resource not found");
+                }
+                koreanTtf = new TTFParser().parse(fontStream);
+            }
+        }
+        return koreanTtf;
+    }
+
     /**
      * Converts HWPX file to PDF
      *
@@ -125,11 +206,7 @@ public class HwpxToPdfConverter {
             // Load Korean font (Noto Sans KR)
             PDType0Font koreanFont;
             try {
-                java.io.InputStream fontStream = HwpxToPdfConverter.class.getResourceAsStream("/NotoSansKR.ttf");
-                if (fontStream == null) {
-                    throw new IOException("Korean font resource not found");
-                }
-                koreanFont = PDType0Font.load(document, fontStream);
+                koreanFont = PDType0Font.load(document, getKoreanFont(), true);
                 logger.info("Loaded Korean font: Noto Sans KR");
             } catch (Exception e) {
                 logger.warn("Failed to load Korean font, falling back to Helvetica", e);